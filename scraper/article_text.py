@@ -0,0 +1,245 @@
+"""
+Clean article text from paper pages
+
+Removes page chrome (scripts, navigation, sidebars, cookie banners, share
+widgets, reference lists, ...) and walks the article body block by block, so
+the text sent to Gemini and embedded is the paper itself. Headings are kept on
+their own lines and reported as section boundaries (character offsets into
+the clean text).
+
+Like paper_parser, this module holds no API or event-loop state and can run
+in parse worker processes.
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+from bs4 import NavigableString, Tag
+from bs4.element import Comment
+
+# Elements that never carry article text
+BOILERPLATE_TAGS = [
+    "script",
+    "style",
+    "noscript",
+    "template",
+    "nav",
+    "header",
+    "footer",
+    "aside",
+    "form",
+    "button",
+    "select",
+    "input",
+    "label",
+    "svg",
+    "iframe",
+    "dialog",
+    "menu",
+]
+
+# class/id words marking page chrome (matched as whole words, so e.g.
+# "research-article" does not match "search")
+BOILERPLATE_WORDS = {
+    "nav",
+    "navbar",
+    "navigation",
+    "menu",
+    "sidebar",
+    "breadcrumb",
+    "breadcrumbs",
+    "cookie",
+    "cookies",
+    "consent",
+    "banner",
+    "masthead",
+    "share",
+    "social",
+    "advert",
+    "advertisement",
+    "ad",
+    "ads",
+    "promo",
+    "skip",
+    "toolbar",
+    "modal",
+    "popup",
+    "footer",
+    "search",
+    "login",
+    "subscribe",
+    "alert",
+    "alerts",
+    "related",
+    "recommended",
+    "references",
+    "bibliography",
+    "pagination",
+}
+
+# Reference lists are named like "ref-list" (PMC) or "reflist"
+BOILERPLATE_NAMES = ("ref-list", "reflist")
+
+BOILERPLATE_ROLES = {
+    "navigation",
+    "banner",
+    "contentinfo",
+    "complementary",
+    "search",
+    "dialog",
+    "menu",
+}
+
+# Candidate article containers, tried before falling back to <body>
+ARTICLE_SELECTORS = [
+    "article",
+    "main",
+    '[role="main"]',
+    "#main-content",
+    "#maincontent",
+    ".article",
+    ".main-content",
+]
+
+# Leaf blocks whose text is emitted as one line
+TEXT_BLOCKS = {
+    "p",
+    "li",
+    "dt",
+    "dd",
+    "blockquote",
+    "pre",
+    "figcaption",
+    "caption",
+    "summary",
+}
+
+HEADINGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+
+# An article container must hold at least this share of the page text
+_MIN_ROOT_SHARE = 0.25
+
+_WORDS = re.compile(r"[a-z]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _text(node: Tag) -> str:
+    return _WHITESPACE.sub(" ", node.get_text(" ")).strip()
+
+
+def _is_boilerplate(tag: Tag) -> bool:
+    if tag.get("role") in BOILERPLATE_ROLES or tag.get("aria-hidden") == "true":
+        return True
+    names = (" ".join(tag.get("class") or ()) + " " + (tag.get("id") or "")).lower()
+    if any(name in names for name in BOILERPLATE_NAMES):
+        return True
+    return any(word in BOILERPLATE_WORDS for word in _WORDS.findall(names))
+
+
+def _remove_boilerplate(root: Tag) -> None:
+    for tag in root(BOILERPLATE_TAGS):
+        tag.decompose()
+    for comment in root.find_all(string=lambda s: isinstance(s, Comment)):
+        comment.extract()
+    # Collect first: decomposing while iterating skips elements
+    for tag in [
+        tag for tag in root.find_all(True) if tag.attrs and _is_boilerplate(tag)
+    ]:
+        if not tag.decomposed:
+            tag.decompose()
+
+
+def _article_root(soup: Tag) -> Tag:
+    """The element holding the article, or the whole body"""
+    body = soup.body or soup
+    total = len(_text(body))
+    best: Optional[Tag] = None
+    best_length = 0
+    for selector in ARTICLE_SELECTORS:
+        for candidate in body.select(selector):
+            length = len(_text(candidate))
+            if length > best_length:
+                best, best_length = candidate, length
+    if best is not None and best_length >= _MIN_ROOT_SHARE * total:
+        return best
+    return body
+
+
+class _Writer:
+    """Accumulates text lines and the offsets of each headed section"""
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.length = 0
+        self.sections: List[Dict] = []
+        self.last_line = ""
+
+    def _append(self, text: str) -> None:
+        if self.parts:
+            self.parts.append("\n")
+            self.length += 1
+        self.parts.append(text)
+        self.length += len(text)
+        self.last_line = text
+
+    def line(self, text: str) -> None:
+        # Skip empty lines and repeats (e.g. a caption shown twice)
+        if text and text != self.last_line:
+            self._append(text)
+
+    def heading(self, text: str, level: int) -> None:
+        if not text:
+            return
+        self._close_section()
+        if self.parts:
+            # Blank line before each heading
+            self.parts.append("\n")
+            self.length += 1
+        self._append(text)
+        self.sections.append(
+            {"heading": text, "level": level, "start": self.length - len(text)}
+        )
+
+    def _close_section(self) -> None:
+        if self.sections and "end" not in self.sections[-1]:
+            self.sections[-1]["end"] = self.length
+
+    def result(self) -> Tuple[str, List[Dict]]:
+        self._close_section()
+        return "".join(self.parts), self.sections
+
+
+def _walk(node: Tag, writer: _Writer) -> None:
+    for child in node.children:
+        if isinstance(child, Tag):
+            if child.name in HEADINGS:
+                writer.heading(_text(child), int(child.name[1]))
+            elif child.name in TEXT_BLOCKS:
+                writer.line(_text(child))
+            elif child.name == "tr":
+                cells = [_text(cell) for cell in child.find_all(["td", "th"])]
+                writer.line(" | ".join(cell for cell in cells if cell))
+            elif child.name == "br":
+                continue
+            else:
+                _walk(child, writer)
+        elif isinstance(child, NavigableString):
+            # Loose text directly inside a container (e.g. <div>text</div>)
+            writer.line(_WHITESPACE.sub(" ", str(child)).strip())
+
+
+def extract_article_text(soup: Tag) -> Tuple[str, List[Dict]]:
+    """
+    Clean article text of a parsed page and its section boundaries
+
+    The soup is modified (boilerplate elements are removed), so call this
+    after all other fields were extracted.
+
+    Returns:
+        (text, sections) where every section is a dict with heading, level
+        and [start, end) character offsets of the heading and its body
+    """
+    _remove_boilerplate(soup)
+    writer = _Writer()
+    _walk(_article_root(soup), writer)
+    return writer.result()
@@ -0,0 +1,2 @@
+"""Offline benchmarks for the scraper. Run from the scraper directory, e.g.
+``python -m benchmarks.bench_http_client``"""
@@ -0,0 +1,66 @@
+"""
+Benchmark: pooled PaperExtractor HTTP client vs. a new httpx.AsyncClient per request
+
+Usage:
+    python -m benchmarks.bench_http_client [--requests 200] [--concurrency 1]
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.standin_server import StandInServer
+from extraction import PaperExtractor
+
+
+async def fetch_with_new_client(link: str) -> str:
+    """Previous behaviour: one client (and one connection) per request"""
+    async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
+        response = await client.get(link)
+        response.raise_for_status()
+        return response.text
+
+
+async def run(fetch, links, concurrency: int) -> float:
+    """Fetch all links with the given concurrency, return mean seconds per request"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(link):
+        async with semaphore:
+            await fetch(link)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(link) for link in links))
+    return (time.perf_counter() - start) / len(links)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    with StandInServer() as server:
+        links = [f"{server.base_url}/PMC{i}" for i in range(args.requests)]
+
+        extractor = PaperExtractor("benchmark-key")
+        try:
+            # Warm up both paths once
+            await fetch_with_new_client(links[0])
+            await extractor.fetch_paper_content(links[0])
+
+            unpooled = await run(fetch_with_new_client, links, args.concurrency)
+            pooled = await run(extractor.fetch_paper_content, links, args.concurrency)
+        finally:
+            await extractor.close()
+
+    print(f"requests={args.requests} concurrency={args.concurrency}")
+    print(f"new client per request: {unpooled * 1000:8.2f} ms/request")
+    print(f"pooled client:          {pooled * 1000:8.2f} ms/request")
+    print(f"speedup:                {unpooled / pooled:8.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
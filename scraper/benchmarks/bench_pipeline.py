@@ -0,0 +1,235 @@
+"""
+Benchmark: end-to-end main.py runs against local stand-in services
+
+Every run writes N papers to a CSV pointing at a StandInServer (with optional
+latency and errors) and runs main.main() in a scratch directory, with Gemini
+replaced by FakeGemini, which enforces its own RPM/TPM quotas and answers
+requests over them with 429s. The client rate limiter is configured with the
+fake quotas times --quota-margin; a margin above 1 makes the client overrun
+the quota, to exercise the 429 handling and retry path.
+
+Reports papers/sec, per-stage latency and rate limiter waits (from the run
+metrics) and the quota utilization of both fake models.
+
+Usage:
+    python -m benchmarks.bench_pipeline [--papers 50 200] [--fetch-latency 0.05]
+        [--error-rate 0.02] [--gen-rpm 600] [--quota-margin 1.0] [--json out.json]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict
+
+import main as pipeline_main
+from benchmarks.fake_gemini import (
+    EMBEDDING_MODEL,
+    GENERATION_MODEL,
+    FakeGemini,
+    ModelQuota,
+)
+from benchmarks.standin_server import StandInServer
+from metrics import get_metrics
+
+# Settings of every run; the caches are disabled so each run does all the work
+BENCHMARK_ENV = {
+    "GEMINI_API_KEY": "benchmark-key",
+    "CONVEX_URL": "",
+    "STORAGE_BACKEND": "sqlite",
+    "EMBEDDING_CACHE_PATH": "",
+    "LLM_CACHE_PATH": "",
+    "HTTP_CACHE_DIR": "",
+    "QUOTA_USAGE_PATH": "",
+    "SKIP_EXISTING": "false",
+    "METRICS_PORT": "0",
+    "METRICS_SNAPSHOT_PATH": "",
+}
+
+
+def write_papers(path: str, base_url: str, papers: int) -> None:
+    with open(path, "w") as f:
+        f.write("Title,Link\n")
+        for i in range(papers):
+            f.write(f"Benchmark paper {i},{base_url}/pmc/articles/PMC{1000000 + i}/\n")
+
+
+def rate_limits(args) -> str:
+    """RATE_LIMITS of the client: the fake quotas times the margin"""
+    return ",".join(
+        f"{model}={max(1, int(rpm * args.quota_margin))}/"
+        f"{max(1, int(tpm * args.quota_margin))}/0"
+        for model, rpm, tpm in (
+            (GENERATION_MODEL, args.gen_rpm, args.gen_tpm),
+            (EMBEDDING_MODEL, args.embed_rpm, args.embed_tpm),
+        )
+    )
+
+
+def stage_report(snapshot: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """Latency of the pipeline stages, limiter waits, Gemini calls and writes"""
+    report = {}
+    metrics = snapshot["metrics"]
+    for name, label, prefix in (
+        ("pipeline_stage_seconds", "stage", "stage"),
+        ("rate_limiter_wait_seconds", "model", "limiter wait"),
+        ("gemini_request_seconds", "model", "gemini"),
+        ("storage_write_seconds", "op", "storage"),
+    ):
+        for entry in metrics.get(name, []):
+            if not entry["count"]:
+                continue
+            key = f"{prefix}:{entry['labels'].get(label, '')}"
+            report[key] = {
+                "count": entry["count"],
+                "mean": round(entry["sum"] / entry["count"], 4),
+                "p50": entry["p50"],
+                "p95": entry["p95"],
+                "max": entry["max"],
+                "total": round(entry["sum"], 3),
+            }
+    return report
+
+
+def counter_total(snapshot: Dict[str, Any], name: str, **labels) -> float:
+    return sum(
+        entry["value"]
+        for entry in snapshot["metrics"].get(name, [])
+        if all(entry["labels"].get(key) == value for key, value in labels.items())
+    )
+
+
+async def run_once(args, papers: int) -> Dict[str, Any]:
+    """One main.py run over the given number of papers, in a scratch directory"""
+    workdir = tempfile.mkdtemp(prefix="umbra-bench-")
+    cwd = os.getcwd()
+    saved_env = {name: os.environ.get(name) for name in BENCHMARK_ENV}
+    saved_env.update(
+        {name: os.environ.get(name) for name in ("INPUT_CSV_PATH", "RATE_LIMITS")}
+    )
+    fake = FakeGemini(
+        generation=ModelQuota(args.gen_rpm, args.gen_tpm, args.gen_latency),
+        embedding=ModelQuota(args.embed_rpm, args.embed_tpm, args.embed_latency),
+        malformed_rate=args.malformed_rate,
+    )
+    server = StandInServer(
+        latency=args.fetch_latency,
+        jitter=args.fetch_jitter,
+        error_rate=args.error_rate,
+        pages_dir=args.pages_dir,
+    )
+    try:
+        os.chdir(workdir)
+        os.environ.update(BENCHMARK_ENV)
+        os.environ["INPUT_CSV_PATH"] = os.path.join(workdir, "papers.csv")
+        os.environ["RATE_LIMITS"] = rate_limits(args)
+        get_metrics().reset()
+
+        with server, fake.installed():
+            write_papers(os.environ["INPUT_CSV_PATH"], server.base_url, papers)
+            start = time.perf_counter()
+            await pipeline_main.main()
+            seconds = time.perf_counter() - start
+        snapshot = get_metrics().snapshot()
+    finally:
+        os.chdir(cwd)
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        if args.keep:
+            print(f"Run directory: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    processed = counter_total(snapshot, "pipeline_papers_total", outcome="processed")
+    return {
+        "papers": papers,
+        "seconds": round(seconds, 3),
+        "processed": int(processed),
+        "failed": int(
+            counter_total(snapshot, "pipeline_papers_total", outcome="failed")
+        ),
+        "papers_per_second": round(processed / seconds, 3),
+        "server": dict(server.stats),
+        "stages": stage_report(snapshot),
+        "quota": fake.utilization(seconds),
+    }
+
+
+def print_result(result: Dict[str, Any]) -> None:
+    print(
+        f"\npapers={result['papers']}  processed={result['processed']}  "
+        f"failed={result['failed']}  {result['seconds']:.2f}s  "
+        f"{result['papers_per_second']:.2f} papers/s  "
+        f"(server: {result['server']['pages']} pages, "
+        f"{result['server']['errors']} errors)"
+    )
+    print(
+        f"{'latency (s)':<32} {'count':>6} {'mean':>8} {'p50':>8} "
+        f"{'p95':>8} {'max':>8} {'total':>9}"
+    )
+    for name, row in result["stages"].items():
+        print(
+            f"{name:<32} {row['count']:>6} {row['mean']:>8.3f} {row['p50']:>8.3f} "
+            f"{row['p95']:>8.3f} {row['max']:>8.3f} {row['total']:>9.2f}"
+        )
+    for model, usage in result["quota"].items():
+        print(
+            f"{model:<20} requests={usage['requests']} tokens={usage['tokens']} "
+            f"429s={usage['rejected_429']} mean_rpm={usage['mean_rpm']} "
+            f"mean_tpm={usage['mean_tpm']} peak={usage['peak_rpm_share']:.0%} of RPM, "
+            f"{usage['peak_tpm_share']:.0%} of TPM"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--papers", type=int, nargs="+", default=[50])
+    parser.add_argument("--fetch-latency", type=float, default=0.05)
+    parser.add_argument("--fetch-jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--pages-dir",
+        default="",
+        help="recorded article pages to serve (pages sharing a DOI are stored once)",
+    )
+    parser.add_argument("--gen-rpm", type=int, default=600)
+    parser.add_argument("--gen-tpm", type=int, default=4_000_000)
+    parser.add_argument("--gen-latency", type=float, default=0.2)
+    parser.add_argument("--embed-rpm", type=int, default=1500)
+    parser.add_argument("--embed-tpm", type=int, default=1_000_000)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--quota-margin", type=float, default=1.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--json", default="", help="write the results to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the run directories")
+    args = parser.parse_args()
+
+    # Configured before main.main() so its log stays out of the report
+    log_path = os.path.abspath("bench_pipeline.log")
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[logging.FileHandler(log_path)],
+    )
+
+    results = []
+    for papers in args.papers:
+        result = await run_once(args, papers)
+        print_result(result)
+        results.append(result)
+    print(f"\nRun logs: {log_path}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+"""
+Benchmark: recall and latency of exact vs. IVF similarity search
+
+Vectors are drawn around random topic centers (like section embeddings of
+papers on related subjects) and stored in a temporary VectorStore. Queries
+are new samples from the same distribution; exact results are the ground truth
+for recall@k.
+
+Usage:
+    python -m benchmarks.bench_search [--vectors 100000] [--queries 200] [--k 10]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from search import VectorSearch
+from vector_store import VectorStore
+
+LATENT_DIMENSIONS = 32
+
+SECTIONS = ["title", "abstract", "methods", "results", "discussion", "conclusions"]
+
+
+def sample_vectors(n: int, centers: np.ndarray, basis: np.ndarray, rng) -> np.ndarray:
+    """Topic mixture in a low-dimensional latent space, projected to full size"""
+    latent = centers[rng.integers(0, len(centers), n)]
+    latent = latent + rng.standard_normal(latent.shape)
+    noise = 0.05 * rng.standard_normal((n, basis.shape[1]))
+    return (latent @ basis + noise).astype(np.float32)
+
+
+def fill_store(store: VectorStore, vectors: int, topics: int, rng):
+    """
+    Append clustered vectors to the store; returns (centers, basis)
+
+    Like real embeddings, the vectors have a much lower intrinsic dimension
+    than the stored one, and topics overlap.
+    """
+    centers = rng.standard_normal((topics, LATENT_DIMENSIONS))
+    basis = rng.standard_normal((LATENT_DIMENSIONS, store.dimensions))
+    basis /= np.sqrt(LATENT_DIMENSIONS)
+    for start in range(0, vectors, 10000):
+        n = min(10000, vectors - start)
+        store.append(
+            [f"e{start + i}" for i in range(n)],
+            [f"p{(start + i) // len(SECTIONS)}" for i in range(n)],
+            [SECTIONS[(start + i) % len(SECTIONS)] for i in range(n)],
+            sample_vectors(n, centers, basis, rng),
+        )
+    return centers, basis
+
+
+def percentile_ms(samples, q: float) -> float:
+    return float(np.percentile(samples, q)) * 1000
+
+
+def timed(search, queries, **kwargs):
+    """Run one query at a time; returns (results, per-query latencies)"""
+    results, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(search.search(query, **kwargs))
+        latencies.append(time.perf_counter() - started)
+    return results, latencies
+
+
+def recall(truth, results) -> float:
+    hits = total = 0
+    for expected, found in zip(truth, results):
+        expected_ids = {r["embeddingId"] for r in expected}
+        hits += len(expected_ids & {r["embeddingId"] for r in found})
+        total += len(expected_ids)
+    return hits / total if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--section", default=None)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = VectorStore(os.path.join(tmp, "vectors"))
+        centers, basis = fill_store(store, args.vectors, args.topics, rng)
+        queries = sample_vectors(args.queries, centers, basis, rng)
+
+        search = VectorSearch(store)
+        search.search(queries[0], k=args.k)  # warm up norms and filters
+
+        started = time.perf_counter()
+        search.build_index()
+        build_seconds = time.perf_counter() - started
+
+        common = {"k": args.k, "section": args.section}
+        truth, exact_latency = timed(search, queries, mode="exact", **common)
+
+        started = time.perf_counter()
+        search.search_batch(queries, mode="exact", **common)
+        batched = (time.perf_counter() - started) / len(queries)
+
+        print(
+            f"vectors={args.vectors} queries={args.queries} k={args.k} "
+            f"section={args.section} lists={search.index.n_lists}"
+        )
+        print(f"IVF build: {build_seconds:.2f}s")
+        print(f"{'mode':<16}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        print(
+            f"{'exact':<16}{1.0:>10.3f}{percentile_ms(exact_latency, 50):>10.2f}"
+            f"{percentile_ms(exact_latency, 95):>10.2f}"
+        )
+        print(f"{'exact batched':<16}{1.0:>10.3f}{batched * 1000:>10.2f}{'':>10}")
+        for n_probe in (1, 4, 8, 16, 32):
+            results, latency = timed(
+                search, queries, mode="ivf", n_probe=n_probe, **common
+            )
+            print(
+                f"{f'ivf n_probe={n_probe}':<16}{recall(truth, results):>10.3f}"
+                f"{percentile_ms(latency, 50):>10.2f}{percentile_ms(latency, 95):>10.2f}"
+            )
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
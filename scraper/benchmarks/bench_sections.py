@@ -0,0 +1,111 @@
+"""
+Benchmark: single-pass SectionIndex vs. the previous per-section header scans
+
+Usage:
+    python -m benchmarks.bench_sections [page.html ...] [--repeat 5]
+
+Without arguments it uses pages saved in the HTTP cache (.http_cache/bodies),
+or synthetic pages if the cache is empty.
+"""
+
+import argparse
+import glob
+import os
+import time
+from typing import Dict, List
+
+from bs4 import BeautifulSoup
+
+from benchmarks.standin_server import synthetic_article
+from paper_parser import HTML_PARSER, SECTION_RULES
+from section_index import SectionIndex
+
+
+def legacy_sections(soup) -> Dict[str, str]:
+    """Section lookup as parse_paper_content did it before the index"""
+    sections = {}
+    for name, (keywords, selectors) in SECTION_RULES.items():
+        text = ""
+        for header_selector in ["h2", "h3", "h4"]:
+            for header in soup.select(header_selector):
+                header_text = header.get_text().lower().strip()
+                if any(keyword in header_text for keyword in keywords):
+                    next_elem = header.find_next_sibling()
+                    if next_elem:
+                        text = next_elem.get_text().strip()
+                        break
+            if text:
+                break
+        if not text:
+            for selector in selectors:
+                tag = soup.select_one(selector)
+                if tag:
+                    text = tag.get_text().strip()
+                    break
+        sections[name] = text
+    return sections
+
+
+def indexed_sections(soup) -> Dict[str, str]:
+    index = SectionIndex(
+        soup,
+        [selector for _, selectors in SECTION_RULES.values() for selector in selectors],
+    )
+    return {
+        name: index.find(keywords, selectors)
+        for name, (keywords, selectors) in SECTION_RULES.items()
+    }
+
+
+def load_pages(paths: List[str]) -> List[str]:
+    if not paths:
+        paths = glob.glob(os.path.join(".http_cache", "bodies", "*.html"))
+    if paths:
+        pages = []
+        for path in paths:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                pages.append(f.read())
+        return pages
+    return [synthetic_article(f"PMC{i}", paragraphs=400) for i in range(10)]
+
+
+def time_lookup(lookup, soups, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for soup in soups:
+            lookup(soup)
+    return (time.perf_counter() - start) / (repeat * len(soups))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("pages", nargs="*")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages)
+    soups = [BeautifulSoup(page, HTML_PARSER) for page in pages]
+    mean_chars = sum(len(page) for page in pages) / len(pages)
+
+    legacy = time_lookup(legacy_sections, soups, args.repeat)
+    indexed = time_lookup(indexed_sections, soups, args.repeat)
+
+    found_legacy = sum(
+        bool(v) for soup in soups for v in legacy_sections(soup).values()
+    )
+    found_indexed = sum(
+        bool(v) for soup in soups for v in indexed_sections(soup).values()
+    )
+
+    print(f"pages={len(pages)} mean size={mean_chars:,.0f} chars parser={HTML_PARSER}")
+    print(
+        f"legacy header scans: {legacy * 1000:8.2f} ms/page ({found_legacy} sections found)"
+    )
+    print(
+        f"section index:       {indexed * 1000:8.2f} ms/page ({found_indexed} sections found)"
+    )
+    print(f"speedup:             {legacy / indexed:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
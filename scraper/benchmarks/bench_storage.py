@@ -0,0 +1,86 @@
+"""
+Benchmark: per-paper write latency of the storage backends as the corpus grows
+
+Each simulated paper is one publication insert, one batch of embedding
+records and one status update, like a pipeline run.
+
+Usage:
+    python -m benchmarks.bench_storage [--papers 2000] [--json-papers 100] [--sections 7]
+
+The JSON backend slows down quadratically, so it is run over fewer papers.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import uuid
+
+from storage import JsonFileStorage, SQLiteStorage
+
+
+def make_publication(pub_id: str) -> dict:
+    return {
+        "id": pub_id,
+        "title": "Microgravity effects on bone density",
+        "authors": ["A. Author", "B. Author"],
+        "abstract": "Abstract text. " * 40,
+        "fullText": "Full text. " * 2000,
+        "processingStatus": "processing",
+        "keywords": ["microgravity", "bone"],
+    }
+
+
+def make_embeddings(pub_id: str, sections: int) -> list:
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "publicationId": pub_id,
+            "section": f"section{i}",
+            "embedding": [0.1] * 768,
+        }
+        for i in range(sections)
+    ]
+
+
+def run(storage, papers: int, sections: int, report_every: int):
+    """Write papers and print mean per-paper latency for each window"""
+    window_start = time.perf_counter()
+    for n in range(1, papers + 1):
+        pub_id = str(uuid.uuid4())
+        storage.insert_publication(make_publication(pub_id))
+        storage.insert_embeddings(make_embeddings(pub_id, sections))
+        storage.update_status(pub_id, "completed", "2025-01-01T00:00:00")
+
+        if n % report_every == 0:
+            elapsed = time.perf_counter() - window_start
+            print(
+                f"  papers {n - report_every + 1:>5}-{n:<5} {elapsed / report_every * 1000:9.2f} ms/paper"
+            )
+            window_start = time.perf_counter()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--papers", type=int, default=2000)
+    parser.add_argument("--json-papers", type=int, default=100)
+    parser.add_argument("--sections", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print("json (whole-file rewrite):")
+        run(
+            JsonFileStorage(os.path.join(tmp, "pubs.json")),
+            args.json_papers,
+            args.sections,
+            max(1, args.json_papers // 5),
+        )
+
+        print("sqlite:")
+        storage = SQLiteStorage(os.path.join(tmp, "pubs.sqlite"))
+        run(storage, args.papers, args.sections, max(1, args.papers // 5))
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+In-process stand-ins for the Gemini generation and embedding APIs
+
+FakeGemini replaces google.generativeai.GenerativeModel and embed_content
+with fakes that answer entity extraction prompts with valid JSON, return
+random embedding vectors and enforce their own requests/tokens per minute
+over a sliding window. Requests over quota fail with the SDK's
+TooManyRequests (429) error, including a retry hint, like the real API.
+
+Usage:
+    fake = FakeGemini(generation=ModelQuota(600, 4_000_000), ...)
+    with fake.installed():
+        ...  # code using google.generativeai
+    print(fake.utilization(seconds))
+"""
+
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+GENERATION_MODEL = "gemini-2.0-flash"
+EMBEDDING_MODEL = "text-embedding-004"
+
+_PAPER_IDS = re.compile(r"=== PAPER (P\d+) ===")
+
+_ENTITIES = {
+    "organisms": ["Arabidopsis thaliana", "Mus musculus"],
+    "experimental_conditions": ["microgravity", "cosmic radiation"],
+    "biological_processes": ["gene expression", "bone resorption"],
+    "space_environments": ["International Space Station"],
+}
+
+
+def fake_token_count(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+@dataclass
+class ModelQuota:
+    """Limits a fake model enforces, and its response latency (seconds)"""
+
+    requests_per_minute: int
+    tokens_per_minute: int
+    latency: float = 0.0
+
+
+class QuotaWindow:
+    """Requests and tokens of the last minute, plus totals and peaks"""
+
+    def __init__(self, quota: ModelQuota):
+        self.quota = quota
+        self.events: deque = deque()
+        self.window_tokens = 0
+        self.requests = 0
+        self.tokens = 0
+        self.rejected = 0
+        self.peak_requests = 0
+        self.peak_tokens = 0
+        self.lock = threading.Lock()
+
+    def admit(self, tokens: int) -> None:
+        """Count a request, or raise TooManyRequests if it exceeds the quota"""
+        with self.lock:
+            now = time.monotonic()
+            while self.events and self.events[0][0] <= now - 60.0:
+                self.window_tokens -= self.events.popleft()[1]
+            if (
+                len(self.events) + 1 > self.quota.requests_per_minute
+                or self.window_tokens + tokens > self.quota.tokens_per_minute
+            ):
+                self.rejected += 1
+                retry_in = (
+                    max(0.5, self.events[0][0] + 60.0 - now) if self.events else 1.0
+                )
+                raise google_exceptions.TooManyRequests(
+                    f"Resource has been exhausted (e.g. check quota). "
+                    f"Please retry in {retry_in:.1f}s."
+                )
+            self.events.append((now, tokens))
+            self.window_tokens += tokens
+            self.requests += 1
+            self.tokens += tokens
+            self.peak_requests = max(self.peak_requests, len(self.events))
+            self.peak_tokens = max(self.peak_tokens, self.window_tokens)
+
+    def utilization(self, seconds: float) -> Dict[str, Any]:
+        minutes = max(seconds, 1e-9) / 60.0
+        return {
+            "requests": self.requests,
+            "tokens": self.tokens,
+            "rejected_429": self.rejected,
+            "rpm_limit": self.quota.requests_per_minute,
+            "tpm_limit": self.quota.tokens_per_minute,
+            "mean_rpm": round(self.requests / minutes, 1),
+            "mean_tpm": round(self.tokens / minutes),
+            "peak_rpm_share": round(
+                self.peak_requests / self.quota.requests_per_minute, 3
+            ),
+            "peak_tpm_share": round(self.peak_tokens / self.quota.tokens_per_minute, 3),
+        }
+
+
+class FakeGenerativeModel:
+    """Subset of genai.GenerativeModel used by PaperExtractor"""
+
+    def __init__(self, fake: "FakeGemini", model_name: str = GENERATION_MODEL):
+        self.fake = fake
+        self.model_name = model_name
+
+    async def count_tokens_async(self, contents) -> Any:
+        return SimpleNamespace(total_tokens=fake_token_count(str(contents)))
+
+    async def generate_content_async(self, prompt, generation_config=None) -> Any:
+        tokens = fake_token_count(str(prompt))
+        self.fake.generation.admit(tokens)
+        if self.fake.generation.quota.latency:
+            await asyncio.sleep(self.fake.generation.quota.latency)
+
+        ids = _PAPER_IDS.findall(str(prompt))
+        if ids:
+            # Batched prompt: one result per paper id, some possibly dropped
+            results = [
+                {"id": paper_id, **_ENTITIES}
+                for paper_id in ids
+                if random.random() >= self.fake.malformed_rate
+            ]
+            text = json.dumps(results)
+        else:
+            text = json.dumps(_ENTITIES)
+        return SimpleNamespace(
+            text=text,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=tokens,
+                candidates_token_count=fake_token_count(text),
+            ),
+        )
+
+
+class FakeGemini:
+    """
+    Fake generation and embedding backends with their own quotas
+
+    Args:
+        generation: Quota and latency of the generation model
+        embedding: Quota and latency of the embedding model
+        dimensions: Length of the returned embedding vectors
+        malformed_rate: Share of papers left out of batched entity answers
+    """
+
+    def __init__(
+        self,
+        generation: ModelQuota,
+        embedding: ModelQuota,
+        dimensions: int = 768,
+        malformed_rate: float = 0.0,
+    ):
+        self.generation = QuotaWindow(generation)
+        self.embedding = QuotaWindow(embedding)
+        self.dimensions = dimensions
+        self.malformed_rate = malformed_rate
+
+    def embed_content(self, model: str, content, task_type: str = "", **kwargs):
+        """Stand-in for genai.embed_content (synchronous, like the SDK)"""
+        texts: List[str] = content if isinstance(content, list) else [content]
+        self.embedding.admit(sum(fake_token_count(text) for text in texts))
+        if self.embedding.quota.latency:
+            time.sleep(self.embedding.quota.latency)
+        vectors = [self._vector() for _ in texts]
+        return {"embedding": vectors if isinstance(content, list) else vectors[0]}
+
+    def _vector(self) -> List[float]:
+        vector = [random.gauss(0.0, 1.0) for _ in range(self.dimensions)]
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    @contextmanager
+    def installed(self) -> Iterator["FakeGemini"]:
+        """Patch google.generativeai to use these fakes within the block"""
+        original_model = genai.GenerativeModel
+        original_embed = genai.embed_content
+        genai.GenerativeModel = lambda model_name="", **kwargs: FakeGenerativeModel(
+            self
+        )
+        genai.embed_content = self.embed_content
+        try:
+            yield self
+        finally:
+            genai.GenerativeModel = original_model
+            genai.embed_content = original_embed
+
+    def utilization(self, seconds: float) -> Dict[str, Dict[str, Any]]:
+        """Quota use of both models over a run of the given length"""
+        return {
+            GENERATION_MODEL: self.generation.utilization(seconds),
+            EMBEDDING_MODEL: self.embedding.utilization(seconds),
+        }
@@ -0,0 +1,143 @@
+"""
+Local stand-in for the NCBI article server
+Serves a synthetic article page over keep-alive HTTP/1.1 so benchmarks can run offline
+
+Recorded PMC pages (saved .html files) can be served instead, in rotation,
+and responses can be delayed or fail at a configurable rate.
+"""
+
+import os
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+
+def synthetic_article(paper_id: str, paragraphs: int = 200) -> str:
+    """Build a PMC-like article page with nested sections and subsections"""
+    body = []
+    per_subsection = max(1, paragraphs // 15)
+    for section in ["Abstract", "Methods", "Results", "Discussion", "Conclusions"]:
+        body.append(f'<section id="{section.lower()}"><h2>{section}</h2>')
+        for sub in range(3):
+            body.append(f"<section><h3>{section} {sub + 1}</h3>")
+            for i in range(per_subsection):
+                body.append(
+                    f"<p>{section} paragraph {sub}.{i} of {paper_id}: microgravity "
+                    "exposure altered gene expression in Arabidopsis thaliana "
+                    "seedlings.</p>"
+                )
+            body.append("</section>")
+        body.append("</section>")
+    return (
+        "<html><head>"
+        f"<title>Article {paper_id}</title>"
+        f'<meta name="citation_doi" content="10.0000/{paper_id}">'
+        '<meta name="citation_author" content="A. Author">'
+        "<script>window.analytics = {};</script>"
+        "</head><body><nav>Navigation</nav>"
+        f'<h1 class="content-title">Article {paper_id}</h1>'
+        + "".join(body)
+        + "</body></html>"
+    )
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers every GET with an article page (or, at error_rate, an error)"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        config: StandInServer = self.server.standin
+        if config.latency or config.jitter:
+            time.sleep(max(0.0, config.latency + random.uniform(-1, 1) * config.jitter))
+
+        paper_id = self.path.strip("/") or "index"
+        if config.error_rate and random.random() < config.error_rate:
+            config.count("errors")
+            self.send_error(config.error_status)
+            return
+
+        config.count("pages")
+        payload = config.page(paper_id).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer:
+    """
+    Runs a ThreadingHTTPServer on localhost in a background thread
+
+    Args:
+        handler: Request handler class
+        port: Port to listen on (0 picks a free one)
+        latency: Mean delay of every response, in seconds
+        jitter: Responses are delayed by latency +/- up to jitter seconds
+        error_rate: Share of requests answered with error_status
+        error_status: HTTP status of the failed requests
+        pages_dir: Directory of recorded article pages (*.html); each path is
+            mapped to one of them (stable per path) instead of a synthetic page
+    """
+
+    def __init__(
+        self,
+        handler=StandInHandler,
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        pages_dir: str = "",
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.recorded_pages: List[str] = []
+        if pages_dir:
+            for name in sorted(os.listdir(pages_dir)):
+                if name.endswith((".html", ".htm")):
+                    with open(os.path.join(pages_dir, name), encoding="utf-8") as f:
+                        self.recorded_pages.append(f.read())
+            if not self.recorded_pages:
+                raise ValueError(f"No .html pages in {pages_dir}")
+        self.stats = {"pages": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.standin = self
+        self.thread: Optional[threading.Thread] = None
+
+    def page(self, paper_id: str) -> str:
+        if self.recorded_pages:
+            index = zlib.crc32(paper_id.encode()) % len(self.recorded_pages)
+            return self.recorded_pages[index]
+        return synthetic_article(paper_id)
+
+    def count(self, name: str) -> None:
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "StandInServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,129 @@
+"""
+Token-bounded, overlapping passages of a paper's full text
+
+Passages are cut on whitespace so words are never split, and each one keeps
+its character offsets into the source text.
+"""
+
+from typing import Callable, List, NamedTuple, Optional, Sequence
+
+from token_counter import TokenCounter
+
+# Counter used when no count_tokens is given (uncalibrated estimates)
+_default_counter = TokenCounter()
+
+
+class TextChunk(NamedTuple):
+    """A passage of text and its [start, end) character offsets in the source"""
+
+    index: int
+    start: int
+    end: int
+    text: str
+
+
+def _back_to_whitespace(text: str, pos: int, floor: int) -> int:
+    """Move pos back to the nearest whitespace after floor (or leave it)"""
+    cut = text.rfind(" ", floor, pos)
+    newline = text.rfind("\n", floor, pos)
+    cut = max(cut, newline)
+    return cut if cut > floor else pos
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int = 512,
+    overlap_tokens: int = 64,
+    count_tokens: Optional[Callable[[str], int]] = None,
+) -> List[TextChunk]:
+    """
+    Split text into overlapping passages of at most ~max_tokens tokens
+
+    Args:
+        text: Cleaned text to split
+        max_tokens: Token budget of a single passage
+        overlap_tokens: Tokens shared between consecutive passages
+        count_tokens: Token counter for text; TokenCounter.estimate (without
+            calibration) is used when omitted
+    """
+    if not text or not text.strip():
+        return []
+
+    count_tokens = count_tokens or _default_counter.estimate
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+
+    # Convert token budgets to character windows using the text's own ratio
+    chars_per_token = len(text) / max(1, count_tokens(text))
+    window = max(1, int(max_tokens * chars_per_token))
+    overlap = int(overlap_tokens * chars_per_token)
+
+    chunks: List[TextChunk] = []
+    start = 0
+    length = len(text)
+    while start < length:
+        # Skip leading whitespace so offsets point at real content
+        while start < length and text[start].isspace():
+            start += 1
+        if start >= length:
+            break
+
+        end = min(length, start + window)
+        if end < length:
+            end = _back_to_whitespace(text, end, start + window // 2)
+
+        passage = text[start:end].rstrip()
+        chunks.append(TextChunk(len(chunks), start, start + len(passage), passage))
+
+        if end >= length:
+            break
+
+        # Step forward, keeping `overlap` characters of context, and never
+        # start in the middle of a word
+        next_start = max(start + 1, end - overlap)
+        if next_start < end:
+            boundary = text.find(" ", next_start, end)
+            if boundary != -1:
+                next_start = boundary + 1
+        start = next_start
+
+    return chunks
+
+
+def chunk_sections(
+    text: str,
+    section_starts: Sequence[int],
+    max_tokens: int = 512,
+    overlap_tokens: int = 64,
+    count_tokens: Optional[Callable[[str], int]] = None,
+) -> List[TextChunk]:
+    """
+    Like chunk_text, but passages do not cross section boundaries
+
+    Sections shorter than a quarter of max_tokens (e.g. a heading directly
+    followed by a subsection) are merged into the next one.
+
+    Args:
+        text: Cleaned text to split
+        section_starts: Character offsets where sections begin
+        max_tokens: Token budget of a single passage
+        overlap_tokens: Tokens shared between consecutive passages (within
+            a section)
+        count_tokens: Token counter for text
+    """
+    count_tokens = count_tokens or _default_counter.estimate
+    bounds = sorted({0, len(text), *(s for s in section_starts if 0 < s < len(text))})
+
+    chunks: List[TextChunk] = []
+    start = 0
+    for end in bounds[1:]:
+        span = text[start:end]
+        if end < len(text) and count_tokens(span) < max_tokens // 4:
+            continue
+        for chunk in chunk_text(span, max_tokens, overlap_tokens, count_tokens):
+            chunks.append(
+                TextChunk(
+                    len(chunks), start + chunk.start, start + chunk.end, chunk.text
+                )
+            )
+        start = end
+    return chunks
@@ -2,6 +2,11 @@ import os
 from dataclasses import dataclass
 from typing import List, Optional, Dict, Any
 
+# HTML is parsed in one process per CPU unless PARSE_PROCESSES says otherwise
+DEFAULT_PARSE_PROCESSES = os.cpu_count() or 1
+# Parse stage workers when parsing in-process (no pool to keep busy)
+DEFAULT_PARSE_WORKERS = 2
+
 @dataclass
 class PaperData:
     """Data class for paper information"""
@@ -12,7 +17,9 @@ class PaperData:
     doi: str
     pdf_url: str
     keywords: List[str]
-    full_text: str = ""  # Add field for the entire paper content
+    full_text: str = ""  # Entire article text (as clean_text; never the raw page)
+    clean_text: str = ""  # Article text without markup, used for Gemini and embeddings
+    text_sections: Optional[List[Dict[str, Any]]] = None  # Headed sections of clean_text
     methods: str = ""
     results: str = ""
     discussion: str = ""
@@ -30,7 +37,78 @@ class Configuration:
     convex_url: str
     convex_deploy_key: str
     gemini_api_key: str
-    input_csv_path: str
+    input_csv_path: str  # CSV or JSONL file, or "-" for stdin
+    input_format: Optional[str] = None  # "csv"/"jsonl", detected if unset
+    # Pipeline tuning: worker count per stage and bounded queue size between stages
+    fetch_workers: int = 4
+    parse_workers: int = 0  # 0: one per parse process (see __post_init__)
+    entity_workers: int = 2
+    embedding_workers: int = 2
+    persist_workers: int = 1
+    queue_size: int = 8
+    # Embedding batching: papers grouped per embedding stage call, and the
+    # limits (texts, estimated tokens) of a single batch embedding request
+    embedding_paper_batch: int = 8
+    embedding_batch_size: int = 100
+    embedding_batch_tokens: int = 20000
+    # Full text is embedded as overlapping passages of this many tokens
+    embedding_chunk_tokens: int = 512
+    embedding_chunk_overlap: int = 64
+    # Persistent embedding cache (empty path disables it)
+    embedding_cache_path: str = ".embedding_cache.sqlite"
+    embedding_cache_max_entries: int = 200000
+    # Local storage: "sqlite" (default) or "json" (legacy local_publications.json)
+    storage_backend: str = "sqlite"
+    storage_path: str = ""
+    # Pooled HTTP client used to fetch paper pages
+    http_max_connections_per_host: int = 6
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry: float = 30.0
+    http2: bool = False
+    # On-disk cache of fetched pages (empty directory disables it)
+    http_cache_dir: str = ".http_cache"
+    http_cache_ttl: float = 7 * 24 * 3600
+    http_cache_max_mb: int = 1024
+    # Processes used to parse HTML off the event loop (0 parses in-process)
+    parse_processes: int = DEFAULT_PARSE_PROCESSES
+    # Gemini limits of the account ("model=RPM/TPM/RPD,..."; empty keeps the
+    # free-tier defaults) and adaptive probing above them until a 429
+    rate_limits: str = ""
+    adaptive_rate_limits: bool = False
+    rate_limit_max_factor: float = 4.0
+    # Quota usage kept across runs (empty path disables it) and the time zone
+    # whose midnight resets daily quotas
+    quota_usage_path: str = ".quota_usage.sqlite"
+    quota_reset_timezone: str = "America/Los_Angeles"
+    # Token budget of the entity extraction prompt, and whether it is counted
+    # with the model's count_tokens endpoint (else estimated locally)
+    gemini_max_prompt_tokens: int = 30000
+    exact_token_counts: bool = False
+    # Papers and token budget of one batched entity extraction request
+    entity_paper_batch: int = 8
+    entity_batch_tokens: int = 120000
+    # Parsed entity results of unchanged papers (empty path disables the cache)
+    llm_cache_path: str = ".llm_cache.sqlite"
+    # Constrain Gemini entity answers to a JSON response schema
+    structured_output: bool = True
+    # Skip papers already stored as completed (matched by PMC ID or DOI)
+    skip_existing: bool = True
+    # Attempts per paper before it goes to the dead-letter list, and initial
+    # retry backoff per failure class ("timeout=60,rate_limited=900,...")
+    retry_max_attempts: int = 5
+    retry_backoff: str = ""
+    # Metrics endpoint (0 disables it) and periodic JSON snapshot (empty path
+    # disables it)
+    metrics_port: int = 0
+    metrics_host: str = "127.0.0.1"
+    metrics_snapshot_path: str = ""
+    metrics_snapshot_interval: float = 30.0
+
+    def __post_init__(self):
+        # Each parse worker keeps at most one page in the pool, so fewer
+        # workers than processes would leave processes idle
+        if self.parse_workers <= 0:
+            self.parse_workers = self.parse_processes or DEFAULT_PARSE_WORKERS
 
 def load_config() -> Configuration:
     """Load configuration from environment variables"""
@@ -41,5 +119,57 @@ def load_config() -> Configuration:
         convex_url=os.getenv("CONVEX_URL", ""),
         convex_deploy_key=os.getenv("CONVEX_DEPLOY_KEY", ""),
         gemini_api_key=os.getenv("GEMINI_API_KEY", ""),
-        input_csv_path=os.getenv("INPUT_CSV_PATH", "papers.csv")
+        input_csv_path=os.getenv("INPUT_CSV_PATH", "papers.csv"),
+        input_format=os.getenv("INPUT_FORMAT") or None,
+        fetch_workers=int(os.getenv("FETCH_WORKERS", "4")),
+        parse_workers=int(os.getenv("PARSE_WORKERS", "0")),
+        entity_workers=int(os.getenv("ENTITY_WORKERS", "2")),
+        embedding_workers=int(os.getenv("EMBEDDING_WORKERS", "2")),
+        persist_workers=int(os.getenv("PERSIST_WORKERS", "1")),
+        queue_size=int(os.getenv("PIPELINE_QUEUE_SIZE", "8")),
+        embedding_paper_batch=int(os.getenv("EMBEDDING_PAPER_BATCH", "8")),
+        embedding_batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "100")),
+        embedding_batch_tokens=int(os.getenv("EMBEDDING_BATCH_TOKENS", "20000")),
+        embedding_chunk_tokens=int(os.getenv("EMBEDDING_CHUNK_TOKENS", "512")),
+        embedding_chunk_overlap=int(os.getenv("EMBEDDING_CHUNK_OVERLAP", "64")),
+        embedding_cache_path=os.getenv("EMBEDDING_CACHE_PATH", ".embedding_cache.sqlite"),
+        embedding_cache_max_entries=int(
+            os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000")
+        ),
+        storage_backend=os.getenv("STORAGE_BACKEND", "sqlite"),
+        storage_path=os.getenv("STORAGE_PATH", ""),
+        http_max_connections_per_host=int(
+            os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "6")
+        ),
+        http_max_keepalive_connections=int(
+            os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20")
+        ),
+        http_keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30")),
+        http2=os.getenv("HTTP2_ENABLED", "false").lower() in ("1", "true", "yes"),
+        http_cache_dir=os.getenv("HTTP_CACHE_DIR", ".http_cache"),
+        http_cache_ttl=float(os.getenv("HTTP_CACHE_TTL", str(7 * 24 * 3600))),
+        http_cache_max_mb=int(os.getenv("HTTP_CACHE_MAX_MB", "1024")),
+        parse_processes=int(os.getenv("PARSE_PROCESSES", str(DEFAULT_PARSE_PROCESSES))),
+        rate_limits=os.getenv("RATE_LIMITS", ""),
+        adaptive_rate_limits=os.getenv("ADAPTIVE_RATE_LIMITS", "false").lower()
+        in ("1", "true", "yes"),
+        rate_limit_max_factor=float(os.getenv("RATE_LIMIT_MAX_FACTOR", "4")),
+        quota_usage_path=os.getenv("QUOTA_USAGE_PATH", ".quota_usage.sqlite"),
+        quota_reset_timezone=os.getenv("QUOTA_RESET_TIMEZONE", "America/Los_Angeles"),
+        gemini_max_prompt_tokens=int(os.getenv("GEMINI_MAX_PROMPT_TOKENS", "30000")),
+        exact_token_counts=os.getenv("EXACT_TOKEN_COUNTS", "false").lower()
+        in ("1", "true", "yes"),
+        entity_paper_batch=int(os.getenv("ENTITY_PAPER_BATCH", "8")),
+        entity_batch_tokens=int(os.getenv("ENTITY_BATCH_TOKENS", "120000")),
+        llm_cache_path=os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite"),
+        structured_output=os.getenv("GEMINI_STRUCTURED_OUTPUT", "true").lower()
+        in ("1", "true", "yes"),
+        skip_existing=os.getenv("SKIP_EXISTING", "true").lower()
+        in ("1", "true", "yes"),
+        retry_max_attempts=int(os.getenv("RETRY_MAX_ATTEMPTS", "5")),
+        retry_backoff=os.getenv("RETRY_BACKOFF", ""),
+        metrics_port=int(os.getenv("METRICS_PORT", "0")),
+        metrics_host=os.getenv("METRICS_HOST", "127.0.0.1"),
+        metrics_snapshot_path=os.getenv("METRICS_SNAPSHOT_PATH", ""),
+        metrics_snapshot_interval=float(os.getenv("METRICS_SNAPSHOT_INTERVAL", "30")),
     )
\ No newline at end of file
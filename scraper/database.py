@@ -1,121 +1,147 @@
-import asyncio
 import logging
-import json
-import os
 import uuid
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional, Sequence, Tuple
 
 from config import PaperData
+from metrics import get_metrics
+from storage import StorageBackend, create_storage
 
 
 class ConvexDatabase:
     """Handles database operations for the Convex database"""
 
-    def __init__(self, convex_url: str, convex_deploy_key: str, gemini_api_key: str):
+    def __init__(
+        self,
+        convex_url: str,
+        convex_deploy_key: str,
+        gemini_api_key: str,
+        embedding_batch_size: int = 100,
+        embedding_batch_tokens: int = 20000,
+        embedding_cache=None,
+        embedding_chunk_tokens: int = 512,
+        embedding_chunk_overlap: int = 64,
+        storage_backend: str = "sqlite",
+        storage_path: str = "",
+        extractor=None,
+    ):
         self.convex_url = convex_url
         self.convex_deploy_key = convex_deploy_key
         self.gemini_api_key = gemini_api_key
+        self.embedding_batch_size = embedding_batch_size
+        self.embedding_batch_tokens = embedding_batch_tokens
+        self.embedding_cache = embedding_cache
+        self.embedding_chunk_tokens = embedding_chunk_tokens
+        self.embedding_chunk_overlap = embedding_chunk_overlap
         self.client = None
         self.embedding_generator = None
         self.logger = logging.getLogger(__name__)
         self.convex_available = False  # Start in mock mode to avoid hanging
         self.mock_mode = True  # Use local storage instead of Convex
-        self.local_storage_file = "local_publications.json"
+        self.storage_backend = storage_backend
+        self.storage_path = storage_path
+        self.storage: Optional[StorageBackend] = None
+        self.metrics = get_metrics()
+        # Its pooled HTTP client is closed along with the database
+        self.extractor = extractor
+
+    def _timed_write(self, op: str):
+        """Times a local storage write in the storage_write_seconds histogram"""
+        return self.metrics.timer(
+            "storage_write_seconds",
+            "Local storage write latency",
+            backend=self.storage_backend,
+            op=op,
+        )
 
     async def initialize(self):
         """Initialize local storage and embedding generator"""
-        from embedding_generator import EmbeddingGenerator
-
         try:
-            self.embedding_generator = EmbeddingGenerator(self.gemini_api_key)
+            # Keep a single generator (and its rate limiter) for the whole run
+            if self.embedding_generator is None:
+                self.embedding_generator = self._create_embedding_generator()
             self.logger.info("Using local storage mode instead of Convex")
 
-            # Initialize local storage file if it doesn't exist or is empty
-            if (
-                not os.path.exists(self.local_storage_file)
-                or os.path.getsize(self.local_storage_file) == 0
-            ):
-                with open(self.local_storage_file, "w") as f:
-                    json.dump({"publications": [], "embeddings": []}, f)
+            # Open the local storage backend
+            if self.storage is None:
+                self.storage = create_storage(self.storage_backend, self.storage_path)
 
         except Exception as e:
             self.logger.error(f"Error initializing local storage: {str(e)}")
             self.logger.error(f"Exception type: {type(e).__name__}")
             return
 
-    async def insert_publication(self, paper_data: PaperData):
-        """Insert a publication record into the database"""
-        try:
-            self.logger.info(
-                f"Starting to insert publication: {paper_data.title[:50]}..."
-            )
+    async def find_publication(self, keys: Sequence[str]) -> Optional[Tuple[str, str]]:
+        """(id, processing status) of the stored publication with any of the natural keys"""
+        if not keys:
+            return None
+        # Initialize if not already done
+        if self.storage is None:
+            await self.initialize()
+        return self.storage.find_by_keys(keys)
 
-            # Initialize if not already done
-            if self.client is None:
-                await self.initialize()
+    async def insert_publication(self, paper_data: PaperData, keys: Sequence[str] = ()):
+        """
+        Insert a publication record into the database
 
-            # Use local storage instead of Convex
-            self.logger.info("Using local storage for publication insertion")
-
-            # Generate a unique ID
-            pub_id = str(uuid.uuid4())
-
-            # Create publication record
-            publication_record = {
-                "id": pub_id,
-                "title": paper_data.title,
-                "authors": paper_data.authors,
-                "abstract": paper_data.abstract,
-                "fullText": paper_data.full_text,  # Add full text to the record
-                "methods": paper_data.methods,
-                "results": paper_data.results,
-                "discussion": paper_data.discussion,
-                "conclusions": paper_data.conclusions,
-                "publicationDate": paper_data.publication_date,
-                "doi": paper_data.doi,
-                "pdfUrl": paper_data.pdf_url,
-                "keywords": paper_data.keywords,
-                "processingStatus": "processing",
-                "citationCount": paper_data.citation_count,
-                "viewCount": paper_data.view_count,
-                "organisms": paper_data.organisms or [],
-                "experimentalConditions": paper_data.experimental_conditions or [],
-                "biologicalProcesses": paper_data.biological_processes or [],
-                "spaceEnvironments": paper_data.space_environments or [],
-                "insertedAt": datetime.now().isoformat(),
-            }
-
-            # Save to local storage
-            try:
-                # Initialize file if it's empty or corrupted
-                try:
-                    with open(self.local_storage_file, "r") as f:
-                        data = json.load(f)
-                except (json.JSONDecodeError, FileNotFoundError):
-                    self.logger.warning(
-                        "Local storage file is corrupted or missing, reinitializing..."
-                    )
-                    data = {"publications": [], "embeddings": []}
-
-                data["publications"].append(publication_record)
-
-                with open(self.local_storage_file, "w") as f:
-                    json.dump(data, f, indent=2)
-
-                self.logger.info(f"Publication saved locally with ID: {pub_id}")
-                return pub_id
-
-            except Exception as e:
-                self.logger.error(f"Error saving to local storage: {e}")
-                return pub_id  # Return ID anyway to continue processing
+        With natural keys (see paper_keys.py) the write is an upsert: a paper
+        that is already stored keeps its id, and its record and embeddings
+        are replaced instead of duplicated. Storage errors are raised, so the
+        paper is retried instead of being marked completed.
+        """
+        self.logger.info(f"Starting to insert publication: {paper_data.title[:50]}...")
+
+        # Initialize if not already done
+        if self.client is None:
+            await self.initialize()
+
+        # Use local storage instead of Convex
+        self.logger.info("Using local storage for publication insertion")
+
+        # Reuse the id of the stored paper, else generate a unique ID
+        existing = self.storage.find_by_keys(keys) if keys else None
+        pub_id = existing[0] if existing else str(uuid.uuid4())
+        if existing:
+            self.logger.info(f"Replacing stored publication {pub_id}")
+            with self._timed_write("delete_embeddings"):
+                self.storage.delete_embeddings(pub_id)
+
+        # Create publication record
+        publication_record = {
+            "id": pub_id,
+            "title": paper_data.title,
+            "authors": paper_data.authors,
+            "abstract": paper_data.abstract,
+            "fullText": paper_data.full_text,  # Add full text to the record
+            "methods": paper_data.methods,
+            "results": paper_data.results,
+            "discussion": paper_data.discussion,
+            "conclusions": paper_data.conclusions,
+            "publicationDate": paper_data.publication_date,
+            "doi": paper_data.doi,
+            "pdfUrl": paper_data.pdf_url,
+            "keywords": paper_data.keywords,
+            "processingStatus": "processing",
+            "citationCount": paper_data.citation_count,
+            "viewCount": paper_data.view_count,
+            "organisms": paper_data.organisms or [],
+            "experimentalConditions": paper_data.experimental_conditions or [],
+            "biologicalProcesses": paper_data.biological_processes or [],
+            "spaceEnvironments": paper_data.space_environments or [],
+            "naturalKeys": list(keys),
+            "insertedAt": datetime.now().isoformat(),
+        }
+
+        # Save to local storage
+        try:
+            with self._timed_write("insert_publication"):
+                self.storage.insert_publication(publication_record)
         except Exception as e:
-            self.logger.error(f"Error inserting publication: {str(e)}")
-            self.logger.error(f"Exception type: {type(e).__name__}")
-            if hasattr(e, "response"):
-                self.logger.error(f"Response: {e.response}")
-            # Return a mock ID to allow the process to continue
-            return str(uuid.uuid4())
+            self.logger.error(f"Error saving to local storage: {e}")
+            raise
+
+        self.logger.info(f"Publication saved locally with ID: {pub_id}")
+        return pub_id
 
     async def insert_embeddings(
         self, publication_id: str, paper_data: PaperData, extractor=None
@@ -126,62 +152,103 @@ class ConvexDatabase:
                 f"Starting to insert embeddings for publication ID: {publication_id}"
             )
 
-            # Initialize if not already done
-            if self.client is None:
-                await self.initialize()
-
-            # Use local storage for embeddings
-            self.logger.info("Using local storage for embeddings insertion")
-
-            if self.embedding_generator is None:
-                from embedding_generator import EmbeddingGenerator
-
-                self.embedding_generator = EmbeddingGenerator(self.gemini_api_key)
-
             # Generate embeddings for the paper
-            embeddings = await self.embedding_generator.generate_embeddings_for_paper(
-                paper_data
-            )
-
-            # Save embeddings to local storage
-            try:
-                # Initialize file if it's empty or corrupted
-                try:
-                    with open(self.local_storage_file, "r") as f:
-                        data = json.load(f)
-                except (json.JSONDecodeError, FileNotFoundError):
-                    self.logger.warning(
-                        "Local storage file is corrupted or missing, reinitializing..."
-                    )
-                    data = {"publications": [], "embeddings": []}
-
-                # Insert each embedding
-                for section_name, embedding in embeddings.items():
-                    embedding_record = {
-                        "id": str(uuid.uuid4()),
-                        "publicationId": publication_id,
-                        "section": section_name,
-                        "embedding": embedding,
-                        "insertedAt": datetime.now().isoformat(),
-                    }
-                    data["embeddings"].append(embedding_record)
-                    self.logger.info(f"Saved embedding for section: {section_name}")
-
-                with open(self.local_storage_file, "w") as f:
-                    json.dump(data, f, indent=2)
-
-                self.logger.info(
-                    f"Successfully saved {len(embeddings)} embeddings for publication ID: {publication_id}"
-                )
+            embeddings, offsets = await self.generate_embeddings(paper_data)
 
-            except Exception as e:
-                self.logger.error(f"Error saving embeddings to local storage: {e}")
+            await self.save_embeddings(publication_id, embeddings, offsets)
         except Exception as e:
             self.logger.error(
                 f"Error inserting embeddings for publication {publication_id}: {str(e)}"
             )
             # Continue processing even if insertion fails
 
+    def _create_embedding_generator(self):
+        from embedding_generator import EmbeddingGenerator
+
+        return EmbeddingGenerator(
+            self.gemini_api_key,
+            batch_size=self.embedding_batch_size,
+            batch_token_budget=self.embedding_batch_tokens,
+            cache=self.embedding_cache,
+            chunk_tokens=self.embedding_chunk_tokens,
+            chunk_overlap=self.embedding_chunk_overlap,
+        )
+
+    async def generate_embeddings(
+        self, paper_data: PaperData
+    ) -> Tuple[Dict[str, List[float]], Dict[str, Tuple[int, int]]]:
+        """Generate section embeddings (and passage offsets) without storing them"""
+        return (await self.generate_embeddings_batch([paper_data]))[0]
+
+    async def generate_embeddings_batch(
+        self, papers: List[PaperData]
+    ) -> List[Tuple[Dict[str, List[float]], Dict[str, Tuple[int, int]]]]:
+        """
+        Generate section embeddings for several papers in shared batch requests
+
+        Each paper's embeddings come with the (start, end) character offsets of
+        its fullText#<n> passages, as chunked for embedding.
+        """
+        # Initialize if not already done
+        if self.client is None:
+            await self.initialize()
+
+        if self.embedding_generator is None:
+            self.embedding_generator = self._create_embedding_generator()
+
+        return await self.embedding_generator.generate_passage_embeddings(papers)
+
+    async def save_embeddings(
+        self,
+        publication_id: str,
+        embeddings: Dict[str, List[float]],
+        offsets: Optional[Dict[str, Sequence[int]]] = None,
+    ):
+        """
+        Store previously generated embeddings for the publication
+
+        offsets maps full-text passages (fullText#<n>) to their (start, end)
+        character offsets in the clean text, as returned with the embeddings.
+        Storage errors are raised.
+        """
+        offsets = offsets or {}
+
+        # Use local storage for embeddings
+        self.logger.info("Using local storage for embeddings insertion")
+
+        # Save embeddings to local storage
+        try:
+            # Initialize if not already done
+            if self.storage is None:
+                await self.initialize()
+
+            # Insert all embeddings in one write
+            records = []
+            for section_name, embedding in embeddings.items():
+                embedding_record = {
+                    "id": str(uuid.uuid4()),
+                    "publicationId": publication_id,
+                    "section": section_name,
+                    "embedding": embedding,
+                    "insertedAt": datetime.now().isoformat(),
+                }
+                if section_name in offsets:
+                    start, end = offsets[section_name]
+                    embedding_record["startOffset"] = start
+                    embedding_record["endOffset"] = end
+                records.append(embedding_record)
+
+            with self._timed_write("insert_embeddings"):
+                self.storage.insert_embeddings(records)
+
+            self.logger.info(
+                f"Successfully saved {len(embeddings)} embeddings for publication ID: {publication_id}"
+            )
+
+        except Exception as e:
+            self.logger.error(f"Error saving embeddings to local storage: {e}")
+            raise
+
     async def update_processing_status(self, publication_id: str, status: str):
         """Update the processing status of a publication"""
         # Initialize if not already done
@@ -194,25 +261,14 @@ class ConvexDatabase:
         )
 
         try:
-            # Initialize file if it's empty or corrupted
-            try:
-                with open(self.local_storage_file, "r") as f:
-                    data = json.load(f)
-            except (json.JSONDecodeError, FileNotFoundError):
-                self.logger.warning(
-                    "Local storage file is corrupted or missing, reinitializing..."
+            # Indexed update of the publication's status
+            with self._timed_write("update_status"):
+                found = self.storage.update_status(
+                    publication_id, status, datetime.now().isoformat()
                 )
-                data = {"publications": [], "embeddings": []}
-
-            # Find and update the publication
-            for pub in data["publications"]:
-                if pub["id"] == publication_id:
-                    pub["processingStatus"] = status
-                    pub["updatedAt"] = datetime.now().isoformat()
-                    break
-
-            with open(self.local_storage_file, "w") as f:
-                json.dump(data, f, indent=2)
+            if not found:
+                self.logger.warning(f"Publication {publication_id} not found")
+                return
 
             self.logger.info(
                 f"Status updated to {status} for publication {publication_id}"
@@ -220,7 +276,19 @@ class ConvexDatabase:
 
         except Exception as e:
             self.logger.error(f"Error updating status in local storage: {e}")
+            raise
 
     async def close(self):
         """Close any open connections"""
+        if self.embedding_cache is not None:
+            self.logger.info(
+                f"Embedding cache stats: {self.embedding_cache.get_stats()}"
+            )
+            self.embedding_cache.close()
+        if self.storage is not None:
+            self.storage.close()
+            self.storage = None
+        if self.extractor is not None:
+            await self.extractor.close()
+            self.extractor = None
         self.logger.info("Database connections closed")
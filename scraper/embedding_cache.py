@@ -0,0 +1,159 @@
+import hashlib
+import logging
+import re
+import sqlite3
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class EmbeddingCache:
+    """
+    Persistent cache of embeddings keyed by (model, task type, text hash)
+
+    Vectors are stored as packed float32 blobs in SQLite. When the cache holds
+    more than max_entries vectors, the least recently used ones are evicted.
+    """
+
+    def __init__(
+        self, path: str = ".embedding_cache.sqlite", max_entries: int = 200000
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.logger = logging.getLogger(__name__)
+        self.hits = 0
+        self.misses = 0
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)"
+        )
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, task_type: str, text: str) -> str:
+        """Cache key for a text; whitespace differences do not change the key"""
+        normalized = _WHITESPACE.sub(" ", text).strip()
+        digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        return f"{model}|{task_type}|{digest}"
+
+    @staticmethod
+    def _pack(vector: Sequence[float]) -> bytes:
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _unpack(blob: bytes) -> List[float]:
+        vector = array("f")
+        vector.frombytes(blob)
+        return vector.tolist()
+
+    def get_many(
+        self, model: str, task_type: str, texts: Sequence[str]
+    ) -> List[Optional[List[float]]]:
+        """Look up several texts at once; missing entries are None"""
+        keys = [self.make_key(model, task_type, text) for text in texts]
+        found: Dict[str, List[float]] = {}
+
+        unique_keys = list(dict.fromkeys(keys))
+        # Stay below SQLite's host parameter limit
+        for start in range(0, len(unique_keys), 500):
+            chunk = unique_keys[start : start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                chunk,
+            )
+            for key, blob in rows:
+                found[key] = self._unpack(blob)
+
+        if found:
+            now = time.time()
+            self.conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+            self.conn.commit()
+
+        results = [found.get(key) for key in keys]
+        hits = sum(1 for result in results if result is not None)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def get(self, model: str, task_type: str, text: str) -> Optional[List[float]]:
+        """Look up a single text"""
+        return self.get_many(model, task_type, [text])[0]
+
+    def put_many(
+        self,
+        model: str,
+        task_type: str,
+        texts: Sequence[str],
+        vectors: Sequence[Sequence[float]],
+    ) -> None:
+        """Store embeddings for several texts"""
+        now = time.time()
+        rows = [
+            (self.make_key(model, task_type, text), self._pack(vector), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        if not rows:
+            return
+
+        before = self.conn.total_changes
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+            rows,
+        )
+        self.conn.commit()
+        self.size += self.conn.total_changes - before
+
+        if self.size > self.max_entries:
+            self._evict()
+
+    def put(self, model: str, task_type: str, text: str, vector: Sequence[float]):
+        """Store the embedding for a single text"""
+        self.put_many(model, task_type, [text], [vector])
+
+    def _evict(self) -> None:
+        """Remove least recently used entries down to 90% of max_entries"""
+        target = int(self.max_entries * 0.9)
+        excess = self.size - target
+        self.conn.execute(
+            """
+            DELETE FROM embeddings WHERE key IN (
+                SELECT key FROM embeddings ORDER BY last_used LIMIT ?
+            )
+            """,
+            (excess,),
+        )
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.logger.info(
+            f"Embedding cache evicted {excess} entries, {self.size} remaining"
+        )
+
+    def get_stats(self) -> Dict[str, float]:
+        """Hit/miss counters for this run"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": self.size,
+        }
+
+    def close(self) -> None:
+        self.conn.close()
@@ -1,86 +1,234 @@
 import asyncio
 import logging
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 import google.generativeai as genai
-from rate_limiter import RateLimiter
+from chunking import TextChunk, chunk_sections
+from embedding_cache import EmbeddingCache
+from rate_limiter import get_rate_limiter
 
 
 class EmbeddingGenerator:
     """Handles the generation of embeddings using Gemini API"""
 
-    def __init__(self, gemini_api_key: str):
+    # Largest number of texts the API accepts in one batchEmbedContents call
+    MAX_BATCH_SIZE = 100
+
+    def __init__(
+        self,
+        gemini_api_key: str,
+        batch_size: int = MAX_BATCH_SIZE,
+        batch_token_budget: int = 20000,
+        cache: Optional[EmbeddingCache] = None,
+        chunk_tokens: int = 512,
+        chunk_overlap: int = 64,
+        task_type: str = "RETRIEVAL_DOCUMENT",
+    ):
         self.gemini_api_key = gemini_api_key
         genai.configure(api_key=gemini_api_key)
         self.logger = logging.getLogger(__name__)
-        self.rate_limiter = RateLimiter()
+        self.rate_limiter = get_rate_limiter(gemini_api_key)
+        # Shared with the rate limiter, so estimates improve with exact counts
+        self.token_counter = self.rate_limiter.token_counter
         self.model_name = "text-embedding-004"
+        self.task_type = task_type
+        self.cache = cache
+        self.batch_size = max(1, min(batch_size, self.MAX_BATCH_SIZE))
+        self.batch_token_budget = batch_token_budget
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
 
     async def generate_embedding(self, text: str) -> List[float]:
-        """Generate a 768-dimensional embedding for the given text"""
+        """
+        Generate a 768-dimensional embedding for the given text
+
+        Errors (including 429s that outlast the rate limiter's retries and
+        timeouts) are raised, so callers can tell them apart.
+        """
+        if self.cache is not None:
+            cached = self.cache.get(self.model_name, self.task_type, text)
+            if cached is not None:
+                return cached
+
         try:
             self.logger.info(f"Generating embedding for text of length {len(text)}...")
 
-            # Apply proper rate limiting based on Google's official limits
-            await self.rate_limiter.wait_for_rate_limit(self.model_name, text)
-
             # Use the embedding generation API with timeout
             def embed_sync():
                 return genai.embed_content(
                     model=f"models/{self.model_name}",
                     content=text,
-                    task_type="RETRIEVAL_DOCUMENT",
+                    task_type=self.task_type,
                 )
 
-            # Run the sync function in a separate thread with timeout
+            # Run the sync function in a separate thread with timeout, under
+            # the rate limit (429 responses are retried after backing off)
             loop = asyncio.get_event_loop()
             try:
-                result = await asyncio.wait_for(
-                    loop.run_in_executor(None, embed_sync),
-                    timeout=30,  # 30 seconds timeout
+                result = await self.rate_limiter.call(
+                    self.model_name,
+                    lambda: asyncio.wait_for(
+                        loop.run_in_executor(None, embed_sync),
+                        timeout=30,  # 30 seconds timeout
+                    ),
+                    text=text,
                 )
             except asyncio.TimeoutError:
                 self.logger.error("Embedding generation timed out after 30 seconds")
-                return [0.0] * 768
-
-            embedding = result["embedding"]
+                raise
 
             # Ensure it's exactly 768 dimensions
-            if len(embedding) != 768:
-                self.logger.warning(
-                    f"Embedding dimension mismatch: got {len(embedding)}, expected 768"
-                )
-                # Pad or truncate to 768 dimensions
-                if len(embedding) < 768:
-                    embedding.extend([0.0] * (768 - len(embedding)))
-                else:
-                    embedding = embedding[:768]
+            embedding = self._fit_dimensions(result["embedding"])
 
             self.logger.info(
                 f"Embedding generated successfully with {len(embedding)} dimensions"
             )
 
-            # Record the successful request for rate limiting
-            self.rate_limiter.record_request(self.model_name, text)
+            if self.cache is not None:
+                self.cache.put(self.model_name, self.task_type, text, embedding)
 
             return embedding
         except Exception as e:
             self.logger.error(f"Error generating embedding: {e}")
-            # Return a zero embedding in case of error
-            return [0.0] * 768
+            raise
 
-    async def generate_embeddings_for_paper(self, paper_data) -> Dict[str, List[float]]:
-        """Generate embeddings for different sections of the paper"""
-        self.logger.info(
-            f"Starting to generate embeddings for paper: {paper_data.title[:50]}..."
+    def _fit_dimensions(self, embedding: List[float]) -> List[float]:
+        """Pad or truncate an embedding to exactly 768 dimensions"""
+        if len(embedding) != 768:
+            self.logger.warning(
+                f"Embedding dimension mismatch: got {len(embedding)}, expected 768"
+            )
+            if len(embedding) < 768:
+                embedding = embedding + [0.0] * (768 - len(embedding))
+            else:
+                embedding = embedding[:768]
+        return embedding
+
+    def _make_batches(self, texts: List[str]) -> List[List[int]]:
+        """Group text indices into batches bounded by batch_size and token budget"""
+        batches: List[List[int]] = []
+        current: List[int] = []
+        current_tokens = 0
+
+        for i, text in enumerate(texts):
+            tokens = self.token_counter.estimate(text)
+            if current and (
+                len(current) >= self.batch_size
+                or current_tokens + tokens > self.batch_token_budget
+            ):
+                batches.append(current)
+                current, current_tokens = [], 0
+            # A text larger than the budget on its own still gets its own batch
+            current.append(i)
+            current_tokens += tokens
+
+        if current:
+            batches.append(current)
+        return batches
+
+    async def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Generate embeddings for many texts using batched API requests
+
+        Each batch is a single request for rate limiting purposes. Texts found
+        in the embedding cache are not sent at all. Results are returned in the
+        same order as texts. A failed batch raises its error (batches completed
+        before it are in the cache, if there is one).
+        """
+        embeddings: List[List[float]] = [[0.0] * 768 for _ in texts]
+
+        pending = list(range(len(texts)))
+        if self.cache is not None:
+            cached = self.cache.get_many(self.model_name, self.task_type, texts)
+            pending = []
+            for i, vector in enumerate(cached):
+                if vector is None:
+                    pending.append(i)
+                else:
+                    embeddings[i] = vector
+            if len(pending) < len(texts):
+                self.logger.info(
+                    f"Embedding cache hits: {len(texts) - len(pending)}/{len(texts)}"
+                )
+
+        pending_texts = [texts[i] for i in pending]
+        for batch_positions in self._make_batches(pending_texts):
+            batch = [pending[position] for position in batch_positions]
+            batch_texts = [texts[i] for i in batch]
+            batch_tokens = sum(
+                self.token_counter.estimate(text) for text in batch_texts
+            )
+            self.logger.info(
+                f"Generating batch of {len(batch_texts)} embeddings (~{batch_tokens} tokens)..."
+            )
+
+            def embed_batch_sync():
+                return genai.embed_content(
+                    model=f"models/{self.model_name}",
+                    content=batch_texts,
+                    task_type=self.task_type,
+                )
+
+            # The whole batch is one request against RPM, its tokens against TPM
+            loop = asyncio.get_event_loop()
+            try:
+                result = await self.rate_limiter.call(
+                    self.model_name,
+                    lambda: asyncio.wait_for(
+                        loop.run_in_executor(None, embed_batch_sync),
+                        timeout=60,  # 60 seconds timeout
+                    ),
+                    estimated_tokens=batch_tokens,
+                )
+            except asyncio.TimeoutError:
+                self.logger.error(
+                    "Batch embedding generation timed out after 60 seconds"
+                )
+                raise
+            except Exception as e:
+                self.logger.error(f"Error generating batch embeddings: {e}")
+                raise
+
+            vectors = result["embedding"]
+            if len(vectors) != len(batch):
+                raise RuntimeError(
+                    f"Batch embedding returned {len(vectors)} vectors for {len(batch)} texts"
+                )
+
+            for i, vector in zip(batch, vectors):
+                embeddings[i] = self._fit_dimensions(list(vector))
+
+            if self.cache is not None:
+                self.cache.put_many(
+                    self.model_name,
+                    self.task_type,
+                    batch_texts,
+                    [embeddings[i] for i in batch],
+                )
+
+        return embeddings
+
+    def full_text_chunks(self, paper_data) -> List[TextChunk]:
+        """Token-bounded, overlapping passages of the paper's cleaned full text"""
+        sections = getattr(paper_data, "text_sections", None) or []
+        return chunk_sections(
+            getattr(paper_data, "clean_text", ""),
+            [section["start"] for section in sections],
+            max_tokens=self.chunk_tokens,
+            overlap_tokens=self.chunk_overlap,
+            count_tokens=self.token_counter.estimate,
         )
-        embeddings = {}
 
-        # Generate embeddings for each section
+    def _paper_sections(
+        self, paper_data
+    ) -> Tuple[Dict[str, str], Dict[str, Tuple[int, int]]]:
+        """
+        Non-empty sections of a paper that should be embedded, and the
+        character offsets of its fullText#<n> passages in clean_text
+        """
         sections = {
             "title": paper_data.title,
             "abstract": paper_data.abstract,
-            "fullText": paper_data.full_text,  # Add full text to the embeddings
         }
 
         # Add other sections if they exist as attributes in paper_data
@@ -90,18 +238,64 @@ class EmbeddingGenerator:
                 if attr_value and attr_value.strip():
                     sections[attr_name] = attr_value
 
-        self.logger.info(f"Found {len(sections)} sections to generate embeddings for")
+        # The full text is embedded as passages instead of one truncated input;
+        # their offsets are kept from this chunking, the one that was embedded
+        offsets = {}
+        for chunk in self.full_text_chunks(paper_data):
+            sections[f"fullText#{chunk.index}"] = chunk.text
+            offsets[f"fullText#{chunk.index}"] = (chunk.start, chunk.end)
 
-        for section_name, section_content in sections.items():
-            if (
-                section_content.strip()
-            ):  # Only generate embedding if content exists and is not just whitespace
-                self.logger.info(
-                    f"Generating embedding for section: {section_name} (length: {len(section_content)})"
-                )
-                embedding = await self.generate_embedding(section_content)
-                embeddings[section_name] = embedding
-                self.logger.info(f"Completed embedding for section: {section_name}")
+        # Only generate embeddings if content exists and is not just whitespace
+        sections = {
+            name: content
+            for name, content in sections.items()
+            if content and content.strip()
+        }
+        return sections, {name: offsets[name] for name in offsets if name in sections}
+
+    async def generate_embeddings_for_papers(
+        self, papers: List
+    ) -> List[Dict[str, List[float]]]:
+        """Generate section embeddings for several papers with shared batch requests"""
+        return [
+            embeddings
+            for embeddings, _ in await self.generate_passage_embeddings(papers)
+        ]
+
+    async def generate_passage_embeddings(
+        self, papers: List
+    ) -> List[Tuple[Dict[str, List[float]], Dict[str, Tuple[int, int]]]]:
+        """
+        Section embeddings of several papers, with the (start, end) offsets of
+        their full-text passages, generated in shared batch requests
+        """
+        keys: List[Tuple[int, str]] = []
+        texts: List[str] = []
+        offsets: List[Dict[str, Tuple[int, int]]] = []
+        for paper_index, paper_data in enumerate(papers):
+            sections, paper_offsets = self._paper_sections(paper_data)
+            offsets.append(paper_offsets)
+            for section_name, content in sections.items():
+                keys.append((paper_index, section_name))
+                texts.append(content)
+
+        self.logger.info(
+            f"Generating {len(texts)} section embeddings for {len(papers)} papers"
+        )
+        vectors = await self.generate_embeddings_batch(texts)
+
+        # Map results back to (paper, section)
+        results: List[Dict[str, List[float]]] = [{} for _ in papers]
+        for (paper_index, section_name), vector in zip(keys, vectors):
+            results[paper_index][section_name] = vector
+        return list(zip(results, offsets))
+
+    async def generate_embeddings_for_paper(self, paper_data) -> Dict[str, List[float]]:
+        """Generate embeddings for different sections of the paper"""
+        self.logger.info(
+            f"Starting to generate embeddings for paper: {paper_data.title[:50]}..."
+        )
+        embeddings = (await self.generate_embeddings_for_papers([paper_data]))[0]
 
         self.logger.info(
             f"Completed embeddings generation. Generated embeddings for {len(embeddings)} sections"
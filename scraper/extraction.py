@@ -1,30 +1,242 @@
 import asyncio
+import json
 import logging
 import re
-import time
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, List, Optional, Tuple
-from urllib.parse import urljoin
+from urllib.parse import urlsplit
 
-import bs4
 import google.generativeai as genai
 import httpx
-import requests
-from bs4 import BeautifulSoup
 
 from config import PaperData
-from rate_limiter import RateLimiter
+from http_cache import ResponseCache
+from llm_cache import LLMCache
+from paper_parser import parse_paper_html
+from rate_limiter import get_rate_limiter
+
+# Entity extraction prompt; {content} is the (token-budgeted) paper text
+ENTITY_PROMPT = """
+        Analyze the following research paper content and extract the following information:
+
+        1. Organisms: Species, microorganisms, cell types mentioned in the paper
+        2. Experimental Conditions: Temperature, pressure, radiation, microgravity, etc.
+        3. Biological Processes: Cellular processes, molecular pathways, physiological responses
+        4. Space Environments: ISS, microgravity, cosmic radiation, specific mission contexts
+
+        Paper Content:
+        {content}
+
+        Provide the results as a JSON object with the following keys:
+        {{
+          "organisms": [list of organisms],
+          "experimental_conditions": [list of experimental conditions],
+          "biological_processes": [list of biological processes],
+          "space_environments": [list of space environments]
+        }}
+
+        Return only the JSON object with no additional text.
+        """
+
+# Several papers in one request; {papers} holds the "=== PAPER <id> ===" blocks
+BATCH_ENTITY_PROMPT = """
+        Analyze each of the following research papers separately and extract, for every paper:
+
+        1. Organisms: Species, microorganisms, cell types mentioned in the paper
+        2. Experimental Conditions: Temperature, pressure, radiation, microgravity, etc.
+        3. Biological Processes: Cellular processes, molecular pathways, physiological responses
+        4. Space Environments: ISS, microgravity, cosmic radiation, specific mission contexts
+
+        Each paper starts with a line "=== PAPER <id> ===".
+
+{papers}
+
+        Provide the results as a JSON array with one object for every paper:
+        [
+          {{
+            "id": "<id>",
+            "organisms": [list of organisms],
+            "experimental_conditions": [list of experimental conditions],
+            "biological_processes": [list of biological processes],
+            "space_environments": [list of space environments]
+          }}
+        ]
+
+        Return only the JSON array with no additional text.
+        """
+
+# Version of the entity prompts; bump it whenever ENTITY_PROMPT,
+# BATCH_ENTITY_PROMPT or the response schemas change, so cached results of the
+# old prompts are not used
+ENTITY_PROMPT_VERSION = "2"
+
+ENTITY_KEYS = [
+    "organisms",
+    "experimental_conditions",
+    "biological_processes",
+    "space_environments",
+]
+
+# Response schemas for structured output (application/json)
+_ENTITY_LIST_SCHEMA = {"type": "array", "items": {"type": "string"}}
+ENTITY_SCHEMA = {
+    "type": "object",
+    "properties": {key: _ENTITY_LIST_SCHEMA for key in ENTITY_KEYS},
+    "required": ENTITY_KEYS,
+}
+BATCH_ENTITY_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "id": {"type": "string"},
+            **{key: _ENTITY_LIST_SCHEMA for key in ENTITY_KEYS},
+        },
+        "required": ["id", *ENTITY_KEYS],
+    },
+}
+
+# Longest entity name kept; longer entries are sentences, not entities
+_MAX_ENTITY_LENGTH = 200
+_WHITESPACE = re.compile(r"\s+")
+
+
+class EntityExtractionError(Exception):
+    """No valid entity result for a paper (missing or malformed in the answer)"""
+
+
+def empty_entities() -> Dict[str, List[str]]:
+    return {key: [] for key in ENTITY_KEYS}
+
+
+def parse_json_response(text: str):
+    """Decode a JSON answer, tolerating a surrounding ```json code fence"""
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text[7:]
+    elif text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return json.loads(text)
+
+
+def normalize_entity_list(items: List) -> List[str]:
+    """Clean up entity names and drop empty, overlong and duplicate ones"""
+    names: List[str] = []
+    seen = set()
+    for item in items:
+        if not isinstance(item, (str, int, float)):
+            continue
+        name = _WHITESPACE.sub(" ", str(item)).strip().strip("\"'.,;:").strip()
+        if not name or len(name) > _MAX_ENTITY_LENGTH:
+            continue
+        # Duplicates differing only in case are merged (first spelling wins)
+        key = name.casefold()
+        if key not in seen:
+            seen.add(key)
+            names.append(name)
+    return names
+
+
+def validate_entities(value) -> Optional[Dict[str, List[str]]]:
+    """Normalized entity lists of one paper's result, or None if it is malformed"""
+    if not isinstance(value, dict):
+        return None
+    entities = empty_entities()
+    for key in ENTITY_KEYS:
+        items = value.get(key, [])
+        if not isinstance(items, list):
+            return None
+        entities[key] = normalize_entity_list(items)
+    return entities
+
+
+def results_by_id(answer) -> Dict[str, object]:
+    """Per-paper results of a batched answer (array with ids, or keyed object)"""
+    if isinstance(answer, list):
+        return {
+            str(item["id"]): item
+            for item in answer
+            if isinstance(item, dict) and "id" in item
+        }
+    if isinstance(answer, dict):
+        return answer
+    return {}
 
 
 class PaperExtractor:
     """Handles fetching and extracting content from research papers"""
 
-    def __init__(self, gemini_api_key: str):
+    # Attempts per paper in batched extraction (a paper is resent only if its
+    # result was missing or malformed)
+    ENTITY_BATCH_ATTEMPTS = 3
+
+    def __init__(
+        self,
+        gemini_api_key: str,
+        max_connections_per_host: int = 6,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+        response_cache: Optional[ResponseCache] = None,
+        parse_processes: int = 0,
+        max_prompt_tokens: int = 30000,
+        exact_token_counts: bool = False,
+        entity_batch_tokens: int = 120000,
+        llm_cache: Optional[LLMCache] = None,
+        structured_output: bool = True,
+    ):
         self.gemini_api_key = gemini_api_key
         genai.configure(api_key=gemini_api_key)
         self.model = genai.GenerativeModel("models/gemini-2.0-flash")
         self.model_name = "gemini-2.0-flash"
         self.logger = logging.getLogger(__name__)
-        self.rate_limiter = RateLimiter()
+        self.rate_limiter = get_rate_limiter(gemini_api_key)
+        # Prompt budgeting; counts are shared with the limiter's estimator
+        self.token_counter = self.rate_limiter.token_counter
+        self.max_prompt_tokens = max_prompt_tokens
+        self.exact_token_counts = exact_token_counts
+        # Token budget of a multi-paper entity extraction request
+        self.entity_batch_tokens = max(entity_batch_tokens, max_prompt_tokens)
+
+        # Entity results of unchanged papers are reused instead of spending quota
+        self.llm_cache = llm_cache
+        if llm_cache is not None:
+            llm_cache.prune(self.model_name, ENTITY_PROMPT_VERSION)
+
+        # Structured output: the model must answer with JSON matching the schema
+        self.structured_output = structured_output
+        self.entity_config = None
+        self.batch_entity_config = None
+        if structured_output:
+            self.entity_config = genai.GenerationConfig(
+                response_mime_type="application/json", response_schema=ENTITY_SCHEMA
+            )
+            self.batch_entity_config = genai.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=BATCH_ENTITY_SCHEMA,
+            )
+        # Per-paper results received vs. unusable (parse failure rate)
+        self.entity_results = 0
+        self.entity_parse_failures = 0
+
+        # Pooled HTTP client, created lazily and reused for every fetch
+        self.max_connections_per_host = max(1, max_connections_per_host)
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self.response_cache = response_cache
+
+        # Parse-worker mode: parse HTML in a process pool when parse_processes > 0
+        self.parse_processes = parse_processes
+        self.parse_pool: Optional[ProcessPoolExecutor] = None
+
+        # Page vs. clean article text size, for the compression ratio
+        self.raw_text_chars = 0
+        self.clean_text_chars = 0
 
     async def extract_paper_data(self, link: str, title: str) -> PaperData:
         """Extract paper data from the provided link"""
@@ -32,84 +244,215 @@ class PaperExtractor:
             # Fetch the paper content
             content = await self.fetch_paper_content(link)
 
-            # Parse the content to extract structured data
-            parsed_data = self.parse_paper_content(content, link)
-
-            # Create initial PaperData object with full text
-            paper_data = PaperData(
-                title=parsed_data.get("title", title),
-                authors=parsed_data.get("authors", []),
-                abstract=parsed_data.get("abstract", ""),
-                publication_date=parsed_data.get("publication_date", ""),
-                doi=parsed_data.get("doi", ""),
-                pdf_url=parsed_data.get("pdf_url", ""),
-                keywords=parsed_data.get("keywords", []),
-                full_text=content,  # Store the entire paper content
-                methods=parsed_data.get("methods", ""),
-                results=parsed_data.get("results", ""),
-                discussion=parsed_data.get("discussion", ""),
-                conclusions=parsed_data.get("conclusions", ""),
-                citation_count=parsed_data.get("citation_count", 0),
-                view_count=parsed_data.get("view_count", 0),
-            )
+            # Parse the content and create initial PaperData object with full text
+            paper_data = await self.build_paper_data_async(content, link, title)
 
-            self.logger.info(
-                f"Starting entity extraction for paper: {paper_data.title[:50]}..."
-            )
-            # Extract entities using Gemini API (using the full content if available, otherwise abstract)
-            full_content_for_gemini = content
-            entities = await self.extract_entities_with_gemini(full_content_for_gemini)
-            paper_data.organisms = entities.get("organisms", [])
-            paper_data.experimental_conditions = entities.get(
-                "experimental_conditions", []
-            )
-            paper_data.biological_processes = entities.get("biological_processes", [])
-            paper_data.space_environments = entities.get("space_environments", [])
-
-            self.logger.info(
-                f"Entity extraction completed. Found {len(paper_data.organisms)} organisms, {len(paper_data.experimental_conditions)} experimental conditions, {len(paper_data.biological_processes)} biological processes, {len(paper_data.space_environments)} space environments"
-            )
+            # Extract entities using Gemini API
+            await self.apply_entities(paper_data, content)
 
             return paper_data
         except Exception as e:
             self.logger.error(f"Error extracting paper data from {link}: {str(e)}")
             # Return a minimal PaperData object with required fields in case of error
-            return PaperData(
-                title=title,
-                authors=[],
-                abstract="",
-                publication_date="",
-                doi="",
-                pdf_url="",
-                keywords=[],
-                full_text="",
-                methods="",
-                results="",
-                discussion="",
-                conclusions="",
-                citation_count=0,
-                view_count=0,
-                organisms=[],
-                experimental_conditions=[],
-                biological_processes=[],
-                space_environments=[],
+            return self.empty_paper_data(title)
+
+    def build_paper_data(self, content: str, link: str, title: str) -> PaperData:
+        """Parse fetched content into a PaperData object (without entities)"""
+        # Parse the content to extract structured data
+        parsed_data = self.parse_paper_content(content, link)
+        return self.paper_data_from_parsed(parsed_data, content, title)
+
+    async def build_paper_data_async(
+        self, content: str, link: str, title: str
+    ) -> PaperData:
+        """Like build_paper_data, but parses in the parse worker pool if enabled"""
+        parsed_data = await self.parse_paper_content_async(content, link)
+        return self.paper_data_from_parsed(parsed_data, content, title)
+
+    def paper_data_from_parsed(
+        self, parsed_data: Dict, content: str, title: str
+    ) -> PaperData:
+        """Create a PaperData object from the dict returned by parse_paper_content"""
+        clean_text = parsed_data.get("clean_text", "")
+        self.raw_text_chars += len(content)
+        self.clean_text_chars += len(clean_text)
+        if content:
+            self.logger.info(
+                f"Clean text of {title[:50]}: {len(clean_text)}/{len(content)} chars "
+                f"({len(clean_text) / len(content):.1%} of the page)"
             )
+        return PaperData(
+            title=parsed_data.get("title", title),
+            authors=parsed_data.get("authors", []),
+            abstract=parsed_data.get("abstract", ""),
+            publication_date=parsed_data.get("publication_date", ""),
+            doi=parsed_data.get("doi", ""),
+            pdf_url=parsed_data.get("pdf_url", ""),
+            keywords=parsed_data.get("keywords", []),
+            # The article text, not the page: markup is neither stored nor
+            # sent to Gemini when a retry resumes from paper_data
+            full_text=clean_text,
+            clean_text=clean_text,
+            text_sections=parsed_data.get("text_sections"),
+            methods=parsed_data.get("methods", ""),
+            results=parsed_data.get("results", ""),
+            discussion=parsed_data.get("discussion", ""),
+            conclusions=parsed_data.get("conclusions", ""),
+            citation_count=parsed_data.get("citation_count", 0),
+            view_count=parsed_data.get("view_count", 0),
+        )
+
+    async def apply_entities(self, paper_data: PaperData, content: str) -> None:
+        """Run Gemini entity extraction and store the results on paper_data"""
+        self.logger.info(
+            f"Starting entity extraction for paper: {paper_data.title[:50]}..."
+        )
+        # Extract entities from the clean article text; the page itself is
+        # only used if no text could be extracted
+        entities = await self.extract_entities_with_gemini(
+            paper_data.clean_text or content
+        )
+        self._store_entities(paper_data, entities)
+
+    async def apply_entities_batch(
+        self, papers: List[PaperData], contents: List[str]
+    ) -> List[Optional[Exception]]:
+        """
+        Like apply_entities for several papers, sharing Gemini requests
+
+        Returns the error of every paper without a valid result (None for
+        papers whose entities were stored), so failures can be retried
+        instead of being stored with empty entity lists.
+        """
+        self.logger.info(f"Starting entity extraction for {len(papers)} papers...")
+        results, errors = await self._extract_entities_batch(
+            [
+                paper_data.clean_text or content
+                for paper_data, content in zip(papers, contents)
+            ]
+        )
+        for paper_data, entities in zip(papers, results):
+            if entities is not None:
+                self._store_entities(paper_data, entities)
+        return errors
+
+    def _store_entities(
+        self, paper_data: PaperData, entities: Dict[str, List[str]]
+    ) -> None:
+        paper_data.organisms = entities.get("organisms", [])
+        paper_data.experimental_conditions = entities.get(
+            "experimental_conditions", []
+        )
+        paper_data.biological_processes = entities.get("biological_processes", [])
+        paper_data.space_environments = entities.get("space_environments", [])
+
+        self.logger.info(
+            f"Entity extraction completed. Found {len(paper_data.organisms)} organisms, {len(paper_data.experimental_conditions)} experimental conditions, {len(paper_data.biological_processes)} biological processes, {len(paper_data.space_environments)} space environments"
+        )
+
+    def empty_paper_data(self, title: str) -> PaperData:
+        """Minimal PaperData object used when extraction fails"""
+        return PaperData(
+            title=title,
+            authors=[],
+            abstract="",
+            publication_date="",
+            doi="",
+            pdf_url="",
+            keywords=[],
+            full_text="",
+            methods="",
+            results="",
+            discussion="",
+            conclusions="",
+            citation_count=0,
+            view_count=0,
+            organisms=[],
+            experimental_conditions=[],
+            biological_processes=[],
+            space_environments=[],
+        )
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """Return the shared connection-pooled HTTP client, creating it on first use"""
+        if self.http_client is None or self.http_client.is_closed:
+            http2 = self.http2
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    self.logger.warning(
+                        "HTTP/2 requested but the 'h2' package is not installed, using HTTP/1.1"
+                    )
+                    http2 = False
+
+            self.http_client = httpx.AsyncClient(
+                timeout=30.0,
+                follow_redirects=True,
+                http2=http2,
+                headers={
+                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+                },
+                limits=httpx.Limits(
+                    max_connections=None,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+            )
+        return self.http_client
+
+    def _host_slot(self, link: str) -> asyncio.Semaphore:
+        """Semaphore limiting concurrent connections to the link's host"""
+        host = urlsplit(link).netloc.lower()
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return self._host_slots[host]
+
+    async def close(self) -> None:
+        """Close the pooled HTTP client and stop the parse worker pool"""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+            self.logger.info("HTTP client closed")
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown(wait=True, cancel_futures=True)
+            self.parse_pool = None
 
     async def fetch_paper_content(self, link: str, max_retries: int = 3) -> str:
         """Fetch paper content from the link with retry logic"""
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
+        cached = None
+        if self.response_cache is not None:
+            cached = self.response_cache.get(link)
+            if cached is not None and self.response_cache.is_fresh(cached):
+                self.logger.info(f"Serving {link} from HTTP cache")
+                return cached.body
+
+        client = self._get_http_client()
+        headers = (
+            self.response_cache.conditional_headers(cached)
+            if self.response_cache is not None
+            else {}
+        )
 
         for attempt in range(max_retries):
             try:
-                # Use httpx with follow_redirects=True to handle redirects
-                async with httpx.AsyncClient(
-                    timeout=30.0, follow_redirects=True
-                ) as client:
+                # Reuse pooled keep-alive connections, bounded per host
+                async with self._host_slot(link):
                     response = await client.get(link, headers=headers)
-                    response.raise_for_status()
-                    return response.text
+
+                if response.status_code == 304 and cached is not None:
+                    self.logger.info(f"{link} not modified, using cached copy")
+                    return self.response_cache.revalidated(cached).body
+
+                response.raise_for_status()
+                if self.response_cache is not None:
+                    self.response_cache.store(
+                        link,
+                        response.text,
+                        etag=response.headers.get("ETag", ""),
+                        last_modified=response.headers.get("Last-Modified", ""),
+                    )
+                return response.text
             except Exception as e:
                 self.logger.warning(
                     f"Attempt {attempt + 1} failed to fetch {link}: {e}"
@@ -125,386 +468,272 @@ class PaperExtractor:
 
     def parse_paper_content(self, content: str, link: str) -> Dict:
         """Parse the HTML content to extract structured data"""
-        soup = BeautifulSoup(content, "html.parser")
-
-        # Extract title
-        title = ""
-        title_tag = soup.find(["h1", "h2"], class_=re.compile(r".*title.*", re.I))
-        if title_tag:
-            title = title_tag.get_text().strip()
-        else:
-            title_tag = soup.find("title")
-            if title_tag:
-                title = title_tag.get_text().strip()
-
-        # Extract authors
-        authors = []
-        # Try to find authors using common selectors
-        author_selectors = [
-            'meta[name="citation_author"]',
-            'meta[name="authors"]',
-            ".author",
-            ".authors",
-            ".citation-author",
-            '[data-test-id="author-name"]',
-        ]
-
-        for selector in author_selectors:
-            author_tags = soup.select(selector)
-            if author_tags:
-                authors = [tag.get_text().strip() for tag in author_tags]
-                break
-
-        # Extract abstract
-        abstract = ""
-        abstract_selectors = [
-            ".abstract",
-            ".Abstract",
-            "#abstract",
-            '[id*="abstract"]',
-            ".abstract-text",
-            ".abstract-title",
-        ]
-
-        for selector in abstract_selectors:
-            abstract_tag = soup.select_one(selector)
-            if abstract_tag:
-                # Clean up abstract text
-                abstract = abstract_tag.get_text().strip()
-                # Remove "Abstract" heading if present
-                abstract = re.sub(r"^\s*Abstract\s*", "", abstract, flags=re.IGNORECASE)
-                break
-
-        # Extract methods section - improved selector approach
-        methods = ""
-        # Try to find methods section by looking for h2/h3 headers with methods-related text
-        header_selectors = ["h2", "h3", "h4"]
-        methods_keywords = ["methods", "method", "material", "materials", "materials and methods", "methodology"]
-        
-        for header_selector in header_selectors:
-            headers = soup.select(header_selector)
-            for header in headers:
-                header_text = header.get_text().lower().strip()
-                if any(keyword in header_text for keyword in methods_keywords):
-                    # Get the next sibling element which typically contains the content
-                    next_elem = header.find_next_sibling()
-                    if next_elem:
-                        methods = next_elem.get_text().strip()
-                        break
-            if methods:
-                break
-        
-        # If methods not found with header approach, try CSS selectors
-        if not methods:
-            methods_selectors = [
-                ".methods",
-                ".method",
-                "#methods",
-                "#method",
-                '[id*="methods"]',
-                '[id*="method"]',
-            ]
-            
-            for selector in methods_selectors:
-                methods_tag = soup.select_one(selector)
-                if methods_tag:
-                    methods = methods_tag.get_text().strip()
-                    break
-
-        # Extract results section - improved selector approach
-        results = ""
-        results_keywords = ["results", "result", "findings", "outcome", "outcomes"]
-        
-        for header_selector in header_selectors:
-            headers = soup.select(header_selector)
-            for header in headers:
-                header_text = header.get_text().lower().strip()
-                if any(keyword in header_text for keyword in results_keywords):
-                    next_elem = header.find_next_sibling()
-                    if next_elem:
-                        results = next_elem.get_text().strip()
-                        break
-            if results:
-                break
-        
-        # If results not found with header approach, try CSS selectors
-        if not results:
-            results_selectors = [
-                ".results",
-                "#results",
-                '[id*="results"]',
-                ".result",
-                "#result",
-                '[id*="result"]',
-            ]
-            
-            for selector in results_selectors:
-                results_tag = soup.select_one(selector)
-                if results_tag:
-                    results = results_tag.get_text().strip()
-                    break
-
-        # Extract discussion section - improved selector approach
-        discussion = ""
-        discussion_keywords = ["discussion", "discuss", "interpretation"]
-        
-        for header_selector in header_selectors:
-            headers = soup.select(header_selector)
-            for header in headers:
-                header_text = header.get_text().lower().strip()
-                if any(keyword in header_text for keyword in discussion_keywords):
-                    next_elem = header.find_next_sibling()
-                    if next_elem:
-                        discussion = next_elem.get_text().strip()
-                        break
-            if discussion:
-                break
-                
-        # If discussion not found with header approach, try CSS selectors
-        if not discussion:
-            discussion_selectors = [
-                ".discussion",
-                "#discussion",
-                '[id*="discussion"]',
-            ]
-            
-            for selector in discussion_selectors:
-                discussion_tag = soup.select_one(selector)
-                if discussion_tag:
-                    discussion = discussion_tag.get_text().strip()
-                    break
-
-        # Extract conclusions section - improved selector approach
-        conclusions = ""
-        conclusion_keywords = ["conclusion", "conclusions", "summary", "concluding", "final remarks"]
-        
-        for header_selector in header_selectors:
-            headers = soup.select(header_selector)
-            for header in headers:
-                header_text = header.get_text().lower().strip()
-                if any(keyword in header_text for keyword in conclusion_keywords):
-                    next_elem = header.find_next_sibling()
-                    if next_elem:
-                        conclusions = next_elem.get_text().strip()
-                        break
-            if conclusions:
-                break
-                
-        # If conclusions not found with header approach, try CSS selectors
-        if not conclusions:
-            conclusions_selectors = [
-                ".conclusion",
-                ".conclusions",
-                "#conclusion",
-                "#conclusions",
-                '[id*="conclusion"]',
-                '[id*="conclusions"]',
-            ]
-            
-            for selector in conclusions_selectors:
-                conclusions_tag = soup.select_one(selector)
-                if conclusions_tag:
-                    conclusions = conclusions_tag.get_text().strip()
-                    break
-
-        # Extract publication date
-        pub_date = ""
-        date_selectors = [
-            'meta[name="citation_publication_date"]',
-            'meta[property*="date"]',
-            ".pub-date",
-            ".publication-date",
-            ".article-date",
-        ]
-
-        for selector in date_selectors:
-            date_tag = soup.select_one(selector)
-            if date_tag:
-                pub_date = date_tag.get("content") or date_tag.get_text().strip()
-                break
-
-        # Extract DOI
-        doi = ""
-        doi_selectors = [
-            'meta[name="citation_doi"]',
-            'meta[name="doi"]',
-            ".doi",
-            ".DOI",
-            '[id*="doi"]',
-        ]
-
-        for selector in doi_selectors:
-            doi_tag = soup.select_one(selector)
-            if doi_tag:
-                doi = doi_tag.get("content") or doi_tag.get_text().strip()
-                break
-
-        # Extract keywords
-        keywords = []
-        keyword_selectors = [
-            'meta[name="keywords"]',
-            ".keyword",
-            ".keywords",
-            ".kwd",
-            ".Keyword",
-        ]
-
-        for selector in keyword_selectors:
-            keyword_tag = soup.select_one(selector)
-            if keyword_tag:
-                content = keyword_tag.get("content") or keyword_tag.get_text()
-                keywords = [k.strip() for k in content.split(",") if k.strip()]
-                # Clean up keywords to remove extra text
-                clean_keywords = []
-                for keyword in keywords:
-                    # Remove common prefixes like "Keywords:"
-                    clean_keyword = re.sub(r"^[Kk]eywords:\s*", "", keyword)
-                    if clean_keyword.strip():
-                        clean_keywords.append(clean_keyword.strip())
-                keywords = clean_keywords
-                break
-
-        # Extract PDF URL if available
-        pdf_url = ""
-        pdf_selectors = [
-            'a[href$=".pdf"]',
-            'a[title*="PDF"]',
-            'a[title*="pdf"]',
-            'a[href*="pdf"]',
-        ]
-
-        for selector in pdf_selectors:
-            pdf_tag = soup.select_one(selector)
-            if pdf_tag:
-                href = pdf_tag.get("href")
-                if href:
-                    pdf_url = urljoin(link, href)
-                    break
-
-        # Extract citation and view counts (specific to NCBI PubMed)
-        citation_count = 0
-        view_count = 0
-
-        # Look for citation count - avoiding :contains selector due to deprecation
-        citation_selectors = [
-            ".citation-count",
-            ".cited-by",
-            '[data-test-id*="cited"]',
-        ]
+        return parse_paper_html(content, link)
+
+    async def parse_paper_content_async(self, content: str, link: str) -> Dict:
+        """Parse content in the process pool so the event loop is not blocked"""
+        pool = self._get_parse_pool()
+        if pool is None:
+            return self.parse_paper_content(content, link)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, parse_paper_html, content, link)
+
+    def _get_parse_pool(self) -> Optional[ProcessPoolExecutor]:
+        """Return the parse worker pool, or None when parsing runs in-process"""
+        if self.parse_processes <= 0:
+            return None
+        if self.parse_pool is None:
+            self.parse_pool = ProcessPoolExecutor(max_workers=self.parse_processes)
+            self.logger.info(
+                f"Started parse worker pool with {self.parse_processes} processes"
+            )
+        return self.parse_pool
 
-        for selector in citation_selectors:
-            citation_tag = soup.select_one(selector)
-            if citation_tag:
-                text = citation_tag.get_text()
-                match = re.search(r"\d+", text)
-                if match:
-                    citation_count = int(match.group())
-                    break
-
-        return {
-            "title": title,
-            "authors": authors,
-            "abstract": abstract,
-            "methods": methods,
-            "results": results,
-            "discussion": discussion,
-            "conclusions": conclusions,
-            "publication_date": pub_date,
-            "doi": doi,
-            "pdf_url": pdf_url,
-            "keywords": keywords,
-            "citation_count": citation_count,
-            "view_count": view_count,
-        }
+    def _entity_cache_content(self, content: str) -> str:
+        # The per-paper budget decides what the model sees, so it is part of the key
+        return f"{self.max_prompt_tokens}\n{content}"
 
     async def extract_entities_with_gemini(self, content: str) -> Dict[str, List[str]]:
-        """Extract entities using Gemini API"""
-        # Limit content to avoid exceeding token limits
-        max_length = 40000  # Roughly 30k tokens
-        if len(content) > max_length:
-            content = content[:max_length]
-
-        # Define the entity extraction prompt
-        prompt = f"""
-        Analyze the following research paper content and extract the following information:
-
-        1. Organisms: Species, microorganisms, cell types mentioned in the paper
-        2. Experimental Conditions: Temperature, pressure, radiation, microgravity, etc.
-        3. Biological Processes: Cellular processes, molecular pathways, physiological responses
-        4. Space Environments: ISS, microgravity, cosmic radiation, specific mission contexts
-
-        Paper Content:
-        {content}
-
-        Provide the results as a JSON object with the following keys:
-        {{
-          "organisms": [list of organisms],
-          "experimental_conditions": [list of experimental conditions],
-          "biological_processes": [list of biological processes],
-          "space_environments": [list of space environments]
-        }}
-
-        Return only the JSON object with no additional text.
-        """
+        """Extract entities using Gemini API (or the LLM cache)"""
+        cache_content = self._entity_cache_content(content)
+        if self.llm_cache is not None:
+            cached = self.llm_cache.get(
+                self.model_name, ENTITY_PROMPT_VERSION, cache_content
+            )
+            if cached is not None:
+                self.logger.info("Entity extraction result taken from the LLM cache")
+                return cached
+
+        # Limit content to the prompt token budget (counted by the model when
+        # exact counts are enabled)
+        count_model = self.model if self.exact_token_counts else None
+        template_tokens = self.token_counter.estimate(ENTITY_PROMPT)
+        content = await self.token_counter.truncate(
+            content, self.max_prompt_tokens - template_tokens, count_model
+        )
+        content_tokens = await self.token_counter.count(content, count_model)
+
+        prompt = ENTITY_PROMPT.format(content=content)
+        prompt_tokens = content_tokens + template_tokens
 
         try:
             self.logger.info("Starting Gemini API call for entity extraction...")
-            # Apply proper rate limiting based on Google's official limits
-            await self.rate_limiter.wait_for_rate_limit(self.model_name, prompt)
-
-            # Add timeout to the API call
-            import concurrent.futures
-            import time
-
-            def call_gemini_api():
-                return self.model.generate_content_async(prompt)
-
-            # Since asyncio.wait_for doesn't work well with nested async calls in this context,
-            # let's set a timeout by using a separate thread with a timeout
-            loop = asyncio.get_event_loop()
+            # Reserve quota, send the request with a timeout and record the
+            # outcome; 429 responses are retried once the limiter backed off
             try:
-                response = await asyncio.wait_for(
-                    self.model.generate_content_async(prompt),
-                    timeout=60,  # 60 seconds timeout
+                response = await self.rate_limiter.call(
+                    self.model_name,
+                    lambda: asyncio.wait_for(
+                        self.model.generate_content_async(
+                            prompt, generation_config=self.entity_config
+                        ),
+                        timeout=60,  # 60 seconds timeout
+                    ),
+                    text=prompt,
+                    estimated_tokens=prompt_tokens,
                 )
             except asyncio.TimeoutError:
                 self.logger.error("Gemini API call timed out after 60 seconds")
-                return {
-                    "organisms": [],
-                    "experimental_conditions": [],
-                    "biological_processes": [],
-                    "space_environments": [],
-                }
+                return empty_entities()
 
             self.logger.info("Gemini API call completed, processing response...")
 
-            # Extract JSON from response
-            text = response.text.strip()
-
-            # Clean up the response to extract JSON
-            if text.startswith("```json"):
-                text = text[7:]  # Remove ```json
-            if text.endswith("```"):
-                text = text[:-3]  # Remove ```
-
-            import json
-
-            result = json.loads(text)
+            # Extract JSON from response (response.text raises ValueError
+            # for blocked answers, like json.loads for malformed ones)
+            try:
+                result = validate_entities(parse_json_response(response.text))
+            except ValueError:
+                result = None
+            self.entity_results += 1
+            if result is None:
+                self.entity_parse_failures += 1
+                self.logger.error("Entity extraction response is not a valid entity object")
+                return empty_entities()
 
             self.logger.info("Entity extraction response processed successfully")
 
-            return {
-                "organisms": result.get("organisms", []),
-                "experimental_conditions": result.get("experimental_conditions", []),
-                "biological_processes": result.get("biological_processes", []),
-                "space_environments": result.get("space_environments", []),
-            }
+            # Only valid results are cached, so failed papers are retried later
+            if self.llm_cache is not None:
+                self.llm_cache.put(
+                    self.model_name, ENTITY_PROMPT_VERSION, cache_content, result
+                )
+            return result
         except Exception as e:
             self.logger.error(f"Error extracting entities with Gemini: {e}")
             # Return empty lists in case of error
-            return {
-                "organisms": [],
-                "experimental_conditions": [],
-                "biological_processes": [],
-                "space_environments": [],
-            }
+            return empty_entities()
+
+    async def extract_entities_batch(
+        self, contents: List[str]
+    ) -> List[Dict[str, List[str]]]:
+        """
+        Extract entities of several papers with as few Gemini requests as possible
+
+        Papers (each cut to max_prompt_tokens) are packed into requests of at
+        most entity_batch_tokens tokens, and the answer carries each paper's id.
+        Papers whose result is missing or malformed are retried in a new
+        request; after ENTITY_BATCH_ATTEMPTS they get empty entity lists.
+        Results are returned in the order of contents.
+        """
+        results, _ = await self._extract_entities_batch(contents)
+        return [entities or empty_entities() for entities in results]
+
+    async def _extract_entities_batch(
+        self, contents: List[str]
+    ) -> Tuple[List[Optional[Dict[str, List[str]]]], List[Optional[Exception]]]:
+        """Entities of every paper (None if it failed) and the last error of each failed paper"""
+        results: List[Optional[Dict[str, List[str]]]] = [None] * len(contents)
+        errors: List[Optional[Exception]] = [None] * len(contents)
+        count_model = self.model if self.exact_token_counts else None
+        template_tokens = self.token_counter.estimate(BATCH_ENTITY_PROMPT)
+
+        if self.llm_cache is not None:
+            cached = self.llm_cache.get_many(
+                self.model_name,
+                ENTITY_PROMPT_VERSION,
+                [self._entity_cache_content(content) for content in contents],
+            )
+            for i, entities in enumerate(cached):
+                results[i] = entities
+            hits = sum(1 for entities in cached if entities is not None)
+            if hits:
+                self.logger.info(
+                    f"LLM cache hits for entity extraction: {hits}/{len(contents)}"
+                )
+
+        # Condense every paper still to be extracted to the per-paper budget once
+        papers: List[Tuple[str, int]] = []
+        for i, content in enumerate(contents):
+            if results[i] is not None:
+                papers.append(("", 0))
+                continue
+            text = await self.token_counter.truncate(
+                content, self.max_prompt_tokens - template_tokens, count_model
+            )
+            papers.append((text, await self.token_counter.count(text, count_model)))
+
+        pending = [i for i, (text, _) in enumerate(papers) if text.strip()]
+        for i, (text, _) in enumerate(papers):
+            if results[i] is None and not text.strip():
+                results[i] = empty_entities()
+
+        for attempt in range(1, self.ENTITY_BATCH_ATTEMPTS + 1):
+            if not pending:
+                break
+            failed: List[int] = []
+            for group in self._pack_papers(pending, papers, template_tokens):
+                found, error = await self._extract_group(
+                    group, papers, template_tokens
+                )
+                if found and self.llm_cache is not None:
+                    self.llm_cache.put_many(
+                        self.model_name,
+                        ENTITY_PROMPT_VERSION,
+                        [self._entity_cache_content(contents[i]) for i in found],
+                        list(found.values()),
+                    )
+                for i in group:
+                    if i in found:
+                        results[i] = found[i]
+                        errors[i] = None
+                    else:
+                        failed.append(i)
+                        errors[i] = error or EntityExtractionError(
+                            "Entity result missing or malformed"
+                        )
+            if failed and attempt < self.ENTITY_BATCH_ATTEMPTS:
+                self.logger.warning(
+                    f"Entity results missing or malformed for {len(failed)} papers, retrying them"
+                )
+            pending = failed
+
+        if pending:
+            self.logger.error(
+                f"No valid entity results for {len(pending)} papers after "
+                f"{self.ENTITY_BATCH_ATTEMPTS} attempts"
+            )
+        return results, errors
+
+    def _pack_papers(
+        self, indices: List[int], papers: List[Tuple[str, int]], template_tokens: int
+    ) -> List[List[int]]:
+        """Group papers into requests that fit entity_batch_tokens"""
+        groups: List[List[int]] = []
+        current: List[int] = []
+        current_tokens = template_tokens
+        for i in indices:
+            # Paper tokens plus its "=== PAPER <id> ===" delimiter
+            tokens = papers[i][1] + 10
+            if current and current_tokens + tokens > self.entity_batch_tokens:
+                groups.append(current)
+                current, current_tokens = [], template_tokens
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            groups.append(current)
+        return groups
+
+    async def _extract_group(
+        self, group: List[int], papers: List[Tuple[str, int]], template_tokens: int
+    ) -> Tuple[Dict[int, Dict[str, List[str]]], Optional[Exception]]:
+        """
+        One request for a group of papers
+
+        Returns the valid results by index, and the error of a request that
+        failed (timeout, API error or invalid JSON)
+        """
+        blocks = [f"=== PAPER P{i} ===\n{papers[i][0]}" for i in group]
+        prompt = BATCH_ENTITY_PROMPT.format(papers="\n\n".join(blocks))
+        prompt_tokens = template_tokens + sum(papers[i][1] + 10 for i in group)
+
+        self.logger.info(
+            f"Extracting entities of {len(group)} papers in one request (~{prompt_tokens} tokens)..."
+        )
+        try:
+            response = await self.rate_limiter.call(
+                self.model_name,
+                lambda: asyncio.wait_for(
+                    self.model.generate_content_async(
+                        prompt, generation_config=self.batch_entity_config
+                    ),
+                    timeout=120,  # larger prompts take longer than single papers
+                ),
+                text=prompt,
+                estimated_tokens=prompt_tokens,
+            )
+        except asyncio.TimeoutError as e:
+            self.logger.error("Batched Gemini entity extraction timed out after 120 seconds")
+            return {}, e
+        except Exception as e:
+            self.logger.error(f"Error in batched entity extraction: {e}")
+            return {}, e
+
+        error = None
+        try:
+            answer = results_by_id(parse_json_response(response.text))
+        except ValueError as e:
+            self.logger.error(f"Batched entity extraction returned invalid JSON: {e}")
+            answer = {}
+            error = EntityExtractionError(f"Invalid JSON answer: {e}")
+
+        found = {}
+        for i in group:
+            entities = validate_entities(answer.get(f"P{i}"))
+            if entities is not None:
+                found[i] = entities
+        self.entity_results += len(group)
+        self.entity_parse_failures += len(group) - len(found)
+        return found, error
+
+    def get_entity_stats(self) -> Dict[str, float]:
+        """Per-paper entity results and how many were missing or malformed"""
+        return {
+            "results": self.entity_results,
+            "parse_failures": self.entity_parse_failures,
+            "parse_failure_rate": (
+                self.entity_parse_failures / self.entity_results
+                if self.entity_results
+                else 0.0
+            ),
+            "structured_output": self.structured_output,
+        }
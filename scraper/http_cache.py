@@ -0,0 +1,192 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional
+
+
+@dataclass
+class CachedResponse:
+    """A cached page body plus the validators needed to revalidate it"""
+
+    url: str
+    digest: str
+    etag: str = ""
+    last_modified: str = ""
+    fetched_at: float = 0.0
+    last_used: float = 0.0
+    size: int = 0
+    body: str = ""
+
+
+class ResponseCache:
+    """
+    Persistent, content-addressed cache for fetched paper pages
+
+    Bodies are stored once per content hash under ``bodies/`` and each URL has
+    a small metadata entry under ``entries/`` pointing at its body. Entries
+    younger than ``ttl_seconds`` are served without touching the network;
+    older ones are revalidated with a conditional GET. When the bodies exceed
+    ``max_bytes`` the least recently used entries are evicted. An entry's
+    last use is the modification time of its file, touched on every hit.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = ".http_cache",
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_bytes: int = 1024 * 1024 * 1024,
+    ):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(__name__)
+
+        self.bodies_dir = os.path.join(cache_dir, "bodies")
+        self.entries_dir = os.path.join(cache_dir, "entries")
+        os.makedirs(self.bodies_dir, exist_ok=True)
+        os.makedirs(self.entries_dir, exist_ok=True)
+
+        self.total_bytes = sum(
+            entry.stat().st_size for entry in os.scandir(self.bodies_dir)
+        )
+
+    def _entry_path(self, url: str) -> str:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.entries_dir, f"{key}.json")
+
+    def _body_path(self, digest: str) -> str:
+        return os.path.join(self.bodies_dir, f"{digest}.html")
+
+    def _write_atomic(self, path: str, data: bytes) -> None:
+        """Write through a temp file so a crash never leaves a partial file"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _save_entry(self, entry: CachedResponse) -> None:
+        meta = asdict(entry)
+        meta.pop("body")
+        self._write_atomic(self._entry_path(entry.url), json.dumps(meta).encode())
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        """Return the cached response for url, or None if it is not cached"""
+        entry_path = self._entry_path(url)
+        try:
+            with open(entry_path, "r") as f:
+                entry = CachedResponse(**json.load(f))
+            with open(self._body_path(entry.digest), "r", encoding="utf-8") as f:
+                entry.body = f.read()
+            # Record the use without rewriting the entry
+            os.utime(entry_path)
+        except (OSError, ValueError, TypeError):
+            return None
+
+        entry.last_used = time.time()
+        return entry
+
+    def is_fresh(self, entry: CachedResponse) -> bool:
+        """True if the entry can be served without contacting the server"""
+        return time.time() - entry.fetched_at < self.ttl_seconds
+
+    def conditional_headers(self, entry: Optional[CachedResponse]) -> Dict[str, str]:
+        """Headers for a conditional GET revalidating entry"""
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def revalidated(self, entry: CachedResponse) -> CachedResponse:
+        """Mark entry as confirmed unchanged by the server (304 Not Modified)"""
+        entry.fetched_at = time.time()
+        self._save_entry(entry)
+        return entry
+
+    def store(
+        self, url: str, body: str, etag: str = "", last_modified: str = ""
+    ) -> CachedResponse:
+        """Cache a freshly downloaded body for url"""
+        data = body.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        body_path = self._body_path(digest)
+
+        if not os.path.exists(body_path):
+            self._write_atomic(body_path, data)
+            self.total_bytes += len(data)
+
+        now = time.time()
+        entry = CachedResponse(
+            url=url,
+            digest=digest,
+            etag=etag or "",
+            last_modified=last_modified or "",
+            fetched_at=now,
+            last_used=now,
+            size=len(data),
+            body=body,
+        )
+        self._save_entry(entry)
+
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+        return entry
+
+    def _evict(self) -> None:
+        """
+        Drop least recently used entries until the bodies fit the size budget
+
+        Bodies no entry refers to any more (e.g. the old body of a page whose
+        content changed) are deleted first.
+        """
+        entries = []
+        for dir_entry in os.scandir(self.entries_dir):
+            try:
+                with open(dir_entry.path, "r") as f:
+                    meta = json.load(f)
+                entries.append((meta, dir_entry.path, dir_entry.stat().st_mtime))
+            except (OSError, ValueError):
+                continue
+
+        referenced: Dict[str, int] = {}
+        for meta, _, _ in entries:
+            referenced[meta["digest"]] = referenced.get(meta["digest"], 0) + 1
+
+        orphans = 0
+        for dir_entry in os.scandir(self.bodies_dir):
+            digest, extension = os.path.splitext(dir_entry.name)
+            if extension != ".html" or digest in referenced:
+                continue
+            try:
+                size = dir_entry.stat().st_size
+                os.remove(dir_entry.path)
+            except OSError:
+                continue
+            self.total_bytes -= size
+            orphans += 1
+
+        entries.sort(key=lambda item: item[2])
+        evicted = 0
+        for meta, path, _ in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            os.remove(path)
+            evicted += 1
+            referenced[meta["digest"]] -= 1
+            if referenced[meta["digest"]] == 0:
+                body_path = self._body_path(meta["digest"])
+                try:
+                    self.total_bytes -= os.path.getsize(body_path)
+                    os.remove(body_path)
+                except OSError:
+                    pass
+
+        self.logger.info(
+            f"HTTP cache evicted {evicted} entries and {orphans} unreferenced "
+            f"bodies, {self.total_bytes} bytes in use"
+        )
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from typing import Dict, List, Optional, Sequence
+
+
+class LLMCache:
+    """
+    Persistent cache of parsed LLM results keyed by (model, prompt version, content hash)
+
+    Results (e.g. the entity dict of a paper) are stored as JSON in SQLite.
+    Bumping the prompt version of a template makes its old entries unreachable;
+    prune() removes them.
+    """
+
+    def __init__(self, path: str = ".llm_cache.sqlite"):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self.hits = 0
+        self.misses = 0
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (model, prompt_version, content_hash)
+            )
+            """)
+        self.conn.commit()
+
+    @staticmethod
+    def content_hash(content: str) -> str:
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get_many(
+        self, model: str, prompt_version: str, contents: Sequence[str]
+    ) -> List[Optional[Dict]]:
+        """Look up several contents at once; missing entries are None"""
+        hashes = [self.content_hash(content) for content in contents]
+        found: Dict[str, Dict] = {}
+
+        unique_hashes = list(dict.fromkeys(hashes))
+        # Stay below SQLite's host parameter limit
+        for start in range(0, len(unique_hashes), 500):
+            chunk = unique_hashes[start : start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"""
+                SELECT content_hash, result FROM results
+                WHERE model = ? AND prompt_version = ? AND content_hash IN ({placeholders})
+                """,
+                [model, prompt_version, *chunk],
+            )
+            for content_hash, result in rows:
+                found[content_hash] = json.loads(result)
+
+        results = [found.get(content_hash) for content_hash in hashes]
+        hits = sum(1 for result in results if result is not None)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def get(self, model: str, prompt_version: str, content: str) -> Optional[Dict]:
+        """Look up a single content"""
+        return self.get_many(model, prompt_version, [content])[0]
+
+    def put_many(
+        self,
+        model: str,
+        prompt_version: str,
+        contents: Sequence[str],
+        results: Sequence[Dict],
+    ) -> None:
+        """Store results for several contents"""
+        now = time.time()
+        rows = [
+            (model, prompt_version, self.content_hash(content), json.dumps(result), now)
+            for content, result in zip(contents, results)
+        ]
+        if not rows:
+            return
+        self.conn.executemany(
+            """
+            INSERT OR REPLACE INTO results
+                (model, prompt_version, content_hash, result, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+        self.conn.commit()
+
+    def put(self, model: str, prompt_version: str, content: str, result: Dict):
+        """Store the result for a single content"""
+        self.put_many(model, prompt_version, [content], [result])
+
+    def invalidate(self, prompt_version: str, model: Optional[str] = None) -> int:
+        """Delete the entries of a prompt version (of one model or all); returns the count"""
+        if model is None:
+            cursor = self.conn.execute(
+                "DELETE FROM results WHERE prompt_version = ?", (prompt_version,)
+            )
+        else:
+            cursor = self.conn.execute(
+                "DELETE FROM results WHERE prompt_version = ? AND model = ?",
+                (prompt_version, model),
+            )
+        self.conn.commit()
+        return cursor.rowcount
+
+    def prune(self, model: str, current_version: str) -> int:
+        """Delete a model's entries made with any other prompt version"""
+        cursor = self.conn.execute(
+            "DELETE FROM results WHERE model = ? AND prompt_version != ?",
+            (model, current_version),
+        )
+        self.conn.commit()
+        if cursor.rowcount:
+            self.logger.info(
+                f"LLM cache removed {cursor.rowcount} results of old prompt versions for {model}"
+            )
+        return cursor.rowcount
+
+    def get_stats(self) -> Dict[str, float]:
+        """Hit/miss counters for this run"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0],
+        }
+
+    def close(self) -> None:
+        self.conn.close()
@@ -4,21 +4,25 @@ Research Paper Automation Bot
 Processes research papers from a CSV file and populates a Convex database with structured data
 """
 
+import argparse
 import asyncio
-import json
 import logging
-import os
 import time
 from datetime import datetime
-from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Tuple
 
-import pandas as pd
-
-from config import load_config, PaperData
+from config import load_config
 from database import ConvexDatabase
+from embedding_cache import EmbeddingCache
+from llm_cache import LLMCache
 from extraction import PaperExtractor
+from http_cache import ResponseCache
+from metrics import MetricsExporter, get_metrics
+from pipeline import IngestionPipeline
 from progress_tracker import ProgressTracker
+from quota_store import QuotaStore
+from rate_limiter import get_rate_limiter, parse_rate_limits
+from sources import count_sources, iter_sources
 
 
 def setup_logging():
@@ -30,7 +34,47 @@ def setup_logging():
     )
 
 
-async def main():
+def parse_args():
+    parser = argparse.ArgumentParser(description="Research Paper Automation Bot")
+    parser.add_argument(
+        "--drain-retries",
+        action="store_true",
+        help="only run the due retries of failed papers (no new input rows)",
+    )
+    parser.add_argument(
+        "--wait",
+        action="store_true",
+        help="with --drain-retries: wait for later retries until the queue is empty",
+    )
+    return parser.parse_args()
+
+
+async def drain_retries(
+    pipeline: IngestionPipeline, progress_tracker: ProgressTracker, wait: bool
+) -> Tuple[int, int]:
+    """Run due retries (until none are left, if wait) and return the pipeline counts"""
+    logger = logging.getLogger(__name__)
+    processed_count = failed_count = 0
+    while True:
+        due = progress_tracker.due_retries()
+        if due:
+            logger.info(f"Retrying {len(due)} failed papers")
+            processed_count, failed_count = await pipeline.retry(due)
+            continue
+
+        next_at = progress_tracker.next_retry_at()
+        if next_at is None or not wait:
+            if next_at is not None:
+                logger.info(
+                    f"Next retry due at {datetime.fromtimestamp(next_at):%Y-%m-%d %H:%M:%S}"
+                )
+            return processed_count, failed_count
+        delay = max(0.0, next_at - time.time())
+        logger.info(f"Waiting {delay:.0f}s for the next retry")
+        await asyncio.sleep(delay)
+
+
+async def main(drain: bool = False, wait: bool = False):
     """Main function to run the automation bot"""
     setup_logging()
     logger = logging.getLogger(__name__)
@@ -40,108 +84,160 @@ async def main():
     # Load configuration
     config = load_config()
 
+    # The limiter is shared by every Gemini client using this key
+    quota_store = (
+        QuotaStore(config.quota_usage_path) if config.quota_usage_path else None
+    )
+    rate_limiter = get_rate_limiter(config.gemini_api_key)
+    rate_limiter.configure(
+        parse_rate_limits(config.rate_limits),
+        adaptive=config.adaptive_rate_limits,
+        max_factor=config.rate_limit_max_factor,
+        usage_store=quota_store,
+        reset_timezone=config.quota_reset_timezone,
+    )
+
     # Initialize components
+    embedding_cache = None
+    if config.embedding_cache_path:
+        embedding_cache = EmbeddingCache(
+            config.embedding_cache_path,
+            max_entries=config.embedding_cache_max_entries,
+        )
+    response_cache = None
+    if config.http_cache_dir:
+        response_cache = ResponseCache(
+            config.http_cache_dir,
+            ttl_seconds=config.http_cache_ttl,
+            max_bytes=config.http_cache_max_mb * 1024 * 1024,
+        )
+    llm_cache = LLMCache(config.llm_cache_path) if config.llm_cache_path else None
+    extractor = PaperExtractor(
+        config.gemini_api_key,
+        max_connections_per_host=config.http_max_connections_per_host,
+        max_keepalive_connections=config.http_max_keepalive_connections,
+        keepalive_expiry=config.http_keepalive_expiry,
+        http2=config.http2,
+        response_cache=response_cache,
+        parse_processes=config.parse_processes,
+        max_prompt_tokens=config.gemini_max_prompt_tokens,
+        exact_token_counts=config.exact_token_counts,
+        entity_batch_tokens=config.entity_batch_tokens,
+        llm_cache=llm_cache,
+        structured_output=config.structured_output,
+    )
     convex_db = ConvexDatabase(
-        config.convex_url, config.convex_deploy_key, config.gemini_api_key
+        config.convex_url,
+        config.convex_deploy_key,
+        config.gemini_api_key,
+        embedding_batch_size=config.embedding_batch_size,
+        embedding_batch_tokens=config.embedding_batch_tokens,
+        embedding_cache=embedding_cache,
+        embedding_chunk_tokens=config.embedding_chunk_tokens,
+        embedding_chunk_overlap=config.embedding_chunk_overlap,
+        storage_backend=config.storage_backend,
+        storage_path=config.storage_path,
+        extractor=extractor,
     )
-    extractor = PaperExtractor(config.gemini_api_key)
     progress_tracker = ProgressTracker()
+    metrics = get_metrics()
+    metrics_exporter = MetricsExporter(
+        metrics,
+        port=config.metrics_port,
+        host=config.metrics_host,
+        snapshot_path=config.metrics_snapshot_path,
+        snapshot_interval=config.metrics_snapshot_interval,
+    )
 
     try:
-        # Load CSV file
-        df = pd.read_csv(config.input_csv_path)
-        total_rows = len(df)
-
-        # Load progress
-        progress = progress_tracker.load_progress()
-        start_row = progress.get("last_processed_row", -1) + 1
-
-        logger.info(f"Total papers to process: {total_rows}")
-        logger.info(f"Starting from row: {start_row}")
-
-        # Process papers
-        processed_count = 0
-        failed_count = 0
-
-        for idx in range(start_row, total_rows):
-            try:
-                pub_id = (
-                    None  # Initialize pub_id to None at the start of each iteration
-                )
-                row = df.iloc[idx]
-                title = str(row.get("title", row.get("Title", "")))
-                link = str(row.get("link", row.get("Link", "")))
-
-                logger.info(f"Processing paper {idx + 1}/{total_rows}: {title[:50]}...")
-
-                logger.info(f"Starting to extract paper data...")
-                # Fetch and extract paper data
-                paper_data = await extractor.extract_paper_data(link, title)
-
-                logger.info(
-                    f"Paper data extraction completed, inserting into database..."
+        await metrics_exporter.start()
+
+        if drain:
+            # Failed papers only, each resumed at the stage it failed in
+            pipeline = IngestionPipeline(
+                extractor, convex_db, progress_tracker, config, total_rows=0
+            )
+            processed_count, failed_count = await drain_retries(
+                pipeline, progress_tracker, wait
+            )
+        else:
+            # Count the input rows (the rows themselves are streamed lazily)
+            total_rows = count_sources(config.input_csv_path, config.input_format)
+
+            progress_tracker.set_total_rows(total_rows or 0)
+
+            # Resume: skip the rows the ledger has as done (whatever order they
+            # finished in), dead or waiting for a retry; no records are built
+            # for rows before the first row to run, and later rows are looked
+            # up in the ledger one by one
+            start_row = progress_tracker.first_unfinished_row(settled=True)
+
+            logger.info(f"Total papers to process: {total_rows or 'unknown'}")
+            logger.info(
+                f"Starting from row: {start_row} ({progress_tracker.settled_count()} rows already "
+                f"done, dead or queued for retry)"
+            )
+
+            # Process papers through the concurrent stage pipeline
+            pipeline = IngestionPipeline(
+                extractor,
+                convex_db,
+                progress_tracker,
+                config,
+                total_rows=total_rows or 0,
+            )
+            processed_count, failed_count = await pipeline.run(
+                record
+                for record in iter_sources(
+                    config.input_csv_path, start_row, config.input_format
                 )
-                # Store in database
-                pub_id = await convex_db.insert_publication(paper_data)
-
-                logger.info(f"Publication inserted, now inserting embeddings...")
-                await convex_db.insert_embeddings(pub_id, paper_data, extractor)
-
-                logger.info(f"Updating processing status to completed...")
-                # Update processing status to completed
-                await convex_db.update_processing_status(pub_id, "completed")
-                logger.info(f"Processing status updated successfully")
-
-                # Update progress
-                progress_tracker.update_progress(idx, title, total_rows)
-                processed_count += 1
-                logger.info(f"Paper {idx + 1}/{total_rows} processed successfully")
-
-                # Minimal delay between papers since rate limiting is handled in individual API calls
-                await asyncio.sleep(0.1)
-
-                # Print progress updates every 10 papers
-                if (idx + 1) % 10 == 0:
-                    logger.info(f"Progress: {idx + 1}/{total_rows} papers processed")
-
-            except Exception as e:
-                logger.error(f"Error processing paper at row {idx}: {str(e)}")
-                failed_count += 1
-
-                # Update processing status to failed in database if pub_id is available
-                try:
-                    if pub_id is not None:
-                        await convex_db.update_processing_status(pub_id, "failed")
-                except Exception as db_error:
-                    logger.error(f"Error updating status for paper {idx}: {db_error}")
-
-                # Track failed paper
-                try:
-                    progress_tracker.add_failed_paper(
-                        idx, str(row.get("title", row.get("Title", ""))), str(e)
-                    )
-                except:
-                    progress_tracker.add_failed_paper(idx, title, str(e))
-
-                # Continue with next paper
-                continue
+                if not progress_tracker.is_settled(record.row_index)
+            )
 
         # Final summary
         logger.info(
-            f"Processing completed. Total processed: {processed_count}, Failed: {failed_count}"
+            f"Processing completed. Total processed: {processed_count}, Failed: {failed_count}, "
+            f"Already stored: {pipeline.skipped_count}, "
+            f"Moved to dead letters: {pipeline.dead_count}"
         )
+        logger.info(f"Ledger status: {progress_tracker.status_counts()}")
+        if progress_tracker.next_retry_at() is not None:
+            logger.info(
+                "Failed papers are queued for retry; run `python main.py --drain-retries`"
+            )
+        for model in rate_limiter.recorded_requests:
+            logger.info(
+                f"Gemini usage for {model}: {rate_limiter.get_usage_stats(model)}"
+            )
+        logger.info(f"Token counting: {rate_limiter.token_counter.get_stats()}")
+        logger.info(f"Entity extraction: {extractor.get_entity_stats()}")
+        if extractor.raw_text_chars:
+            logger.info(
+                f"Clean article text: {extractor.clean_text_chars}/{extractor.raw_text_chars} "
+                f"chars of fetched pages "
+                f"({extractor.clean_text_chars / extractor.raw_text_chars:.1%})"
+            )
+        logger.info(f"Run metrics:\n{metrics.summary_table()}")
         logger.info("Research Paper Automation Bot finished.")
 
     except Exception as e:
         logger.error(f"Critical error in main process: {str(e)}")
         raise
     finally:
-        # Close database connection
+        # Close database connection (and the extractor's pooled HTTP client)
         try:
             await convex_db.close()
         except:
             pass  # If closing fails, continue
+        progress_tracker.close()
+        await metrics_exporter.close()
+        if quota_store is not None:
+            quota_store.close()
+        if llm_cache is not None:
+            logger.info(f"LLM cache stats: {llm_cache.get_stats()}")
+            llm_cache.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    asyncio.run(main(drain=args.drain_retries, wait=args.wait))
@@ -0,0 +1,400 @@
+"""
+Run metrics: counters, gauges and latency histograms
+
+Metrics are kept in a process-wide registry (get_metrics()) and identified
+by a name plus labels, e.g. pipeline_stage_seconds{stage="fetch"}. The
+registry renders the Prometheus text format, a JSON snapshot and a summary
+table for the end of a run. MetricsExporter serves the first two over HTTP
+(/metrics and /metrics.json) and writes the snapshot to a file periodically.
+
+Everything runs on the event loop thread, so metrics need no locking.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Upper bounds (seconds) of the default latency buckets
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+    600.0,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    """Monotonically increasing count"""
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class Gauge:
+    """Value that goes up and down (e.g. jobs in flight)"""
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+
+class Histogram:
+    """Observations counted in cumulative buckets, plus their sum and maximum"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # One count per bucket and a last one for +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate of the q-quantile, interpolated within its bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """(upper bound, observations <= bound) including +Inf"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class _Family:
+    def __init__(self, kind: str, help_text: str):
+        self.kind = kind
+        self.help = help_text
+        self.children: Dict[Labels, Any] = {}
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(int(value)) if float(value).is_integer() else repr(value)
+
+
+class MetricsRegistry:
+    """Named, labeled counters, gauges and histograms"""
+
+    def __init__(self, namespace: str = "umbra"):
+        self.namespace = namespace
+        self.started_at = time.time()
+        self._families: Dict[str, _Family] = {}
+
+    def _get(self, kind: str, name: str, help_text: str, labels: Dict, factory):
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = _Family(kind, help_text)
+        elif family.kind != kind:
+            raise ValueError(f"Metric {name} is a {family.kind}, not a {kind}")
+        key = tuple(sorted((label, str(value)) for label, value in labels.items()))
+        metric = family.children.get(key)
+        if metric is None:
+            metric = family.children[key] = factory()
+        return metric
+
+    def counter(self, name: str, help_text: str = "", **labels) -> Counter:
+        return self._get("counter", name, help_text, labels, Counter)
+
+    def gauge(self, name: str, help_text: str = "", **labels) -> Gauge:
+        return self._get("gauge", name, help_text, labels, Gauge)
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str = "",
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        **labels,
+    ) -> Histogram:
+        return self._get(
+            "histogram", name, help_text, labels, lambda: Histogram(buckets)
+        )
+
+    @contextmanager
+    def timer(self, name: str, help_text: str = "", **labels) -> Iterator[None]:
+        """Observe the duration of the with-block in a histogram"""
+        histogram = self.histogram(name, help_text, **labels)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    def reset(self) -> None:
+        self._families.clear()
+        self.started_at = time.time()
+
+    def _full_name(self, name: str) -> str:
+        return f"{self.namespace}_{name}" if self.namespace else name
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format (0.0.4)"""
+        lines = []
+        for name, family in sorted(self._families.items()):
+            full_name = self._full_name(name)
+            if family.help:
+                lines.append(f"# HELP {full_name} {family.help}")
+            lines.append(f"# TYPE {full_name} {family.kind}")
+            for labels, metric in sorted(family.children.items()):
+                if family.kind != "histogram":
+                    lines.append(
+                        f"{full_name}{_format_labels(labels)} {_format_number(metric.value)}"
+                    )
+                    continue
+                for bound, count in metric.cumulative():
+                    le = f'le="{_format_number(bound)}"'
+                    lines.append(
+                        f"{full_name}_bucket{_format_labels(labels, le)} {count}"
+                    )
+                lines.append(
+                    f"{full_name}_sum{_format_labels(labels)} {_format_number(metric.sum)}"
+                )
+                lines.append(
+                    f"{full_name}_count{_format_labels(labels)} {metric.count}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-serializable view of all metrics (histograms with quantiles)"""
+        metrics: Dict[str, List[Dict[str, Any]]] = {}
+        for name, family in sorted(self._families.items()):
+            entries = []
+            for labels, metric in sorted(family.children.items()):
+                entry: Dict[str, Any] = {"labels": dict(labels)}
+                if family.kind == "histogram":
+                    entry.update(
+                        count=metric.count,
+                        sum=round(metric.sum, 6),
+                        max=round(metric.max, 6),
+                        p50=round(metric.quantile(0.5), 6),
+                        p95=round(metric.quantile(0.95), 6),
+                        p99=round(metric.quantile(0.99), 6),
+                    )
+                else:
+                    entry["value"] = metric.value
+                entries.append(entry)
+            metrics[name] = entries
+        return {
+            "timestamp": time.time(),
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "metrics": metrics,
+        }
+
+    def summary_table(self) -> str:
+        """
+        Plain-text table of every histogram, followed by counters and gauges
+
+        Metrics that stayed at zero are left out.
+        """
+        rows = [("histogram", "count", "mean", "p50", "p95", "max", "total")]
+        values = []
+        for name, family in sorted(self._families.items()):
+            for labels, metric in sorted(family.children.items()):
+                label = name + _format_labels(labels)
+                if family.kind != "histogram":
+                    if metric.value:
+                        values.append(
+                            f"{label} = {_format_number(round(metric.value, 3))}"
+                        )
+                    continue
+                if not metric.count:
+                    continue
+                mean = metric.sum / metric.count
+                rows.append(
+                    (
+                        label,
+                        str(metric.count),
+                        f"{mean:.3f}",
+                        f"{metric.quantile(0.5):.3f}",
+                        f"{metric.quantile(0.95):.3f}",
+                        f"{metric.max:.3f}",
+                        f"{metric.sum:.1f}",
+                    )
+                )
+
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        lines = [
+            "  ".join(
+                cell.ljust(width) if i == 0 else cell.rjust(width)
+                for i, (cell, width) in enumerate(zip(row, widths))
+            )
+            for row in rows
+        ]
+        lines.insert(1, "-" * len(lines[0]))
+        return "\n".join(lines + values)
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Return the process-wide metrics registry"""
+    return _registry
+
+
+class MetricsExporter:
+    """
+    Serves a registry over HTTP and/or writes periodic JSON snapshots
+
+    Args:
+        registry: Metrics to export
+        port: Port of the HTTP endpoint (0 disables it)
+        host: Interface to listen on
+        snapshot_path: File the JSON snapshot is written to (empty disables it)
+        snapshot_interval: Seconds between snapshots
+    """
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        port: int = 0,
+        host: str = "127.0.0.1",
+        snapshot_path: str = "",
+        snapshot_interval: float = 30.0,
+    ):
+        self.registry = registry
+        self.port = port
+        self.host = host
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.logger = logging.getLogger(__name__)
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._snapshot_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self.port:
+            self._server = await asyncio.start_server(
+                self._handle, self.host, self.port
+            )
+            self.logger.info(
+                f"Serving metrics on http://{self.host}:{self.port}/metrics (and /metrics.json)"
+            )
+        if self.snapshot_path:
+            self._snapshot_task = asyncio.create_task(self._write_snapshots())
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request_line = await reader.readline()
+            # Skip the request headers
+            while (await reader.readline()).strip():
+                pass
+            parts = request_line.decode("latin-1").split()
+            path = parts[1].split("?", 1)[0] if len(parts) > 1 else ""
+
+            if path == "/metrics":
+                status = "200 OK"
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+                body = self.registry.render_prometheus().encode()
+            elif path == "/metrics.json":
+                status = "200 OK"
+                content_type = "application/json"
+                body = json.dumps(self.registry.snapshot()).encode()
+            else:
+                status = "404 Not Found"
+                content_type = "text/plain"
+                body = b"Not found\n"
+
+            writer.write(
+                (
+                    f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+                ).encode()
+                + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def write_snapshot(self) -> None:
+        """Write the JSON snapshot (atomically) to snapshot_path"""
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.registry.snapshot(), f, indent=2)
+        os.replace(tmp_path, self.snapshot_path)
+
+    async def _write_snapshots(self) -> None:
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                self.write_snapshot()
+            except OSError as e:
+                self.logger.warning(f"Could not write metrics snapshot: {e}")
+
+    async def close(self) -> None:
+        """Stop serving and write a final snapshot"""
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            self._snapshot_task = None
+            try:
+                self.write_snapshot()
+            except OSError as e:
+                self.logger.warning(f"Could not write metrics snapshot: {e}")
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
@@ -0,0 +1,66 @@
+"""
+Natural keys identifying a paper across runs
+
+A paper is identified by its PubMed Central ID, taken from the link, and by
+its DOI, taken from the link (doi.org URLs) or from the parsed page. Keys are
+normalized strings such as "pmc:PMC4136787" or "doi:10.1038/npjmgrav.2015.12",
+so the same paper listed twice, or processed again in a later run, maps to
+the same stored publication. A link carrying neither is identified by a hash
+of the normalized link ("url:<sha1>"), so retries of such papers update the
+publication stored by the failed attempt instead of adding another one.
+"""
+
+import hashlib
+import re
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+_PMC_ID = re.compile(r"\bPMC(\d+)", re.IGNORECASE)
+# DOIs are "10.<registrant>/<suffix>"; the suffix ends at whitespace or quotes
+_DOI = re.compile(r"\b(10\.\d{4,9}/[^\s\"'<>]+)")
+
+
+def pmc_key(link: str) -> Optional[str]:
+    """Key of the PMC ID in a link (e.g. .../pmc/articles/PMC4136787/)"""
+    match = _PMC_ID.search(link or "")
+    return f"pmc:PMC{match.group(1)}" if match else None
+
+
+def doi_key(doi: str) -> Optional[str]:
+    """Key of a DOI given bare, as "doi:..." / "DOI: ..." or as a doi.org URL"""
+    match = _DOI.search(doi or "")
+    if not match:
+        return None
+    # Trailing punctuation belongs to the surrounding sentence, not the DOI
+    return "doi:" + match.group(1).rstrip(".,;)]").lower()
+
+
+def url_key(link: str) -> Optional[str]:
+    """Key of the link itself (host case, fragment and trailing slash ignored)"""
+    link = (link or "").strip()
+    if not link:
+        return None
+    parts = urlsplit(link)
+    normalized = parts._replace(
+        scheme=parts.scheme.lower(), netloc=parts.netloc.lower(), fragment=""
+    ).geturl()
+    return "url:" + hashlib.sha1(normalized.rstrip("/").encode("utf-8")).hexdigest()
+
+
+def link_keys(link: str) -> List[str]:
+    """Keys known before the page is fetched (the link's own key if no other)"""
+    keys = [key for key in (pmc_key(link), doi_key(link)) if key]
+    if not keys:
+        key = url_key(link)
+        if key:
+            keys.append(key)
+    return keys
+
+
+def paper_keys(link: str, doi: str = "") -> List[str]:
+    """All keys of a paper: those of its link, then that of its DOI"""
+    keys = link_keys(link)
+    key = doi_key(doi)
+    if key and key not in keys:
+        keys.append(key)
+    return keys
@@ -0,0 +1,249 @@
+"""
+HTML parsing for paper pages
+
+Kept free of API clients and event-loop state so parse_paper_html can run in
+ProcessPoolExecutor workers; it returns only the compact extracted dict.
+"""
+
+import re
+from typing import Dict
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+from article_text import extract_article_text
+from section_index import SectionIndex
+
+try:
+    import lxml  # noqa: F401
+
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+# Section name -> (heading keywords, fallback CSS selectors)
+SECTION_RULES = {
+    "methods": (
+        [
+            "methods",
+            "method",
+            "material",
+            "materials",
+            "materials and methods",
+            "methodology",
+        ],
+        [
+            ".methods",
+            ".method",
+            "#methods",
+            "#method",
+            '[id*="methods"]',
+            '[id*="method"]',
+        ],
+    ),
+    "results": (
+        ["results", "result", "findings", "outcome", "outcomes"],
+        [
+            ".results",
+            "#results",
+            '[id*="results"]',
+            ".result",
+            "#result",
+            '[id*="result"]',
+        ],
+    ),
+    "discussion": (
+        ["discussion", "discuss", "interpretation"],
+        [".discussion", "#discussion", '[id*="discussion"]'],
+    ),
+    "conclusions": (
+        ["conclusion", "conclusions", "summary", "concluding", "final remarks"],
+        [
+            ".conclusion",
+            ".conclusions",
+            "#conclusion",
+            "#conclusions",
+            '[id*="conclusion"]',
+            '[id*="conclusions"]',
+        ],
+    ),
+}
+
+
+def parse_paper_html(content: str, link: str) -> Dict:
+    """Parse the HTML content to extract structured data"""
+    soup = BeautifulSoup(content, HTML_PARSER)
+
+    # Extract title
+    title = ""
+    title_tag = soup.find(["h1", "h2"], class_=re.compile(r".*title.*", re.I))
+    if title_tag:
+        title = title_tag.get_text().strip()
+    else:
+        title_tag = soup.find("title")
+        if title_tag:
+            title = title_tag.get_text().strip()
+
+    # Extract authors
+    authors = []
+    # Try to find authors using common selectors
+    author_selectors = [
+        'meta[name="citation_author"]',
+        'meta[name="authors"]',
+        ".author",
+        ".authors",
+        ".citation-author",
+        '[data-test-id="author-name"]',
+    ]
+
+    for selector in author_selectors:
+        author_tags = soup.select(selector)
+        if author_tags:
+            authors = [tag.get_text().strip() for tag in author_tags]
+            break
+
+    # Extract abstract
+    abstract = ""
+    abstract_selectors = [
+        ".abstract",
+        ".Abstract",
+        "#abstract",
+        '[id*="abstract"]',
+        ".abstract-text",
+        ".abstract-title",
+    ]
+
+    for selector in abstract_selectors:
+        abstract_tag = soup.select_one(selector)
+        if abstract_tag:
+            # Clean up abstract text
+            abstract = abstract_tag.get_text().strip()
+            # Remove "Abstract" heading if present
+            abstract = re.sub(r"^\s*Abstract\s*", "", abstract, flags=re.IGNORECASE)
+            break
+
+    # Extract methods/results/discussion/conclusions from a single-pass section index
+    index = SectionIndex(
+        soup,
+        [selector for _, selectors in SECTION_RULES.values() for selector in selectors],
+    )
+    sections = {
+        name: index.find(keywords, selectors)
+        for name, (keywords, selectors) in SECTION_RULES.items()
+    }
+
+    # Extract publication date
+    pub_date = ""
+    date_selectors = [
+        'meta[name="citation_publication_date"]',
+        'meta[property*="date"]',
+        ".pub-date",
+        ".publication-date",
+        ".article-date",
+    ]
+
+    for selector in date_selectors:
+        date_tag = soup.select_one(selector)
+        if date_tag:
+            pub_date = date_tag.get("content") or date_tag.get_text().strip()
+            break
+
+    # Extract DOI
+    doi = ""
+    doi_selectors = [
+        'meta[name="citation_doi"]',
+        'meta[name="doi"]',
+        ".doi",
+        ".DOI",
+        '[id*="doi"]',
+    ]
+
+    for selector in doi_selectors:
+        doi_tag = soup.select_one(selector)
+        if doi_tag:
+            doi = doi_tag.get("content") or doi_tag.get_text().strip()
+            break
+
+    # Extract keywords
+    keywords = []
+    keyword_selectors = [
+        'meta[name="keywords"]',
+        ".keyword",
+        ".keywords",
+        ".kwd",
+        ".Keyword",
+    ]
+
+    for selector in keyword_selectors:
+        keyword_tag = soup.select_one(selector)
+        if keyword_tag:
+            content = keyword_tag.get("content") or keyword_tag.get_text()
+            keywords = [k.strip() for k in content.split(",") if k.strip()]
+            # Clean up keywords to remove extra text
+            clean_keywords = []
+            for keyword in keywords:
+                # Remove common prefixes like "Keywords:"
+                clean_keyword = re.sub(r"^[Kk]eywords:\s*", "", keyword)
+                if clean_keyword.strip():
+                    clean_keywords.append(clean_keyword.strip())
+            keywords = clean_keywords
+            break
+
+    # Extract PDF URL if available
+    pdf_url = ""
+    pdf_selectors = [
+        'a[href$=".pdf"]',
+        'a[title*="PDF"]',
+        'a[title*="pdf"]',
+        'a[href*="pdf"]',
+    ]
+
+    for selector in pdf_selectors:
+        pdf_tag = soup.select_one(selector)
+        if pdf_tag:
+            href = pdf_tag.get("href")
+            if href:
+                pdf_url = urljoin(link, href)
+                break
+
+    # Extract citation and view counts (specific to NCBI PubMed)
+    citation_count = 0
+    view_count = 0
+
+    # Look for citation count - avoiding :contains selector due to deprecation
+    citation_selectors = [
+        ".citation-count",
+        ".cited-by",
+        '[data-test-id*="cited"]',
+    ]
+
+    for selector in citation_selectors:
+        citation_tag = soup.select_one(selector)
+        if citation_tag:
+            text = citation_tag.get_text()
+            match = re.search(r"\d+", text)
+            if match:
+                citation_count = int(match.group())
+                break
+
+    # Article text without page chrome (for the Gemini prompt and embeddings);
+    # this strips elements from the soup, so it runs last
+    clean_text, text_sections = extract_article_text(soup)
+
+    return {
+        "title": title,
+        "authors": authors,
+        "abstract": abstract,
+        "methods": sections["methods"],
+        "results": sections["results"],
+        "discussion": sections["discussion"],
+        "conclusions": sections["conclusions"],
+        "publication_date": pub_date,
+        "doi": doi,
+        "pdf_url": pdf_url,
+        "keywords": keywords,
+        "citation_count": citation_count,
+        "view_count": view_count,
+        "clean_text": clean_text,
+        "text_sections": text_sections,
+    }
@@ -0,0 +1,505 @@
+"""
+Concurrent ingestion pipeline
+Runs fetch -> parse -> entities -> embeddings -> persist as independent stages,
+each with its own bounded queue and worker pool
+"""
+
+import asyncio
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import Configuration, PaperData
+from database import ConvexDatabase
+from extraction import PaperExtractor
+from metrics import get_metrics
+from paper_keys import link_keys, paper_keys
+from progress_tracker import ProgressTracker
+from rate_limiter import QuotaExhaustedError
+from retry_queue import RetryPolicy, classify_failure, parse_backoff
+
+
+@dataclass
+class PaperJob:
+    """State of a single CSV row as it moves through the pipeline stages"""
+
+    row: int
+    title: str
+    link: str
+    content: str = ""
+    paper_data: Optional[PaperData] = None
+    # Stage the job enters the pipeline at (retries resume the failed stage)
+    start_stage: str = "fetch"
+    failed: bool = False
+    # Natural keys (PMC ID, DOI) and whether the paper is already stored
+    keys: List[str] = field(default_factory=list)
+    already_stored: bool = False
+    embeddings: Dict[str, List[float]] = field(default_factory=dict)
+    # (start, end) of each embedded fullText#<n> passage in the clean text
+    offsets: Dict[str, List[int]] = field(default_factory=dict)
+    pub_id: Optional[str] = None
+    # perf_counter() when the job entered the pipeline
+    started_at: float = 0.0
+
+
+@dataclass
+class Stage:
+    """
+    A pipeline stage: a handler run by a fixed number of workers
+
+    Batched stages receive a list of up to batch_size jobs that were already
+    waiting in the queue, instead of a single job.
+    """
+
+    name: str
+    handler: Callable[..., Awaitable[None]]
+    workers: int
+    batch_size: int = 1
+    batched: bool = False
+
+
+class IngestionPipeline:
+    """
+    Bounded-concurrency pipeline for processing papers
+
+    Every stage reads from its own queue. Queues are bounded by
+    ``config.queue_size`` so a fast stage (e.g. fetch) blocks instead of
+    buffering an unbounded number of page bodies in memory. Each row's status
+    and current stage are recorded in the progress ledger as it moves along.
+
+    Papers whose natural key (PMC ID from the link, or DOI) belongs to a
+    completed publication are skipped: before fetching when the link carries
+    the key, else right after parsing, before any Gemini request.
+
+    A failed job leaves the pipeline and goes to the retry queue in the ledger,
+    with its failure class, next attempt time and a checkpoint of its earlier
+    stage outputs; retry() runs such jobs again from the failed stage.
+
+    Stage latency, queue depth, jobs in flight and per-paper outcomes are
+    recorded in the metrics registry (see metrics.py).
+    """
+
+    def __init__(
+        self,
+        extractor: PaperExtractor,
+        convex_db: ConvexDatabase,
+        progress_tracker: ProgressTracker,
+        config: Configuration,
+        total_rows: int,
+    ):
+        self.extractor = extractor
+        self.convex_db = convex_db
+        self.progress_tracker = progress_tracker
+        self.queue_size = max(1, config.queue_size)
+        self.total_rows = total_rows
+        # Streamed sources (e.g. stdin) have no known row count
+        self.total_label = str(total_rows) if total_rows else "?"
+        self.skip_existing = config.skip_existing
+        self.retry_policy = RetryPolicy(
+            config.retry_max_attempts, parse_backoff(config.retry_backoff)
+        )
+        self.logger = logging.getLogger(__name__)
+        self.metrics = get_metrics()
+
+        self.stages = [
+            Stage("fetch", self._fetch, config.fetch_workers),
+            Stage("parse", self._parse, config.parse_workers),
+            Stage(
+                "entities",
+                self._entities,
+                config.entity_workers,
+                batch_size=max(1, config.entity_paper_batch),
+                batched=True,
+            ),
+            Stage(
+                "embeddings",
+                self._embeddings,
+                config.embedding_workers,
+                batch_size=max(1, config.embedding_paper_batch),
+                batched=True,
+            ),
+            Stage("persist", self._persist, config.persist_workers),
+        ]
+
+        self.processed_count = 0
+        self.failed_count = 0
+        self.skipped_count = 0
+        self.dead_count = 0
+
+    async def run(self, rows: Iterable[Tuple[int, str, str]]) -> Tuple[int, int]:
+        """
+        Process (row_index, title, link) records through all stages
+
+        Returns:
+            Tuple of (processed_count, failed_count)
+        """
+        return await self._run(
+            PaperJob(row=row, title=title, link=link) for row, title, link in rows
+        )
+
+    async def retry(self, retries: Iterable[Dict[str, Any]]) -> Tuple[int, int]:
+        """
+        Run failed rows (ProgressTracker.due_retries records) again, each
+        from the stage it failed in
+
+        Returns:
+            Tuple of (processed_count, failed_count)
+        """
+        return await self._run(self.job_from_retry(retry) for retry in retries)
+
+    async def _run(self, jobs: Iterable[PaperJob]) -> Tuple[int, int]:
+        stage_index = {stage.name: i for i, stage in enumerate(self.stages)}
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        workers: List[List[asyncio.Task]] = []
+
+        for i, stage in enumerate(self.stages):
+            out_queue = queues[i + 1] if i + 1 < len(queues) else None
+            workers.append(
+                [
+                    asyncio.create_task(self._worker(stage, queues[i], out_queue))
+                    for _ in range(max(1, stage.workers))
+                ]
+            )
+
+        async def feed() -> None:
+            for job in jobs:
+                job.started_at = time.perf_counter()
+                self.progress_tracker.start_row(
+                    job.row, job.title, job.link, job.start_stage
+                )
+                # Blocks while the stage's queue is full (backpressure)
+                await queues[stage_index[job.start_stage]].put(job)
+
+            # Drain stage by stage: once a stage's workers exit, nothing more
+            # can arrive in the next queue, so it can be closed in turn
+            for queue, stage_workers in zip(queues, workers):
+                for _ in stage_workers:
+                    await queue.put(None)
+                await asyncio.gather(*stage_workers)
+
+        # A worker that dies would leave the producer blocked on a full queue,
+        # so the producer and all workers are watched together
+        tasks = [asyncio.create_task(feed())]
+        tasks.extend(task for stage_workers in workers for task in stage_workers)
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        return self.processed_count, self.failed_count
+
+    async def _worker(
+        self,
+        stage: Stage,
+        in_queue: asyncio.Queue,
+        out_queue: Optional[asyncio.Queue],
+    ) -> None:
+        """Run a stage handler over jobs until the shutdown sentinel arrives"""
+        latency = self.metrics.histogram(
+            "pipeline_stage_seconds",
+            "Time per stage handler call (one job, or one batch for batched stages)",
+            stage=stage.name,
+        )
+        in_flight = self.metrics.gauge(
+            "pipeline_in_flight", "Jobs being handled by a stage", stage=stage.name
+        )
+        queue_depth = self.metrics.gauge(
+            "pipeline_queue_depth", "Jobs waiting in a stage's queue", stage=stage.name
+        )
+        succeeded = self.metrics.counter(
+            "pipeline_stage_jobs_total",
+            "Jobs handled per stage and outcome",
+            stage=stage.name,
+            outcome="ok",
+        )
+        failed = self.metrics.counter(
+            "pipeline_stage_jobs_total", stage=stage.name, outcome="failed"
+        )
+
+        while True:
+            job = await in_queue.get()
+            if job is None:
+                queue_depth.set(in_queue.qsize())
+                return
+
+            # Batch stages take whatever else is already queued, without waiting
+            jobs = [job]
+            shutdown = False
+            while len(jobs) < stage.batch_size:
+                try:
+                    next_job = in_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if next_job is None:
+                    shutdown = True
+                    break
+                jobs.append(next_job)
+
+            queue_depth.set(in_queue.qsize())
+            in_flight.inc(len(jobs))
+            start = time.perf_counter()
+            try:
+                self.progress_tracker.set_stage([job.row for job in jobs], stage.name)
+                if stage.batched:
+                    await stage.handler(jobs)
+                else:
+                    await stage.handler(job)
+            except Exception as e:
+                # Jobs of a batch that failed on their own are already handled
+                for failed_job in jobs:
+                    if not failed_job.failed:
+                        await self._record_failure(failed_job, e, stage.name)
+            finally:
+                latency.observe(time.perf_counter() - start)
+                in_flight.dec(len(jobs))
+
+            failures = sum(1 for finished_job in jobs if finished_job.failed)
+            failed.inc(failures)
+            succeeded.inc(len(jobs) - failures)
+
+            if out_queue is not None:
+                for finished_job in jobs:
+                    # Jobs of a batch may have failed on their own
+                    if not finished_job.failed:
+                        await out_queue.put(finished_job)
+
+            if shutdown:
+                return
+
+    async def _fetch(self, job: PaperJob) -> None:
+        """Fetch the raw page content"""
+        self.logger.info(
+            f"Processing paper {job.row + 1}/{self.total_label}: {job.title[:50]}..."
+        )
+        job.keys = link_keys(job.link)
+        if await self._already_stored(job):
+            return
+        job.content = await self.extractor.fetch_paper_content(job.link)
+
+    async def _parse(self, job: PaperJob) -> None:
+        """Parse the fetched content into PaperData"""
+        if job.already_stored:
+            return
+        job.paper_data = await self.extractor.build_paper_data_async(
+            job.content, job.link, job.title
+        )
+
+        # The DOI is only known now; check again before spending Gemini quota
+        keys = paper_keys(job.link, job.paper_data.doi)
+        if keys != job.keys:
+            job.keys = keys
+            await self._already_stored(job)
+
+    async def _already_stored(self, job: PaperJob) -> bool:
+        """Mark the job as already stored if a completed publication has its key"""
+        if not self.skip_existing or not job.keys:
+            return False
+        existing = await self.convex_db.find_publication(job.keys)
+        if existing is None or existing[1] != "completed":
+            return False
+        self.logger.info(
+            f"Paper at row {job.row} is already stored as {existing[0]}, skipping"
+        )
+        job.already_stored = True
+        job.pub_id = existing[0]
+        job.content = ""
+        return True
+
+    async def _entities(self, jobs: List[PaperJob]) -> None:
+        """Run Gemini entity extraction, several papers per request"""
+        extracted = [job for job in jobs if not job.already_stored]
+        if extracted:
+            errors = await self.extractor.apply_entities_batch(
+                [job.paper_data for job in extracted],
+                [job.content for job in extracted],
+            )
+            # Papers without a valid result are retried, not stored without entities
+            for job, error in zip(extracted, errors):
+                if error is not None:
+                    await self._record_failure(job, error, "entities")
+        # Later stages only use paper_data; drop the jobs' copies of the page
+        for job in jobs:
+            job.content = ""
+
+    async def _embeddings(self, jobs: List[PaperJob]) -> None:
+        """Generate section embeddings, sharing batch requests across papers"""
+        jobs = [job for job in jobs if not job.already_stored]
+        if not jobs:
+            return
+        results = await self.convex_db.generate_embeddings_batch(
+            [job.paper_data for job in jobs]
+        )
+
+        for job, (embeddings, offsets) in zip(jobs, results):
+            # Failed requests raise (and fail the whole batch in the worker);
+            # an all-zero vector is a broken response, not an embedding
+            missing = [name for name, vector in embeddings.items() if not any(vector)]
+            if missing:
+                await self._record_failure(
+                    job,
+                    RuntimeError(f"No embeddings for {len(missing)} sections"),
+                    "embeddings",
+                )
+                continue
+            job.embeddings = embeddings
+            job.offsets = {name: list(span) for name, span in offsets.items()}
+
+    async def _persist(self, job: PaperJob) -> None:
+        """Store the publication and its embeddings, then mark it completed"""
+        logger = self.logger
+        if job.already_stored:
+            self.skipped_count += 1
+            self.progress_tracker.mark_done(job.row, job.title)
+            self._row_finished(job, "already_stored")
+            return
+
+        logger.info(f"Paper data extraction completed, inserting into database...")
+        job.pub_id = await self.convex_db.insert_publication(job.paper_data, job.keys)
+
+        logger.info(f"Publication inserted, now inserting embeddings...")
+        await self.convex_db.save_embeddings(job.pub_id, job.embeddings, job.offsets)
+
+        logger.info(f"Updating processing status to completed...")
+        await self.convex_db.update_processing_status(job.pub_id, "completed")
+        logger.info(f"Processing status updated successfully")
+
+        self.processed_count += 1
+        self.progress_tracker.mark_done(job.row, job.title)
+        self._row_finished(job, "processed")
+        logger.info(f"Paper {job.row + 1}/{self.total_label} processed successfully")
+
+    @staticmethod
+    def _checkpoint(job: PaperJob) -> str:
+        """Outputs of the stages a failed job completed, to resume it with"""
+        state: Dict[str, Any] = {"keys": job.keys}
+        if job.paper_data is None:
+            # Fetched page of a job that failed to parse
+            state["content"] = job.content
+        else:
+            state["paper_data"] = asdict(job.paper_data)
+        if job.embeddings:
+            state["embeddings"] = job.embeddings
+            state["offsets"] = job.offsets
+        return json.dumps(state)
+
+    def job_from_retry(self, retry: Dict[str, Any]) -> PaperJob:
+        """Job resuming a failed row at its failed stage, if its checkpoint allows"""
+        state = json.loads(retry["checkpoint"] or "{}")
+        paper_data = state.get("paper_data")
+        if paper_data is not None:
+            paper_data = PaperData(**paper_data)
+        content = state.get("content", "")
+
+        stage = retry["stage"] or "fetch"
+        if stage in ("entities", "embeddings", "persist") and paper_data is None:
+            stage = "fetch"
+        if stage == "parse" and not content:
+            stage = "fetch"
+        if stage == "persist" and "offsets" not in state:
+            # Checkpoints without passage offsets: embed again rather than
+            # store passages that cannot be located in the text
+            stage = "embeddings"
+        # A resumed entities stage extracts from paper_data.clean_text
+
+        return PaperJob(
+            row=retry["row"],
+            title=retry["title"],
+            link=retry["link"],
+            content=content,
+            paper_data=paper_data,
+            start_stage=stage,
+            keys=state.get("keys", []),
+            embeddings=state.get("embeddings", {}),
+            offsets=state.get("offsets", {}),
+        )
+
+    async def _record_failure(
+        self, job: PaperJob, error: Exception, stage: str
+    ) -> None:
+        """
+        _handle_failure that cannot raise: if the failure cannot be written to
+        the ledger (e.g. the database is locked), the row is left in progress
+        there, to be run again by the next run, and the worker carries on
+        """
+        try:
+            await self._handle_failure(job, error, stage)
+        except Exception as ledger_error:
+            job.failed = True
+            self.logger.error(
+                f"Could not record the failure of row {job.row}: {ledger_error}"
+            )
+
+    async def _handle_failure(
+        self, job: PaperJob, error: Exception, stage: str
+    ) -> None:
+        """Per-row error handling: mark the publication failed and queue a retry"""
+        self.logger.error(
+            f"Error processing paper at row {job.row} ({stage}): {str(error)}"
+        )
+        job.failed = True
+        self.failed_count += 1
+
+        # Update processing status to failed in database if pub_id is available
+        try:
+            if job.pub_id is not None:
+                await self.convex_db.update_processing_status(job.pub_id, "failed")
+        except Exception as db_error:
+            self.logger.error(f"Error updating status for paper {job.row}: {db_error}")
+
+        # Queue a retry of the failed stage, or give up after too many attempts
+        failure_class = classify_failure(stage, error)
+        attempts = self.progress_tracker.attempts(job.row)
+        checkpoint = self._checkpoint(job)
+        outcome = "failed"
+        # Used-up daily quota is not the paper's fault: park it until the reset
+        parked_until = (
+            error.retry_at if isinstance(error, QuotaExhaustedError) else None
+        )
+        if parked_until is None and self.retry_policy.is_exhausted(attempts):
+            outcome = "dead"
+            self.dead_count += 1
+            self.logger.warning(
+                f"Paper at row {job.row} failed {attempts} times, moved to dead letters"
+            )
+            self.progress_tracker.mark_dead(
+                job.row, job.title, str(error), stage, failure_class, checkpoint
+            )
+        else:
+            if parked_until is not None:
+                delay = max(0.0, parked_until - time.time())
+            else:
+                delay = self.retry_policy.delay(failure_class, attempts)
+            self.logger.info(
+                f"Retrying {stage} of row {job.row} ({failure_class}) in {delay:.0f}s"
+            )
+            self.progress_tracker.mark_failed(
+                job.row,
+                job.title,
+                str(error),
+                stage,
+                failure_class,
+                retry_at=time.time() + delay,
+                checkpoint=checkpoint,
+            )
+        job.content = ""
+        self._row_finished(job, outcome)
+
+    def _row_finished(self, job: PaperJob, outcome: str) -> None:
+        self.metrics.counter(
+            "pipeline_papers_total", "Papers leaving the pipeline", outcome=outcome
+        ).inc()
+        self.metrics.histogram(
+            "pipeline_paper_seconds",
+            "Time from entering the pipeline to leaving it",
+            outcome=outcome,
+        ).observe(time.perf_counter() - job.started_at)
+        finished = self.processed_count + self.failed_count + self.skipped_count
+        # Print progress updates every 10 papers
+        if finished % 10 == 0:
+            self.logger.info(f"Progress: {finished} papers finished this run")
@@ -1,54 +1,426 @@
 import json
+import logging
 import os
+import sqlite3
+import time
 from datetime import datetime
-from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, List, Optional, Set
 
 
 class ProgressTracker:
-    """Handles progress tracking for the automation bot"""
-    
-    def __init__(self, progress_file: str = "progress.json"):
-        self.progress_file = progress_file
-    
-    def load_progress(self) -> Dict[str, Any]:
-        """Load progress from the progress file"""
-        if os.path.exists(self.progress_file):
-            with open(self.progress_file, 'r') as f:
-                return json.load(f)
+    """
+    Per-row processing ledger for the automation bot
+
+    Every input row has one record in a SQLite ledger with its status
+    (pending, in_flight, done, failed or dead), the stage it is in or failed
+    at, the number of attempts and the last error. Each update is a single-row
+    write, so rows can finish in any order and a crash never marks an
+    unfinished row as done: a resumed run skips exactly the done rows.
+
+    Failed rows form the retry queue: each has a failure class, the time of
+    its next attempt and a checkpoint of the outputs of the stages before the
+    failed one (see retry_queue.py). Dead rows gave up after too many attempts.
+
+    A legacy progress.json (last_processed_row + failed_papers) is imported
+    once when the ledger is created.
+    """
+
+    PENDING = "pending"
+    IN_FLIGHT = "in_flight"
+    DONE = "done"
+    FAILED = "failed"
+    DEAD = "dead"
+
+    def __init__(
+        self, ledger_path: str = "progress.sqlite", legacy_file: str = "progress.json"
+    ):
+        self.ledger_path = ledger_path
+        self.legacy_file = legacy_file
+        self.logger = logging.getLogger(__name__)
+
+        self.conn = sqlite3.connect(ledger_path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS rows (
+                row INTEGER PRIMARY KEY,
+                title TEXT NOT NULL DEFAULT '',
+                link TEXT NOT NULL DEFAULT '',
+                status TEXT NOT NULL,
+                stage TEXT NOT NULL DEFAULT '',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT NOT NULL DEFAULT '',
+                updated_at TEXT NOT NULL
+            )
+            """)
+        # Columns added with the retry queue
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(rows)")}
+        if "error_class" not in columns:
+            self.conn.execute(
+                "ALTER TABLE rows ADD COLUMN error_class TEXT NOT NULL DEFAULT ''"
+            )
+        if "retry_at" not in columns:
+            self.conn.execute(
+                "ALTER TABLE rows ADD COLUMN retry_at REAL NOT NULL DEFAULT 0"
+            )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_rows_status ON rows(status)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_rows_retry ON rows(status, retry_at)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints (row INTEGER PRIMARY KEY, state TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._migrate_legacy()
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    def _get_meta(self, key: str, default: str = "") -> str:
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else default
+
+    def _migrate_legacy(self) -> None:
+        """Import progress.json into an empty ledger (once)"""
+        if self._get_meta("legacy_imported") or not os.path.exists(self.legacy_file):
+            return
+        try:
+            with open(self.legacy_file, "r") as f:
+                legacy = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Could not import {self.legacy_file}: {e}")
+            return
+
+        now = datetime.now().isoformat()
+        last_row = int(legacy.get("last_processed_row", -1))
+        failed = legacy.get("failed_papers", [])
+        self.conn.execute("BEGIN")
+        try:
+            # Rows up to the old checkpoint count as done, except recorded failures
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO rows (row, status, stage, updated_at) VALUES (?, ?, '', ?)",
+                ((row, self.DONE, now) for row in range(last_row + 1)),
+            )
+            self.conn.executemany(
+                """
+                INSERT INTO rows (row, title, status, attempts, error, updated_at)
+                VALUES (?, ?, ?, 1, ?, ?)
+                ON CONFLICT (row) DO UPDATE SET
+                    title = excluded.title, status = excluded.status,
+                    attempts = excluded.attempts, error = excluded.error
+                """,
+                (
+                    (
+                        int(paper["row"]),
+                        paper.get("title", ""),
+                        self.FAILED,
+                        paper.get("error", ""),
+                        paper.get("timestamp") or now,
+                    )
+                    for paper in failed
+                ),
+            )
+            self._set_meta("total_rows", str(legacy.get("total_rows", 0)))
+            self._set_meta("legacy_imported", now)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.logger.info(
+            f"Imported {self.legacy_file}: rows 0-{last_row} done, {len(failed)} failed"
+        )
+
+    def start_rows(self, rows: Iterable[tuple], stage: str) -> None:
+        """Mark (row, title, link) records in flight at their first stage"""
+        now = datetime.now().isoformat()
+        self.conn.executemany(
+            """
+            INSERT INTO rows (row, title, link, status, stage, attempts, updated_at)
+            VALUES (?, ?, ?, ?, ?, 1, ?)
+            ON CONFLICT (row) DO UPDATE SET
+                title = excluded.title, link = excluded.link,
+                status = excluded.status, stage = excluded.stage,
+                attempts = attempts + 1, error = '', updated_at = excluded.updated_at
+            """,
+            [(row, title, link, self.IN_FLIGHT, stage, now) for row, title, link in rows],
+        )
+
+    def start_row(self, row: int, title: str, link: str, stage: str) -> None:
+        """Mark a row in flight (counting a new attempt)"""
+        self.start_rows([(row, title, link)], stage)
+
+    def set_stage(self, rows: Iterable[int], stage: str) -> None:
+        """Record the stage in-flight rows have reached"""
+        now = datetime.now().isoformat()
+        self.conn.executemany(
+            "UPDATE rows SET stage = ?, updated_at = ? WHERE row = ? AND status = ?",
+            [(stage, now, row, self.IN_FLIGHT) for row in rows],
+        )
+
+    def mark_done(self, row: int, title: str = "") -> None:
+        now = datetime.now().isoformat()
+        self.conn.execute(
+            """
+            INSERT INTO rows (row, title, status, attempts, updated_at)
+            VALUES (?, ?, ?, 1, ?)
+            ON CONFLICT (row) DO UPDATE SET
+                title = CASE WHEN excluded.title != '' THEN excluded.title ELSE title END,
+                status = excluded.status, error = '', error_class = '', retry_at = 0,
+                updated_at = excluded.updated_at
+            """,
+            (row, title, self.DONE, now),
+        )
+        self.conn.execute("DELETE FROM checkpoints WHERE row = ?", (row,))
+
+    def mark_failed(
+        self,
+        row: int,
+        title: str,
+        error: str,
+        stage: Optional[str] = None,
+        error_class: str = "",
+        retry_at: float = 0.0,
+        checkpoint: Optional[str] = None,
+        status: str = FAILED,
+    ) -> None:
+        """
+        Record a failure (a retry due at retry_at, a Unix time)
+
+        checkpoint is the serialized state to resume the failed stage with.
+        """
+        now = datetime.now().isoformat()
+        self.conn.execute(
+            """
+            INSERT INTO rows
+                (row, title, status, stage, attempts, error, error_class, retry_at, updated_at)
+            VALUES (?, ?, ?, COALESCE(?, ''), 1, ?, ?, ?, ?)
+            ON CONFLICT (row) DO UPDATE SET
+                title = CASE WHEN excluded.title != '' THEN excluded.title ELSE title END,
+                status = excluded.status, stage = COALESCE(?, stage),
+                error = excluded.error, error_class = excluded.error_class,
+                retry_at = excluded.retry_at, updated_at = excluded.updated_at
+            """,
+            (row, title, status, stage, error, error_class, retry_at, now, stage),
+        )
+        if checkpoint is not None:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (row, state) VALUES (?, ?)",
+                (row, checkpoint),
+            )
+
+    def mark_dead(
+        self,
+        row: int,
+        title: str,
+        error: str,
+        stage: Optional[str] = None,
+        error_class: str = "",
+        checkpoint: Optional[str] = None,
+    ) -> None:
+        """Move a row to the dead-letter list (no more automatic retries)"""
+        self.mark_failed(
+            row, title, error, stage, error_class, checkpoint=checkpoint, status=self.DEAD
+        )
+
+    def attempts(self, row: int) -> int:
+        found = self.conn.execute(
+            "SELECT attempts FROM rows WHERE row = ?", (row,)
+        ).fetchone()
+        return found[0] if found else 0
+
+    def done_rows(self) -> Set[int]:
+        """Rows that finished successfully (in any run)"""
+        cursor = self.conn.execute("SELECT row FROM rows WHERE status = ?", (self.DONE,))
+        return {row for (row,) in cursor}
+
+    # SQL condition (on table alias r) of settled rows, and its parameters
+    _SETTLED = "(r.status IN (?, ?) OR (r.status = ? AND r.link != ''))"
+
+    def _settled_params(self) -> tuple:
+        return (self.DONE, self.DEAD, self.FAILED)
+
+    def settled_rows(self) -> Set[int]:
+        """
+        Rows a main run does not start again: done rows, dead rows and failed
+        rows waiting in the retry queue (failures without a link, e.g. from
+        progress.json, cannot be retried on their own and are run again)
+        """
+        cursor = self.conn.execute(
+            f"SELECT row FROM rows r WHERE {self._SETTLED}", self._settled_params()
+        )
+        return {row for (row,) in cursor}
+
+    def is_settled(self, row: int) -> bool:
+        """True if a main run does not start the row again (see settled_rows)"""
+        found = self.conn.execute(
+            f"SELECT 1 FROM rows r WHERE r.row = ? AND {self._SETTLED}",
+            (row, *self._settled_params()),
+        ).fetchone()
+        return found is not None
+
+    def settled_count(self) -> int:
+        (count,) = self.conn.execute(
+            f"SELECT COUNT(*) FROM rows r WHERE {self._SETTLED}",
+            self._settled_params(),
+        ).fetchone()
+        return count
+
+    def due_retries(
+        self, now: Optional[float] = None, limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Failed rows whose next attempt is due, oldest due first, with checkpoints"""
+        cursor = self.conn.execute(
+            """
+            SELECT r.row, r.title, r.link, r.stage, r.attempts, r.error_class, c.state
+            FROM rows r LEFT JOIN checkpoints c ON c.row = r.row
+            WHERE r.status = ? AND r.link != '' AND r.retry_at <= ?
+            ORDER BY r.retry_at, r.row
+            LIMIT ?
+            """,
+            (
+                self.FAILED,
+                time.time() if now is None else now,
+                -1 if limit is None else limit,
+            ),
+        )
+        return [
+            {
+                "row": row,
+                "title": title,
+                "link": link,
+                "stage": stage,
+                "attempts": attempts,
+                "error_class": error_class,
+                "checkpoint": state,
+            }
+            for row, title, link, stage, attempts, error_class, state in cursor
+        ]
+
+    def next_retry_at(self) -> Optional[float]:
+        """Unix time the next retry is due (None if the queue is empty)"""
+        found = self.conn.execute(
+            "SELECT MIN(retry_at) FROM rows WHERE status = ? AND link != ''",
+            (self.FAILED,),
+        ).fetchone()
+        return found[0]
+
+    def requeue(self, rows: Optional[Iterable[int]] = None) -> int:
+        """Move dead rows (all, or the given ones) back into the retry queue"""
+        now = datetime.now().isoformat()
+        query = (
+            "UPDATE rows SET status = ?, attempts = 0, retry_at = 0, updated_at = ?"
+            " WHERE status = ?"
+        )
+        if rows is None:
+            cursor = self.conn.execute(query, (self.FAILED, now, self.DEAD))
+            return cursor.rowcount
+        moved = 0
+        for row in rows:
+            cursor = self.conn.execute(
+                query + " AND row = ?", (self.FAILED, now, self.DEAD, row)
+            )
+            moved += cursor.rowcount
+        return moved
+
+    def first_unfinished_row(self, settled: bool = False) -> int:
+        """
+        Smallest row that is not done (rows before it can be skipped unread)
+
+        With settled, the smallest row that is not settled (see settled_rows).
+        Computed in SQL: the first row, or the row after the first finished
+        row whose successor is not finished (the scan stops at that gap).
+        """
+        if settled:
+            condition, params = self._SETTLED, self._settled_params()
         else:
-            return {
-                "last_processed_row": -1,
-                "total_rows": 0,
-                "last_processed_title": "",
-                "timestamp": "",
-                "failed_papers": []
+            condition, params = "r.status = ?", (self.DONE,)
+        next_condition = condition.replace("r.", "n.")
+        (first_row,) = self.conn.execute(
+            f"""
+            SELECT CASE
+                WHEN NOT EXISTS (SELECT 1 FROM rows r WHERE r.row = 0 AND {condition})
+                THEN 0
+                ELSE (
+                    SELECT r.row + 1 FROM rows r
+                    WHERE {condition} AND NOT EXISTS (
+                        SELECT 1 FROM rows n WHERE n.row = r.row + 1 AND {next_condition}
+                    )
+                    ORDER BY r.row LIMIT 1
+                )
+            END
+            """,
+            params * 3,
+        ).fetchone()
+        return first_row
+
+    def status_counts(self) -> Dict[str, int]:
+        cursor = self.conn.execute("SELECT status, COUNT(*) FROM rows GROUP BY status")
+        return dict(cursor.fetchall())
+
+    def _rows_with_status(self, status: str) -> List[Dict[str, Any]]:
+        cursor = self.conn.execute(
+            """
+            SELECT row, title, stage, attempts, error, error_class, retry_at, updated_at
+            FROM rows WHERE status = ? ORDER BY row
+            """,
+            (status,),
+        )
+        return [
+            {
+                "row": row,
+                "title": title,
+                "stage": stage,
+                "attempts": attempts,
+                "error": error,
+                "error_class": error_class,
+                "retry_at": retry_at,
+                "timestamp": updated_at,
             }
-    
+            for row, title, stage, attempts, error, error_class, retry_at, updated_at in cursor
+        ]
+
+    def failed_papers(self) -> List[Dict[str, Any]]:
+        """Rows in the retry queue"""
+        return self._rows_with_status(self.FAILED)
+
+    def dead_letters(self) -> List[Dict[str, Any]]:
+        """Rows that exhausted their retry attempts"""
+        return self._rows_with_status(self.DEAD)
+
+    def set_total_rows(self, total_rows: int) -> None:
+        self._set_meta("total_rows", str(total_rows))
+
+    def load_progress(self) -> Dict[str, Any]:
+        """Progress summary (same keys as the former progress.json)"""
+        last_row = self.first_unfinished_row() - 1
+        title_row = self.conn.execute(
+            "SELECT title, updated_at FROM rows WHERE row = ?", (last_row,)
+        ).fetchone()
+        return {
+            "last_processed_row": last_row,
+            "total_rows": int(self._get_meta("total_rows", "0")),
+            "last_processed_title": title_row[0] if title_row else "",
+            "timestamp": title_row[1] if title_row else "",
+            "failed_papers": self.failed_papers(),
+            "status_counts": self.status_counts(),
+        }
+
     def update_progress(self, row: int, title: str, total_rows: int):
-        """Update progress with the last processed row"""
-        progress = self.load_progress()
-        
-        progress["last_processed_row"] = row
-        progress["last_processed_title"] = title
-        progress["total_rows"] = total_rows
-        progress["timestamp"] = datetime.now().isoformat()
-        
-        with open(self.progress_file, 'w') as f:
-            json.dump(progress, f, indent=2)
-    
+        """Mark a row done (kept for callers of the former checkpoint API)"""
+        self.mark_done(row, title)
+        self.set_total_rows(total_rows)
+
     def add_failed_paper(self, row: int, title: str, error: str):
-        """Add a failed paper to the progress tracking"""
-        progress = self.load_progress()
-        
-        failed_paper = {
-            "row": row,
-            "title": title,
-            "error": error,
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        progress["failed_papers"].append(failed_paper)
-        
-        with open(self.progress_file, 'w') as f:
-            json.dump(progress, f, indent=2)
\ No newline at end of file
+        """Mark a row failed (kept for callers of the former checkpoint API)"""
+        self.mark_failed(row, title, error)
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,103 @@
+import logging
+import sqlite3
+import time
+from typing import Optional, Tuple
+
+
+class QuotaStore:
+    """
+    Persistent Gemini quota usage shared across runs (and processes)
+
+    Keeps the number of requests per model and quota day, and the last
+    per-minute window usage of each model, in a small SQLite database. Daily
+    reservations are atomic, so several processes using the same store never
+    exceed the daily limit together.
+    """
+
+    def __init__(self, path: str = ".quota_usage.sqlite"):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS daily_usage (
+                model TEXT NOT NULL,
+                day TEXT NOT NULL,
+                requests INTEGER NOT NULL,
+                PRIMARY KEY (model, day)
+            )
+            """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS minute_usage (
+                model TEXT PRIMARY KEY,
+                requests REAL NOT NULL,
+                tokens REAL NOT NULL,
+                recorded_at REAL NOT NULL
+            )
+            """)
+
+    def requests_on(self, model: str, day: str) -> int:
+        """Requests reserved for a model on a quota day"""
+        row = self.conn.execute(
+            "SELECT requests FROM daily_usage WHERE model = ? AND day = ?",
+            (model, day),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def reserve_daily(self, model: str, day: str, limit: int) -> Optional[int]:
+        """
+        Count one more request for the day if it stays within the limit
+
+        Returns the new count, or None when the daily limit is reached.
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            used = self.requests_on(model, day)
+            if used >= limit:
+                self.conn.execute("COMMIT")
+                return None
+            self.conn.execute(
+                """
+                INSERT INTO daily_usage (model, day, requests) VALUES (?, ?, 1)
+                ON CONFLICT (model, day) DO UPDATE SET requests = requests + 1
+                """,
+                (model, day),
+            )
+            # Old days are no longer needed
+            self.conn.execute(
+                "DELETE FROM daily_usage WHERE model = ? AND day < ?", (model, day)
+            )
+            self.conn.execute("COMMIT")
+            return used + 1
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def save_minute_usage(self, model: str, requests: float, tokens: float) -> None:
+        """Remember how much of the per-minute windows is in use right now"""
+        self.conn.execute(
+            """
+            INSERT INTO minute_usage (model, requests, tokens, recorded_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (model) DO UPDATE SET
+                requests = excluded.requests,
+                tokens = excluded.tokens,
+                recorded_at = excluded.recorded_at
+            """,
+            (model, requests, tokens, time.time()),
+        )
+
+    def load_minute_usage(self, model: str) -> Optional[Tuple[float, float, float]]:
+        """(requests, tokens, seconds ago) of the last saved window usage"""
+        row = self.conn.execute(
+            "SELECT requests, tokens, recorded_at FROM minute_usage WHERE model = ?",
+            (model,),
+        ).fetchone()
+        if row is None:
+            return None
+        requests, tokens, recorded_at = row
+        return requests, tokens, max(0.0, time.time() - recorded_at)
+
+    def close(self) -> None:
+        self.conn.close()
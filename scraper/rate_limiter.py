@@ -1,9 +1,44 @@
 import asyncio
+import hashlib
 import logging
+import re
+import threading
 import time
-from collections import defaultdict, deque
+from collections import defaultdict
 from dataclasses import dataclass
-from typing import Dict, Optional
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+from zoneinfo import ZoneInfo
+
+from metrics import get_metrics
+from quota_store import QuotaStore
+from token_counter import COUNT_TOKENS_MODEL, TokenCounter, usage_tokens
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:  # pragma: no cover - google-generativeai not installed
+    google_exceptions = None
+
+# Daily quotas reset at midnight in the provider's time zone
+DEFAULT_RESET_TIMEZONE = "America/Los_Angeles"
+
+# Retry hints in error messages ("Please retry in 23.4s", "retry_delay { seconds: 23 }")
+_RETRY_IN = re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE)
+_RETRY_DELAY = re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE)
+
+
+class QuotaExhaustedError(Exception):
+    """A model's daily request budget is used up until retry_at (epoch seconds)"""
+
+    def __init__(self, model: str, reset_at: datetime, retry_at: float):
+        super().__init__(
+            f"Daily request limit reached for {model}; quota resets at "
+            f"{reset_at.isoformat()}"
+        )
+        self.model = model
+        self.reset_at = reset_at
+        self.retry_at = retry_at
 
 
 @dataclass
@@ -15,12 +50,152 @@ class RateLimit:
     requests_per_day: int
 
 
+class TokenBucket:
+    """
+    Continuously refilling token bucket
+
+    Holds up to `capacity` tokens and refills at capacity/period per second,
+    which enforces "capacity per period" with O(1) work per check.
+    """
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+
+    def time_until(self, amount: float, now: float) -> float:
+        """Seconds until `amount` tokens are available (0 if they are now)"""
+        self._refill(now)
+        # A request larger than the bucket waits for a full bucket
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def set_capacity(self, capacity: float, now: float) -> None:
+        """Change the limit; tokens above the new capacity are dropped"""
+        self._refill(now)
+        period = self.capacity / self.rate
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = min(self.tokens, self.capacity)
+
+    def set_used(self, used: float, now: float) -> None:
+        """Start from a known window usage (e.g. restored after a restart)"""
+        self.updated = now
+        self.tokens = self.capacity - min(self.capacity, max(0.0, used))
+
+    def consume(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float, now: float) -> None:
+        """Correct an earlier consume() by amount (negative refunds tokens)"""
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+    def used(self, now: float) -> float:
+        """Tokens consumed within the current window"""
+        self._refill(now)
+        return self.capacity - self.tokens
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """True for 429 / RESOURCE_EXHAUSTED errors from the Gemini API"""
+    if google_exceptions is not None and isinstance(
+        error, google_exceptions.TooManyRequests
+    ):
+        return True
+    code = getattr(error, "code", None)
+    if code == 429 or getattr(code, "value", None) == 429:
+        return True
+    message = str(error)
+    return "RESOURCE_EXHAUSTED" in message or "429" in message.split(" ", 1)[0]
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Server retry hint of a rate limit error in seconds, if it has one"""
+    # RetryInfo details of google.api_core errors
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None and hasattr(delay, "seconds"):
+            return delay.seconds + getattr(delay, "nanos", 0) / 1e9
+
+    # Retry-After header of an HTTP response (seconds or HTTP date)
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("Retry-After") if hasattr(headers, "get") else None
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    for pattern in (_RETRY_IN, _RETRY_DELAY):
+        match = pattern.search(str(error))
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def parse_rate_limits(spec: str) -> Dict[str, RateLimit]:
+    """
+    Parse limits such as "gemini-2.0-flash=2000/4000000/0,text-embedding-004=3000/1000000/0"
+
+    Each entry is model=RPM/TPM/RPD; an RPD of 0 means no daily limit.
+    """
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, values = entry.partition("=")
+        rpm, tpm, rpd = (int(value) for value in values.split("/"))
+        limits[model.strip()] = RateLimit(
+            requests_per_minute=rpm,
+            tokens_per_minute=tpm,
+            requests_per_day=rpd or 10**9,
+        )
+    return limits
+
+
 class RateLimiter:
     """
     Rate limiter that enforces Google Gemini API rate limits
     Tracks requests per minute, tokens per minute, and requests per day
+
+    Quota is reserved atomically: wait_for_rate_limit() holds a per-model lock
+    until the request fits, then deducts it, so concurrent callers are
+    admitted one at a time in arrival order. Use get_rate_limiter() to share
+    one instance between every client of the same API key.
+
+    Daily budgets follow the provider's quota day (midnight Pacific time).
+    With a QuotaStore, daily and per-minute usage survive restarts; when a
+    daily budget is used up, requests for that model raise
+    QuotaExhaustedError with the exact reset time instead of being sent over
+    quota, so callers can park the work until then.
+
+    The effective per-minute limits are the configured ones scaled by a
+    per-model factor under AIMD control: every 429 cuts it by 30% (and the
+    server's retry hint is honored), successful calls raise it slowly again.
+    Without adaptive mode the factor never exceeds 1; with it, the limiter
+    probes above the configured limits up to max_factor.
     """
 
+    # Multiplicative decrease on 429, additive increase per minute of traffic;
+    # until the first 429 the rate doubles per minute instead (slow start)
+    BACKOFF_FACTOR = 0.7
+    INCREASE_PER_MINUTE = 0.25
+    MIN_FACTOR = 0.05
+
     def __init__(self):
         self.logger = logging.getLogger(__name__)
 
@@ -39,64 +214,247 @@ class RateLimiter:
             "gemini-2.5-flash": RateLimit(
                 requests_per_minute=10, tokens_per_minute=250000, requests_per_day=250
             ),
+            # count_tokens requests (TokenCounter), which are charged no tokens
+            COUNT_TOKENS_MODEL: RateLimit(
+                requests_per_minute=3000,
+                tokens_per_minute=10**9,
+                requests_per_day=10**9,
+            ),
         }
 
-        # Track usage per model
-        self.request_times: Dict[str, deque] = defaultdict(lambda: deque())
-        self.token_usage: Dict[str, deque] = defaultdict(lambda: deque())
+        # Adaptive rate control (see configure())
+        self.adaptive = False
+        self.max_factor = 1.0
+        self.rate_factors: Dict[str, float] = defaultdict(lambda: 1.0)
+        self.slow_start: Dict[str, bool] = defaultdict(lambda: True)
+        self.throttled_requests: Dict[str, int] = defaultdict(int)
+
+        # Per-model quota state
+        self.request_buckets: Dict[str, TokenBucket] = {}
+        self.token_buckets: Dict[str, TokenBucket] = {}
+        self.next_request_at: Dict[str, float] = defaultdict(float)
         self.daily_requests: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.reset_timezone = ZoneInfo(DEFAULT_RESET_TIMEZONE)
+        self.usage_store: Optional[QuotaStore] = None
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_loops: Dict[str, asyncio.AbstractEventLoop] = {}
+
+        # Calls actually made (recorded after each API call)
+        self.recorded_requests: Dict[str, int] = defaultdict(int)
+        self.recorded_tokens: Dict[str, int] = defaultdict(int)
+        self.recorded_output_tokens: Dict[str, int] = defaultdict(int)
+        # Input tokens the API reported, against what was reserved for them
+        self.reported_tokens: Dict[str, int] = defaultdict(int)
+        self.reserved_tokens: Dict[str, int] = defaultdict(int)
+
+        # Shared by every client of this key so calibration benefits all;
+        # its count_tokens requests are limited like any other
+        self.token_counter = TokenCounter(limiter=self)
+        self.metrics = get_metrics()
+
+    def configure(
+        self,
+        rate_limits: Optional[Dict[str, RateLimit]] = None,
+        adaptive: bool = False,
+        max_factor: float = 4.0,
+        usage_store: Optional[QuotaStore] = None,
+        reset_timezone: str = DEFAULT_RESET_TIMEZONE,
+    ) -> None:
+        """
+        Set account limits, adaptive mode and quota persistence
+
+        Args:
+            rate_limits: Per-model limits replacing the free-tier defaults
+            adaptive: Probe for more throughput than configured until a 429
+            max_factor: Highest multiple of the configured limits to probe up to
+            usage_store: Persists daily and per-minute usage across runs
+            reset_timezone: Time zone whose midnight resets daily quotas
+        """
+        if rate_limits:
+            self.rate_limits.update(rate_limits)
+        if rate_limits or usage_store is not None:
+            # Rebuild buckets from the new limits / the stored usage
+            self.request_buckets.clear()
+            self.token_buckets.clear()
+        self.usage_store = usage_store
+        self.reset_timezone = ZoneInfo(reset_timezone)
+        self.adaptive = adaptive
+        self.max_factor = max(1.0, max_factor) if adaptive else 1.0
+        self.logger.info(
+            f"Rate limiter configured (adaptive={adaptive}, max factor {self.max_factor})"
+        )
+
+    def effective_limits(self, model: str):
+        """Current (requests per minute, tokens per minute) for a model"""
+        limits = self.rate_limits[model]
+        factor = self.rate_factors[model]
+        return (
+            limits.requests_per_minute * factor,
+            limits.tokens_per_minute * factor,
+        )
+
+    def _set_factor(self, model: str, factor: float) -> None:
+        factor = min(self.max_factor, max(self.MIN_FACTOR, factor))
+        self.rate_factors[model] = factor
+        if model in self.request_buckets:
+            rpm, tpm = self.effective_limits(model)
+            now = time.monotonic()
+            self.request_buckets[model].set_capacity(rpm, now)
+            self.token_buckets[model].set_capacity(tpm, now)
+
+    def _on_success(self, model: str) -> None:
+        """Raise the rate a little; a minute of full-rate traffic adds one step"""
+        factor = self.rate_factors[model]
+        if factor >= self.max_factor:
+            return
+        rpm, _ = self.effective_limits(model)
+        if self.slow_start[model]:
+            # Doubles the factor over a minute of requests
+            step = factor * 0.6931 / max(1.0, rpm)
+        else:
+            step = self.INCREASE_PER_MINUTE / max(1.0, rpm)
+        self._set_factor(model, factor + step)
+
+    def _on_throttled(self, model: str, retry_after: Optional[float]) -> None:
+        """Multiplicative decrease and a pause until the server's retry time"""
+        self.throttled_requests[model] += 1
+        self.slow_start[model] = False
+        self._set_factor(model, self.rate_factors[model] * self.BACKOFF_FACTOR)
+
+        rpm, _ = self.effective_limits(model)
+        pause = retry_after if retry_after is not None else 60.0 / rpm
+        self.next_request_at[model] = max(
+            self.next_request_at[model], time.monotonic() + pause
+        )
+        self.logger.warning(
+            f"Rate limited by the API for {model}; rate factor now "
+            f"{self.rate_factors[model]:.2f}, pausing {pause:.1f}s"
+        )
 
     def _get_current_date(self) -> str:
-        """Get current date string for daily tracking"""
-        return time.strftime("%Y-%m-%d", time.localtime())
-
-    def _cleanup_old_records(self, model: str) -> None:
-        """Remove old request records outside the tracking window"""
-        current_time = time.time()
-        one_minute_ago = current_time - 60
-
-        # Clean up request times (keep only last minute)
-        while (
-            self.request_times[model] and self.request_times[model][0] < one_minute_ago
-        ):
-            self.request_times[model].popleft()
-
-        # Clean up token usage (keep only last minute)
-        while (
-            self.token_usage[model] and self.token_usage[model][0][0] < one_minute_ago
-        ):
-            self.token_usage[model].popleft()
+        """Get the current quota day (in the reset time zone)"""
+        return datetime.now(self.reset_timezone).strftime("%Y-%m-%d")
+
+    def next_reset(self) -> datetime:
+        """When daily quotas reset next (midnight in the reset time zone)"""
+        today = datetime.now(self.reset_timezone).date()
+        return datetime.combine(
+            today + timedelta(days=1), datetime.min.time(), tzinfo=self.reset_timezone
+        )
+
+    def seconds_until_reset(self) -> float:
+        # Compare timestamps: wall-clock differences are off on DST changes
+        return max(0.0, self.next_reset().timestamp() - time.time())
+
+    def _buckets(self, model: str):
+        """RPM and TPM buckets of a model, created on first use"""
+        if model not in self.request_buckets:
+            rpm, tpm = self.effective_limits(model)
+            request_bucket = TokenBucket(rpm)
+            token_bucket = TokenBucket(tpm)
+
+            # Carry over what the last run used of the current minute windows
+            saved = (
+                self.usage_store.load_minute_usage(model) if self.usage_store else None
+            )
+            if saved is not None:
+                requests, tokens, seconds_ago = saved
+                now = time.monotonic()
+                request_bucket.set_used(
+                    requests - seconds_ago * request_bucket.rate, now
+                )
+                token_bucket.set_used(tokens - seconds_ago * token_bucket.rate, now)
+
+            self.request_buckets[model] = request_bucket
+            self.token_buckets[model] = token_bucket
+        return self.request_buckets[model], self.token_buckets[model]
+
+    def _get_lock(self, model: str) -> asyncio.Lock:
+        """Per-model lock, recreated if the limiter is used from a new event loop"""
+        loop = asyncio.get_running_loop()
+        if self._lock_loops.get(model) is not loop:
+            self._locks[model] = asyncio.Lock()
+            self._lock_loops[model] = loop
+        return self._locks[model]
 
     def _get_requests_in_last_minute(self, model: str) -> int:
-        """Get number of requests made in the last minute"""
-        self._cleanup_old_records(model)
-        return len(self.request_times[model])
+        """Get number of requests reserved in the current minute window"""
+        if model not in self.rate_limits:
+            return 0
+        request_bucket, _ = self._buckets(model)
+        return round(request_bucket.used(time.monotonic()))
 
     def _get_tokens_in_last_minute(self, model: str) -> int:
-        """Get number of tokens used in the last minute"""
-        self._cleanup_old_records(model)
-        return sum(token_count for _, token_count in self.token_usage[model])
+        """Get number of tokens reserved in the current minute window"""
+        if model not in self.rate_limits:
+            return 0
+        _, token_bucket = self._buckets(model)
+        return round(token_bucket.used(time.monotonic()))
 
     def _get_requests_today(self, model: str) -> int:
         """Get number of requests made today"""
         current_date = self._get_current_date()
+        if self.usage_store is not None:
+            return self.usage_store.requests_on(model, current_date)
         return self.daily_requests[model].get(current_date, 0)
 
+    def _reserve_daily(self, model: str, limit: int) -> bool:
+        """Count a request against today's budget; False if it is used up"""
+        current_date = self._get_current_date()
+        if self.usage_store is not None:
+            used = self.usage_store.reserve_daily(model, current_date, limit)
+            if used is None:
+                return False
+        else:
+            used = self.daily_requests[model].get(current_date, 0)
+            if used >= limit:
+                return False
+            used += 1
+        # Only today's count is kept
+        self.daily_requests[model] = {current_date: used}
+        return True
+
     def _estimate_tokens(self, text: str) -> int:
-        """Estimate token count for text (rough approximation: 1 token = 4 characters)"""
-        return max(1, len(text) // 4)
+        """Estimate token count for text (exact if counted before)"""
+        return max(1, self.token_counter.estimate(text))
+
+    def reconcile_tokens(self, model: str, reserved: int, actual: int) -> None:
+        """Replace a request's reserved token estimate by its reported usage"""
+        self.reserved_tokens[model] += reserved
+        self.reported_tokens[model] += actual
+        if model in self.rate_limits and actual != reserved:
+            _, token_bucket = self._buckets(model)
+            token_bucket.adjust(actual - reserved, time.monotonic())
 
     async def wait_for_rate_limit(
         self, model: str, text: str = "", estimated_tokens: Optional[int] = None
     ) -> None:
         """
-        Wait as needed to respect rate limits for the specified model
+        Wait until a request fits the rate limits, then reserve it
 
         Args:
             model: The model being used (e.g., 'text-embedding-004', 'gemini-2.0-flash')
             text: Text being processed (for token estimation if needed)
             estimated_tokens: Pre-calculated token count (optional)
         """
+        waiting = self.metrics.gauge(
+            "rate_limiter_waiting", "Requests waiting for quota", model=model
+        )
+        waiting.inc()
+        start = time.perf_counter()
+        try:
+            await self._wait_for_rate_limit(model, text, estimated_tokens)
+        finally:
+            waiting.dec()
+            self.metrics.histogram(
+                "rate_limiter_wait_seconds",
+                "Time requests waited for quota",
+                model=model,
+            ).observe(time.perf_counter() - start)
+
+    async def _wait_for_rate_limit(
+        self, model: str, text: str, estimated_tokens: Optional[int]
+    ) -> None:
         if model not in self.rate_limits:
             self.logger.warning(f"Unknown model {model}, using default rate limiting")
             # Use conservative defaults for unknown models
@@ -111,123 +469,201 @@ class RateLimiter:
         elif estimated_tokens is None:
             estimated_tokens = 100  # Default estimate
 
-        # Check current usage
-        current_rpm = self._get_requests_in_last_minute(model)
-        current_tpm = self._get_tokens_in_last_minute(model)
-        current_rpd = self._get_requests_today(model)
-
-        self.logger.debug(
-            f"Rate limit check for {model}: "
-            f"RPM {current_rpm}/{limits.requests_per_minute}, "
-            f"TPM {current_tpm}/{limits.tokens_per_minute}, "
-            f"RPD {current_rpd}/{limits.requests_per_day}"
-        )
-
-        # Check daily limit first (hardest to recover from)
-        if current_rpd >= limits.requests_per_day:
-            # We've hit the daily limit - need to wait until midnight PT
-            # For simplicity, we'll wait a very long time and let the user handle this
-            self.logger.error(
-                f"Daily request limit exceeded for {model} ({current_rpd}/{limits.requests_per_day})"
-            )
-            # Wait 1 hour and hope the limit resets
-            await asyncio.sleep(3600)
-            return
-
-        # Calculate required delays
-        delays = []
-
-        # RPM check
-        if current_rpm >= limits.requests_per_minute:
-            # Need to wait until we can make another request
-            if self.request_times[model]:
-                oldest_request = self.request_times[model][0]
-                wait_time = (
-                    60 - (time.time() - oldest_request) + 1
-                )  # +1 for safety margin
-                delays.append(max(0, wait_time))
-
-        # TPM check
-        if current_tpm + estimated_tokens > limits.tokens_per_minute:
-            # Need to wait for tokens to become available
-            if self.token_usage[model]:
-                # Find when enough tokens will be available
-                tokens_needed = (
-                    current_tpm + estimated_tokens - limits.tokens_per_minute
+        request_bucket, token_bucket = self._buckets(model)
+
+        # Waiters queue on the lock in arrival order; only the head of the
+        # queue sleeps, and it deducts its quota before letting the next in
+        async with self._get_lock(model):
+            while True:
+                now = time.monotonic()
+                delay = max(
+                    request_bucket.time_until(1, now),
+                    token_bucket.time_until(estimated_tokens, now),
+                    self.next_request_at[model] - now,
                 )
-                total_tokens_to_wait_for = 0
-
-                for timestamp, token_count in self.token_usage[model]:
-                    total_tokens_to_wait_for += token_count
-                    if total_tokens_to_wait_for >= tokens_needed:
-                        wait_time = 60 - (time.time() - timestamp) + 1  # +1 for safety
-                        delays.append(max(0, wait_time))
-                        break
-
-        # Apply minimum delays based on model type
-        min_delays = {
-            "text-embedding-004": 0.6,  # 100 RPM = 0.6s minimum
-            "gemini-2.0-flash": 4.0,  # 15 RPM = 4s minimum
-            "gemini-2.5-flash": 6.0,  # 10 RPM = 6s minimum
-        }
+                if delay > 0:
+                    self.logger.info(
+                        f"Rate limiting: waiting {delay:.2f} seconds for {model}"
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+
+                if self._reserve_daily(model, limits.requests_per_day):
+                    break
+
+                # Daily budget used up: fail fast (releasing the lock) rather
+                # than hold every caller of this model until the reset; a
+                # small margin keeps clock skew from landing just before it
+                reset_at = self.next_reset()
+                self.logger.error(
+                    f"Daily request limit reached for {model} "
+                    f"({limits.requests_per_day} requests); quota resets at "
+                    f"{reset_at.isoformat()}"
+                )
+                raise QuotaExhaustedError(model, reset_at, reset_at.timestamp() + 5)
 
-        if model in min_delays:
-            delays.append(min_delays[model])
+            request_bucket.consume(1, now)
+            token_bucket.consume(estimated_tokens, now)
+            # Spread requests evenly over the minute (60/RPM apart)
+            self.next_request_at[model] = now + 60.0 / request_bucket.capacity
 
-        # Use the longest delay needed
-        if delays:
-            delay = max(delays)
-            if delay > 0:
-                self.logger.info(
-                    f"Rate limiting: waiting {delay:.2f} seconds for {model}"
+            if self.usage_store is not None:
+                self.usage_store.save_minute_usage(
+                    model, request_bucket.used(now), token_bucket.used(now)
                 )
-                await asyncio.sleep(delay)
+
+        self.logger.debug(
+            f"Reserved request for {model}: "
+            f"RPM {self._get_requests_in_last_minute(model)}/{request_bucket.capacity:.0f}, "
+            f"TPM {self._get_tokens_in_last_minute(model)}/{token_bucket.capacity:.0f}, "
+            f"RPD {self._get_requests_today(model)}/{limits.requests_per_day}"
+        )
 
     def record_request(
-        self, model: str, text: str = "", estimated_tokens: Optional[int] = None
+        self,
+        model: str,
+        text: str = "",
+        estimated_tokens: Optional[int] = None,
+        error: Optional[BaseException] = None,
     ) -> None:
         """
-        Record a successful API request for rate limit tracking
+        Record an API request that was sent (successful or not)
+
+        Quota is already deducted by wait_for_rate_limit(); this keeps the
+        count of calls actually made and drives the adaptive rate.
 
         Args:
             model: The model that was used
             text: Text that was processed (for token counting)
             estimated_tokens: Pre-calculated token count (optional)
+            error: Exception raised by the call, if it failed
         """
-        current_time = time.time()
-        current_date = self._get_current_date()
-
-        # Record request time
-        self.request_times[model].append(current_time)
-
-        # Record token usage
         if estimated_tokens is None and text:
             estimated_tokens = self._estimate_tokens(text)
         elif estimated_tokens is None:
             estimated_tokens = 100  # Default estimate
 
-        self.token_usage[model].append((current_time, estimated_tokens))
-
-        # Record daily usage
-        if current_date not in self.daily_requests[model]:
-            self.daily_requests[model][current_date] = 0
-        self.daily_requests[model][current_date] += 1
+        self.recorded_requests[model] += 1
+        self.recorded_tokens[model] += estimated_tokens
+        if error is None:
+            outcome = "ok"
+        elif is_rate_limit_error(error):
+            outcome = "rate_limited"
+        else:
+            outcome = "error"
+        self.metrics.counter(
+            "gemini_requests_total",
+            "Gemini API requests sent",
+            model=model,
+            outcome=outcome,
+        ).inc()
+        self.metrics.counter(
+            "gemini_tokens_total", "Gemini tokens charged", model=model, kind="input"
+        ).inc(estimated_tokens)
+
+        if model in self.rate_limits:
+            if error is None:
+                self._on_success(model)
+            elif is_rate_limit_error(error):
+                self._on_throttled(model, retry_after_seconds(error))
 
         self.logger.debug(f"Recorded request for {model}: {estimated_tokens} tokens")
 
-    def get_usage_stats(self, model: str) -> Dict[str, int]:
+    async def call(
+        self,
+        model: str,
+        request: Callable[[], Awaitable[Any]],
+        text: str = "",
+        estimated_tokens: Optional[int] = None,
+        max_attempts: int = 3,
+    ) -> Any:
+        """
+        Run an API request under the rate limit and record its outcome
+
+        Requests rejected with 429 are retried (after the limiter backed off)
+        up to max_attempts times; other errors are raised immediately. When
+        the response reports its usage_metadata, the reserved token estimate
+        is replaced by the reported input tokens.
+
+        Args:
+            model: The model being called
+            request: Zero-argument coroutine function making the API call
+            text: Text being processed (for token estimation if needed)
+            estimated_tokens: Pre-calculated token count (optional)
+            max_attempts: Attempts for requests that keep getting rate limited
+        """
+        if estimated_tokens is None and text:
+            estimated_tokens = self._estimate_tokens(text)
+
+        for attempt in range(1, max_attempts + 1):
+            await self.wait_for_rate_limit(model, text, estimated_tokens)
+            latency = self.metrics.histogram(
+                "gemini_request_seconds", "Gemini API request latency", model=model
+            )
+            start = time.perf_counter()
+            try:
+                result = await request()
+            except Exception as e:
+                latency.observe(time.perf_counter() - start)
+                self.record_request(model, text, estimated_tokens, error=e)
+                if attempt < max_attempts and is_rate_limit_error(e):
+                    continue
+                raise
+            latency.observe(time.perf_counter() - start)
+
+            tokens = estimated_tokens
+            usage = usage_tokens(result)
+            if usage is not None:
+                prompt_tokens, output_tokens = usage
+                self.reconcile_tokens(model, estimated_tokens or 100, prompt_tokens)
+                self.recorded_output_tokens[model] += output_tokens
+                self.metrics.counter(
+                    "gemini_tokens_total", model=model, kind="output"
+                ).inc(output_tokens)
+                if text:
+                    self.token_counter.remember(text, prompt_tokens)
+                tokens = prompt_tokens
+            self.record_request(model, text, tokens)
+            return result
+
+    def get_usage_stats(self, model: str) -> Dict[str, Any]:
         """Get current usage statistics for a model"""
+        limits = self.rate_limits.get(model)
+        effective_rpm, effective_tpm = (
+            self.effective_limits(model) if limits else (0, 0)
+        )
         return {
             "requests_last_minute": self._get_requests_in_last_minute(model),
             "tokens_last_minute": self._get_tokens_in_last_minute(model),
             "requests_today": self._get_requests_today(model),
-            "rpm_limit": self.rate_limits[model].requests_per_minute
-            if model in self.rate_limits
-            else 0,
-            "tpm_limit": self.rate_limits[model].tokens_per_minute
-            if model in self.rate_limits
-            else 0,
-            "rpd_limit": self.rate_limits[model].requests_per_day
-            if model in self.rate_limits
-            else 0,
+            "requests_recorded": self.recorded_requests[model],
+            "tokens_recorded": self.recorded_tokens[model],
+            "output_tokens_recorded": self.recorded_output_tokens[model],
+            "tokens_reserved_for_reported": self.reserved_tokens[model],
+            "tokens_reported": self.reported_tokens[model],
+            "rpm_limit": limits.requests_per_minute if limits else 0,
+            "tpm_limit": limits.tokens_per_minute if limits else 0,
+            "rpd_limit": limits.requests_per_day if limits else 0,
+            "daily_reset_at": self.next_reset().isoformat(),
+            "effective_rpm": round(effective_rpm, 1),
+            "effective_tpm": round(effective_tpm),
+            "rate_factor": round(self.rate_factors[model], 3),
+            "throttled_requests": self.throttled_requests[model],
+            "adaptive": self.adaptive,
         }
+
+
+# One limiter per API key, shared by every client in the process
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(api_key: str) -> RateLimiter:
+    """Return the process-wide RateLimiter for an API key"""
+    # Key by a digest so the registry does not hold the key itself
+    key = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = RateLimiter()
+        return limiter
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Retry policy for failed papers
+
+A failed row stays in the progress ledger with the stage it failed in, a
+failure class and the time of its next attempt. Classes have their own
+backoff (doubling with every attempt), and a row that failed
+RETRY_MAX_ATTEMPTS times is moved to the dead-letter list:
+
+    timeout       fetch or Gemini request timed out
+    rate_limited  429 / RESOURCE_EXHAUSTED (quota left for the day is unknown),
+                  or the daily quota is used up (retried right after its reset)
+    fetch         other network or HTTP errors
+    parse         the page could not be parsed
+    llm           Gemini entity or embedding results missing or malformed
+    store         writing to the local storage failed
+
+Due retries are run with `python main.py --drain-retries`; they resume at
+the failed stage with the outputs of the earlier stages. This module's CLI
+lists the queue and moves dead letters back into it.
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+import httpx
+
+from progress_tracker import ProgressTracker
+from rate_limiter import QuotaExhaustedError, is_rate_limit_error
+
+# Initial backoff per failure class (seconds), doubled for every later attempt
+DEFAULT_BACKOFF = {
+    "timeout": 60.0,
+    "rate_limited": 900.0,
+    "fetch": 300.0,
+    "parse": 3600.0,
+    "llm": 120.0,
+    "store": 60.0,
+}
+MAX_BACKOFF = 24 * 3600.0
+
+# Failure class of errors that are neither timeouts nor rate limits
+STAGE_CLASSES = {
+    "fetch": "fetch",
+    "parse": "parse",
+    "entities": "llm",
+    "embeddings": "llm",
+    "persist": "store",
+}
+
+
+def classify_failure(stage: str, error: BaseException) -> str:
+    """Failure class of an error raised in a pipeline stage"""
+    response = getattr(error, "response", None)
+    if (
+        isinstance(error, QuotaExhaustedError)
+        or is_rate_limit_error(error)
+        or getattr(response, "status_code", None) == 429
+    ):
+        return "rate_limited"
+    if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException)):
+        return "timeout"
+    return STAGE_CLASSES.get(stage, "fetch")
+
+
+def parse_backoff(spec: str) -> Dict[str, float]:
+    """Parse "class=seconds,..." (e.g. "timeout=30,rate_limited=3600")"""
+    backoff = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, seconds = item.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_BACKOFF:
+            raise ValueError(f"Unknown failure class in RETRY_BACKOFF: {name}")
+        backoff[name] = float(seconds)
+    return backoff
+
+
+class RetryPolicy:
+    """
+    When to retry a failed paper, and when to give up on it
+
+    Args:
+        max_attempts: Attempts (including the first run) before a paper is
+            moved to the dead-letter list
+        backoff: Initial backoff per failure class, overriding DEFAULT_BACKOFF
+    """
+
+    def __init__(self, max_attempts: int = 5, backoff: Optional[Dict] = None):
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = {**DEFAULT_BACKOFF, **(backoff or {})}
+
+    def delay(self, failure_class: str, attempts: int) -> float:
+        """Seconds until the next attempt after the given number of attempts"""
+        base = self.backoff.get(failure_class, DEFAULT_BACKOFF["fetch"])
+        return min(MAX_BACKOFF, base * 2 ** max(0, attempts - 1))
+
+    def is_exhausted(self, attempts: int) -> bool:
+        return attempts >= self.max_attempts
+
+
+def _print_rows(rows, with_retry: bool) -> None:
+    now = time.time()
+    for paper in rows:
+        line = (
+            f"{paper['row']:>7}  {paper['stage'] or '-':<10} {paper['error_class'] or '-':<12} "
+            f"attempts={paper['attempts']}"
+        )
+        if with_retry:
+            wait = paper["retry_at"] - now
+            line += "  due" if wait <= 0 else f"  in {wait / 60:.0f} min"
+        print(f"{line}  {paper['title'][:50]}  {paper['error'][:80]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Failed-paper retry queue")
+    parser.add_argument("command", choices=["list", "dead", "requeue"])
+    parser.add_argument(
+        "rows", nargs="*", type=int, help="rows to requeue (default: all dead rows)"
+    )
+    parser.add_argument("--ledger", default="progress.sqlite")
+    args = parser.parse_args()
+
+    tracker = ProgressTracker(args.ledger)
+    try:
+        if args.command == "list":
+            _print_rows(tracker.failed_papers(), with_retry=True)
+            next_at = tracker.next_retry_at()
+            if next_at is not None and next_at > time.time():
+                print(
+                    f"Next retry due at {datetime.fromtimestamp(next_at):%Y-%m-%d %H:%M}"
+                )
+        elif args.command == "dead":
+            _print_rows(tracker.dead_letters(), with_retry=False)
+        else:
+            moved = tracker.requeue(args.rows or None)
+            print(f"Moved {moved} dead rows back into the retry queue")
+    finally:
+        tracker.close()
+
+
+if __name__ == "__main__":
+    main()
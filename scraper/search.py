@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Top-k cosine similarity search over stored section embeddings
+
+Two modes are available:
+- exact: brute force over all live vectors, scored in NumPy batches straight
+  from the memory-mapped VectorStore
+- ivf: an inverted-file index (spherical k-means centroids); a query only
+  scores the vectors of its n_probe closest lists, trading a little recall
+  for much lower latency on large corpora
+
+Usage:
+    python search.py "bone loss in microgravity" [--k 10] [--section abstract] [--mode ivf]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from vector_store import VectorStore
+
+# Rows scored per matrix multiplication (16k x 768 float32 = 48 MB)
+_SCORE_CHUNK = 16384
+
+# Exact mode gathers matching rows when fewer than this share of rows match
+_GATHER_BELOW = 0.25
+
+# Rebuild the IVF index once this share of rows was appended after its build
+_REBUILD_RATIO = 0.2
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows; all-zero rows stay zero"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _top_k(
+    scores: np.ndarray, ids: np.ndarray, k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Best k (scores, ids) in descending order"""
+    if len(scores) > k:
+        keep = np.argpartition(-scores, k - 1)[:k]
+        scores, ids = scores[keep], ids[keep]
+    order = np.argsort(-scores, kind="stable")
+    return scores[order], ids[order]
+
+
+class IVFIndex:
+    """Inverted-file index over the live rows of a VectorStore"""
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        list_offsets: np.ndarray,
+        list_rows: np.ndarray,
+        generation: int,
+        count: int,
+    ):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        # Rows appended after the build (row >= count) are scanned exactly
+        self.generation = generation
+        self.count = count
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(
+        cls,
+        store: VectorStore,
+        n_lists: Optional[int] = None,
+        iterations: int = 10,
+        sample_per_list: int = 64,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """
+        Cluster the store's live vectors with spherical k-means
+
+        Args:
+            store: Vector store to index
+            n_lists: Number of inverted lists; defaults to sqrt(live rows),
+                and at most the number of live rows
+            iterations: k-means iterations over the training sample
+            sample_per_list: Training vectors sampled per list
+            seed: Random seed for sampling and initialization
+
+        A store without live rows gets an index without lists, under which
+        searches fall back to exact scoring.
+        """
+        rng = np.random.default_rng(seed)
+        rows = store.live_rows()
+        matrix = store.matrix()
+        if not len(rows):
+            return cls(
+                np.empty((0, store.dimensions), dtype=np.float32),
+                np.zeros(1, dtype=np.int64),
+                np.empty(0, dtype=np.int64),
+                store.generation,
+                store.count,
+            )
+        if n_lists is None:
+            n_lists = int(np.sqrt(len(rows)))
+        n_lists = max(1, min(n_lists, len(rows)))
+
+        sample_size = n_lists * sample_per_list
+        sample_rows = rows
+        if len(rows) > sample_size:
+            sample_rows = np.sort(rng.choice(rows, sample_size, replace=False))
+        sample = _normalize(matrix[sample_rows])
+
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+        for _ in range(iterations):
+            labels = cls._assign(sample, centroids)
+            counts = np.bincount(labels, minlength=n_lists)
+
+            # Per-list sums as one matrix product with the one-hot assignment
+            one_hot = np.zeros((n_lists, len(sample)), dtype=np.float32)
+            one_hot[labels, np.arange(len(sample))] = 1
+            sums = one_hot @ sample
+
+            # Re-seed empty lists with random sample vectors
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = _normalize(sums)
+
+        labels = np.empty(len(rows), dtype=np.int64)
+        for start in range(0, len(rows), _SCORE_CHUNK):
+            chunk = rows[start : start + _SCORE_CHUNK]
+            labels[start : start + len(chunk)] = cls._assign(
+                _normalize(matrix[chunk]), centroids
+            )
+
+        order = np.argsort(labels, kind="stable")
+        list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=n_lists), out=list_offsets[1:])
+        return cls(centroids, list_offsets, rows[order], store.generation, store.count)
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ centroids.T, axis=1)
+
+    def candidates(self, query: np.ndarray, n_probe: int) -> np.ndarray:
+        """Rows in the n_probe lists closest to a normalized query"""
+        n_probe = min(n_probe, self.n_lists)
+        closest = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        return np.concatenate(
+            [
+                self.list_rows[self.list_offsets[i] : self.list_offsets[i + 1]]
+                for i in closest
+            ]
+        )
+
+    def save(self, path: str) -> None:
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            centroids=self.centroids,
+            list_offsets=self.list_offsets,
+            list_rows=self.list_rows,
+            generation=self.generation,
+            count=self.count,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(
+                data["centroids"],
+                data["list_offsets"],
+                data["list_rows"],
+                int(data["generation"]),
+                int(data["count"]),
+            )
+
+
+class VectorSearch:
+    """Top-k cosine search over a VectorStore"""
+
+    def __init__(self, store: VectorStore, index: Optional[IVFIndex] = None):
+        self.store = store
+        self.index = index
+        self.logger = logging.getLogger(__name__)
+        self._cache_version = -1
+        self._inverse_norms: Optional[np.ndarray] = None
+        self._masks: Dict[Optional[str], np.ndarray] = {}
+
+    def _refresh(self) -> None:
+        """Recompute norms and filters after the store changed"""
+        if (
+            self._cache_version == self.store.version
+            and self._inverse_norms is not None
+        ):
+            return
+
+        matrix = self.store.matrix()
+        norms = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), _SCORE_CHUNK):
+            norms[start : start + _SCORE_CHUNK] = np.linalg.norm(
+                matrix[start : start + _SCORE_CHUNK], axis=1
+            )
+        # Zero vectors (failed embeddings) are masked out of every search
+        with np.errstate(divide="ignore"):
+            self._inverse_norms = np.where(norms == 0, 0, 1 / norms).astype(np.float32)
+        self._masks = {}
+        self._cache_version = self.store.version
+
+    def _mask(self, section: Optional[str]) -> np.ndarray:
+        """Boolean array over all rows: live, non-zero and in the section"""
+        mask = self._masks.get(section)
+        if mask is None:
+            mask = np.zeros(self.store.count, dtype=bool)
+            mask[self.store.live_rows(section)] = True
+            mask &= self._inverse_norms > 0
+            self._masks[section] = mask
+        return mask
+
+    def index_stale(self) -> bool:
+        """True if there is no IVF index or it no longer covers the store well"""
+        if self.index is None or self.index.generation != self.store.generation:
+            return True
+        return self.store.count - self.index.count > self.index.count * _REBUILD_RATIO
+
+    def build_index(self, n_lists: Optional[int] = None, **kwargs) -> IVFIndex:
+        """Build (or rebuild) the IVF index for the current store contents"""
+        started = time.perf_counter()
+        self.index = IVFIndex.build(self.store, n_lists, **kwargs)
+        self.logger.info(
+            f"Built IVF index with {self.index.n_lists} lists over "
+            f"{len(self.index.list_rows)} vectors in {time.perf_counter() - started:.1f}s"
+        )
+        return self.index
+
+    def search(
+        self,
+        query,
+        k: int = 10,
+        section: Optional[str] = None,
+        mode: str = "exact",
+        n_probe: int = 16,
+    ) -> List[Dict]:
+        """
+        Return the k stored sections most similar to a query embedding
+
+        Args:
+            query: Query embedding (same dimensions as the store)
+            k: Number of results
+            section: Only return this section (and its numbered passages)
+            mode: "exact" or "ivf"
+            n_probe: Inverted lists scanned per query in ivf mode
+
+        Returns:
+            Dicts with embeddingId, publicationId, section and score (cosine)
+        """
+        return self.search_batch([query], k, section, mode, n_probe)[0]
+
+    def search_batch(
+        self,
+        queries,
+        k: int = 10,
+        section: Optional[str] = None,
+        mode: str = "exact",
+        n_probe: int = 16,
+    ) -> List[List[Dict]]:
+        """search() for several query embeddings at once"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        # A zero vector (failed query embedding) scores every row the same
+        if not np.linalg.norm(queries, axis=1).all():
+            raise ValueError("Query embedding is all zeros")
+        queries = _normalize(queries)
+        if mode not in ("exact", "ivf"):
+            raise ValueError(f"Unknown search mode: {mode}")
+        self._refresh()
+        mask = self._mask(section)
+
+        if mode == "ivf" and self.index_stale():
+            self.build_index()
+        if mode == "exact" or not self.index.n_lists:
+            hits = self._exact(queries, k, mask)
+        else:
+            hits = [self._ivf(query, k, mask, n_probe) for query in queries]
+
+        return [self._results(scores, rows) for scores, rows in hits]
+
+    def _exact(
+        self, queries: np.ndarray, k: int, mask: np.ndarray
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        matrix = self.store.matrix()
+        best: List[List[Tuple[np.ndarray, np.ndarray]]] = [[] for _ in queries]
+
+        # Dense filters score contiguous memmap slices (no copy) and drop the
+        # masked rows afterwards; sparse ones gather just the matching rows
+        if len(mask) and mask.mean() >= _GATHER_BELOW:
+            blocks = (
+                np.arange(start, min(start + _SCORE_CHUNK, len(mask)))
+                for start in range(0, len(mask), _SCORE_CHUNK)
+            )
+        else:
+            rows = np.flatnonzero(mask)
+            blocks = (
+                rows[start : start + _SCORE_CHUNK]
+                for start in range(0, len(rows), _SCORE_CHUNK)
+            )
+
+        for chunk in blocks:
+            if len(chunk) and chunk[-1] - chunk[0] + 1 == len(chunk):
+                vectors = matrix[chunk[0] : chunk[-1] + 1]
+            else:
+                vectors = matrix[chunk]
+            # (chunk, queries) cosine scores for the whole batch of queries
+            scores = (vectors @ queries.T) * self._inverse_norms[chunk, None]
+            keep = mask[chunk]
+            if not keep.all():
+                scores, chunk = scores[keep], chunk[keep]
+            for i in range(len(queries)):
+                best[i].append(_top_k(scores[:, i], chunk, k))
+
+        return [
+            _top_k(
+                np.concatenate([s for s, _ in parts]) if parts else np.empty(0),
+                np.concatenate([r for _, r in parts]) if parts else np.empty(0, int),
+                k,
+            )
+            for parts in best
+        ]
+
+    def _ivf(
+        self, query: np.ndarray, k: int, mask: np.ndarray, n_probe: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        candidates = self.index.candidates(query, n_probe)
+        appended = np.arange(self.index.count, self.store.count)
+        candidates = np.concatenate([candidates, appended])
+        candidates = np.sort(candidates[mask[candidates]])
+
+        scores = (self.store.matrix()[candidates] @ query) * self._inverse_norms[
+            candidates
+        ]
+        return _top_k(scores, candidates, k)
+
+    def _results(self, scores: np.ndarray, rows: np.ndarray) -> List[Dict]:
+        results = self.store.row_metadata(rows)
+        for result, score in zip(results, scores):
+            result["score"] = float(score)
+        return results
+
+
+async def _embed_query(text: str) -> List[float]:
+    from config import load_config
+    from embedding_generator import EmbeddingGenerator
+
+    config = load_config()
+    generator = EmbeddingGenerator(config.gemini_api_key, task_type="RETRIEVAL_QUERY")
+    return await generator.generate_embedding(text)
+
+
+def main():
+    from storage import SQLiteStorage
+
+    parser = argparse.ArgumentParser(description="Search stored paper sections")
+    parser.add_argument("query")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--section", default=None)
+    parser.add_argument("--mode", choices=["exact", "ivf"], default="exact")
+    parser.add_argument("--n-probe", type=int, default=16)
+    parser.add_argument("--db", default="local_publications.sqlite")
+    args = parser.parse_args()
+
+    storage = SQLiteStorage(args.db)
+    try:
+        searcher = VectorSearch(storage.vectors)
+        index_path = os.path.join(storage.vectors.directory, "ivf.npz")
+        if args.mode == "ivf":
+            if os.path.exists(index_path):
+                searcher.index = IVFIndex.load(index_path)
+            if searcher.index_stale():
+                searcher.build_index().save(index_path)
+
+        query = asyncio.run(_embed_query(args.query))
+        results = searcher.search(query, args.k, args.section, args.mode, args.n_probe)
+        for result in results:
+            publication = storage.get_publication(result["publicationId"]) or {}
+            print(
+                f"{result['score']:.3f}  {result['section']:<14} {publication.get('title', result['publicationId'])}"
+            )
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
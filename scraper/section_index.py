@@ -0,0 +1,130 @@
+"""
+Single-pass section index for paper pages
+
+One walk over the document records every h2/h3/h4 heading together with the
+elements that follow it, plus the first element matching each fallback CSS
+selector. All section lookups (methods, results, ...) are then answered from
+the index instead of re-scanning the soup per section.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from bs4 import NavigableString, Tag
+
+# Headings that can start an indexed section, mapped to their rank
+HEADING_LEVELS = {"h2": 2, "h3": 3, "h4": 4}
+
+# Any heading of equal or higher rank ends a section
+_ALL_HEADING_LEVELS = {f"h{n}": n for n in range(1, 7)}
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_heading(text: str) -> str:
+    """Lowercase a heading and collapse its whitespace"""
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+@dataclass
+class IndexedSection:
+    """A heading and the span of sibling nodes that make up its body"""
+
+    heading: str
+    level: int
+    header: Tag
+
+    def nodes(self) -> Iterator:
+        """Siblings after the heading, up to the next heading of equal or higher rank"""
+        for node in self.header.next_siblings:
+            if isinstance(node, Tag):
+                level = _ALL_HEADING_LEVELS.get(node.name)
+                if level is not None and level <= self.level:
+                    return
+            yield node
+
+    def text(self) -> str:
+        """Text of the full section body"""
+        parts = []
+        for node in self.nodes():
+            if isinstance(node, Tag):
+                part = node.get_text().strip()
+            elif isinstance(node, NavigableString):
+                part = str(node).strip()
+            else:
+                continue
+            if part:
+                parts.append(part)
+        return "\n".join(parts)
+
+
+def _compile_selector(selector: str) -> Callable[[Tag], bool]:
+    """Build a matcher for the simple selectors used as section fallbacks"""
+    if selector.startswith("."):
+        name = selector[1:]
+        return lambda tag: name in (tag.get("class") or ())
+    if selector.startswith("#"):
+        name = selector[1:]
+        return lambda tag: tag.get("id") == name
+    match = re.fullmatch(r'\[id\*="([^"]+)"\]', selector)
+    if match:
+        name = match.group(1)
+        return lambda tag: name in (tag.get("id") or "")
+    raise ValueError(f"Unsupported section selector: {selector}")
+
+
+class SectionIndex:
+    """Index of a document's headed sections and fallback selector matches"""
+
+    def __init__(self, soup: Tag, selectors: Iterable[str] = ()):
+        self.sections: List[IndexedSection] = []
+        self.by_heading: Dict[str, IndexedSection] = {}
+        self._selector_hits: Dict[str, Tag] = {}
+
+        pending = {selector: _compile_selector(selector) for selector in selectors}
+
+        for tag in soup.find_all(True):
+            level = HEADING_LEVELS.get(tag.name)
+            if level is not None:
+                section = IndexedSection(
+                    heading=normalize_heading(tag.get_text()),
+                    level=level,
+                    header=tag,
+                )
+                self.sections.append(section)
+                self.by_heading.setdefault(section.heading, section)
+
+            # Record the first match (in document order) for each selector
+            if pending and (tag.get("id") or tag.get("class")):
+                for selector, matches in list(pending.items()):
+                    if matches(tag):
+                        self._selector_hits[selector] = tag
+                        del pending[selector]
+
+        # Higher-ranked headings win, then document order (sort is stable)
+        self.sections.sort(key=lambda section: section.level)
+
+    def get(self, heading: str) -> Optional[IndexedSection]:
+        """Look up a section by its exact (normalized) heading"""
+        return self.by_heading.get(normalize_heading(heading))
+
+    def find(self, keywords: Sequence[str], selectors: Sequence[str] = ()) -> str:
+        """
+        Return the body text of the first section whose heading contains a keyword
+
+        Falls back to the first element matching one of the selectors (tried
+        in order) when no heading matches.
+        """
+        for section in self.sections:
+            if any(keyword in section.heading for keyword in keywords):
+                text = section.text()
+                if text:
+                    return text
+
+        for selector in selectors:
+            tag = self._selector_hits.get(selector)
+            if tag is not None:
+                return tag.get_text().strip()
+
+        return ""
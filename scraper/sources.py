@@ -0,0 +1,128 @@
+"""
+Streaming readers for the list of papers to process
+
+Sources are read lazily, one record at a time, so link lists of any size are
+processed with constant memory. Supported inputs are CSV files, JSON Lines
+files (.jsonl/.ndjson) and standard input ("-"), either format.
+"""
+
+import csv
+import io
+import json
+import sys
+from itertools import islice
+from typing import Dict, Iterator, NamedTuple, Optional, Sequence, TextIO
+
+# Accepted column/key names, in order of preference
+TITLE_FIELDS = ("title", "Title", "TITLE")
+LINK_FIELDS = ("link", "Link", "LINK", "url", "URL")
+
+JSONL_EXTENSIONS = (".jsonl", ".ndjson")
+
+
+class SourceRecord(NamedTuple):
+    """A single paper to process"""
+
+    row_index: int
+    title: str
+    link: str
+
+
+def _resolve_field(fieldnames: Sequence[str], candidates: Sequence[str]) -> str:
+    """Pick the first candidate column present in fieldnames (or "" if none)"""
+    for name in candidates:
+        if name in fieldnames:
+            return name
+    return ""
+
+
+def detect_format(path: str, stream: Optional[TextIO] = None) -> str:
+    """Return "csv" or "jsonl" for a source path (peeking at stdin if needed)"""
+    if path.lower().endswith(JSONL_EXTENSIONS):
+        return "jsonl"
+    if stream is not None and hasattr(stream, "peek"):
+        head = stream.peek(64).lstrip()
+        if head.startswith(b"{"):
+            return "jsonl"
+    return "csv"
+
+
+def _iter_csv(stream: TextIO, start_row: int) -> Iterator[SourceRecord]:
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+
+    # Resolve column-name variants once instead of per row
+    title_col = _resolve_field(header, TITLE_FIELDS)
+    link_col = _resolve_field(header, LINK_FIELDS)
+    title_idx = header.index(title_col) if title_col else -1
+    link_idx = header.index(link_col) if link_col else -1
+
+    # Blank lines are not rows (matching the row numbering of earlier runs)
+    rows = (row for row in reader if row)
+
+    # Rows before the resume offset are still read and parsed, so quoted
+    # multi-line fields count as one row, but no records are built for them
+    for row_index, row in enumerate(islice(rows, start_row, None), start_row):
+        title = row[title_idx] if 0 <= title_idx < len(row) else ""
+        link = row[link_idx] if 0 <= link_idx < len(row) else ""
+        yield SourceRecord(row_index, title.strip(), link.strip())
+
+
+def _iter_jsonl(stream: TextIO, start_row: int) -> Iterator[SourceRecord]:
+    lines = (line for line in stream if line.strip())
+
+    # Lines before the resume offset are read but not decoded
+    for row_index, line in enumerate(islice(lines, start_row, None), start_row):
+        record: Dict = json.loads(line)
+        title_key = _resolve_field(list(record), TITLE_FIELDS)
+        link_key = _resolve_field(list(record), LINK_FIELDS)
+        title = str(record.get(title_key, "")) if title_key else ""
+        link = str(record.get(link_key, "")) if link_key else ""
+        yield SourceRecord(row_index, title.strip(), link.strip())
+
+
+def iter_sources(
+    path: str, start_row: int = 0, fmt: Optional[str] = None
+) -> Iterator[SourceRecord]:
+    """
+    Lazily yield SourceRecords from a CSV/JSONL file or stdin
+
+    Args:
+        path: File path, or "-" for standard input
+        start_row: Index of the first data row to yield (resume offset)
+        fmt: "csv" or "jsonl"; detected from the path/content if omitted
+
+    Resuming is not a seek: rows before start_row are read (and, for CSV,
+    parsed) to find where start_row begins, but no records are built.
+    """
+    if path == "-":
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="")
+        fmt = fmt or detect_format(path, sys.stdin.buffer)
+        yield from _read(stream, fmt, start_row)
+        return
+
+    fmt = fmt or detect_format(path)
+    with open(path, "r", encoding="utf-8", newline="") as stream:
+        yield from _read(stream, fmt, start_row)
+
+
+def _read(stream: TextIO, fmt: str, start_row: int) -> Iterator[SourceRecord]:
+    if fmt == "jsonl":
+        return _iter_jsonl(stream, start_row)
+    if fmt == "csv":
+        return _iter_csv(stream, start_row)
+    raise ValueError(f"Unsupported source format: {fmt}")
+
+
+def count_sources(path: str, fmt: Optional[str] = None) -> Optional[int]:
+    """Count the data rows in a source file, or None for stdin"""
+    if path == "-":
+        return None
+
+    fmt = fmt or detect_format(path)
+    with open(path, "r", encoding="utf-8", newline="") as stream:
+        if fmt == "jsonl":
+            return sum(1 for line in stream if line.strip())
+        return max(0, sum(1 for row in csv.reader(stream) if row) - 1)
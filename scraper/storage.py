@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Local storage backends for publications and embeddings
+
+SQLiteStorage is the default: every insert or status update is a single
+indexed write in its own transaction, so the cost per paper does not grow
+with the corpus and a crash never corrupts earlier data. JsonFileStorage
+keeps the original local_publications.json format (the whole file is
+rewritten on every change) and is mainly useful for small runs. Either
+backend can be exported to the JSON format with `python storage.py export`.
+
+SQLiteStorage keeps the embedding vectors themselves in a memory-mapped
+VectorStore next to the database (see vector_store.py).
+
+Publication writes are upserts by id. A publication's natural keys (PMC ID,
+DOI; see paper_keys.py) are given as its "naturalKeys" and can be looked up
+with find_by_keys, so a paper that is already stored is recognized before it
+is processed again.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from paper_keys import doi_key
+from vector_store import DEFAULT_DIMENSIONS, VectorStore
+
+
+class StorageBackend:
+    """Interface implemented by the local storage backends"""
+
+    def insert_publication(self, record: Dict) -> None:
+        """Store a publication record (must contain "id"), replacing one with the same id"""
+        raise NotImplementedError
+
+    def find_by_keys(self, keys: Sequence[str]) -> Optional[Tuple[str, str]]:
+        """(id, processingStatus) of the publication with any of the natural keys"""
+        raise NotImplementedError
+
+    def delete_embeddings(self, publication_id: str) -> int:
+        """Remove the embeddings of a publication; returns the number removed"""
+        raise NotImplementedError
+
+    def insert_embeddings(self, records: List[Dict]) -> None:
+        """Store embedding records (each with "id", "publicationId", "section", "embedding")"""
+        raise NotImplementedError
+
+    def update_status(self, publication_id: str, status: str, updated_at: str) -> bool:
+        """Set processingStatus of a publication; returns False if it does not exist"""
+        raise NotImplementedError
+
+    def iter_publications(self) -> Iterator[Dict]:
+        raise NotImplementedError
+
+    def iter_embeddings(self) -> Iterator[Dict]:
+        raise NotImplementedError
+
+    def export_json(self, path: str) -> None:
+        """Write all records in the local_publications.json format"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write('{"publications": [')
+            for i, record in enumerate(self.iter_publications()):
+                f.write(("," if i else "") + "\n" + json.dumps(record))
+            f.write('\n], "embeddings": [')
+            for i, record in enumerate(self.iter_embeddings()):
+                f.write(("," if i else "") + "\n" + json.dumps(record))
+            f.write("\n]}\n")
+        os.replace(tmp_path, path)
+
+    def close(self) -> None:
+        pass
+
+
+class JsonFileStorage(StorageBackend):
+    """Original storage format: one JSON document rewritten on every change"""
+
+    def __init__(self, path: str = "local_publications.json"):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+
+        # Initialize local storage file if it doesn't exist or is empty
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            self._save({"publications": [], "embeddings": []})
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            self.logger.warning("Local storage file is missing, reinitializing...")
+        except json.JSONDecodeError as e:
+            # Keep the unreadable file for recovery instead of overwriting it
+            corrupt_path = f"{self.path}.corrupt-{int(time.time())}"
+            os.replace(self.path, corrupt_path)
+            self.logger.error(
+                f"Local storage file is corrupted ({e}), moved it to {corrupt_path} "
+                f"and reinitializing..."
+            )
+        return {"publications": [], "embeddings": []}
+
+    def _save(self, data: Dict) -> None:
+        # Write to a temp file first so a crash cannot truncate the store
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def insert_publication(self, record: Dict) -> None:
+        data = self._load()
+        publications = data["publications"]
+        for i, pub in enumerate(publications):
+            if pub["id"] == record["id"]:
+                publications[i] = record
+                break
+        else:
+            publications.append(record)
+        self._save(data)
+
+    def find_by_keys(self, keys: Sequence[str]) -> Optional[Tuple[str, str]]:
+        if not keys:
+            return None
+        wanted = set(keys)
+        for pub in self._load()["publications"]:
+            if wanted.intersection(pub.get("naturalKeys") or ()):
+                return pub["id"], pub.get("processingStatus", "")
+        return None
+
+    def delete_embeddings(self, publication_id: str) -> int:
+        data = self._load()
+        kept = [
+            record
+            for record in data["embeddings"]
+            if record.get("publicationId") != publication_id
+        ]
+        removed = len(data["embeddings"]) - len(kept)
+        if removed:
+            data["embeddings"] = kept
+            self._save(data)
+        return removed
+
+    def insert_embeddings(self, records: List[Dict]) -> None:
+        data = self._load()
+        data["embeddings"].extend(records)
+        self._save(data)
+
+    def update_status(self, publication_id: str, status: str, updated_at: str) -> bool:
+        data = self._load()
+        for pub in data["publications"]:
+            if pub["id"] == publication_id:
+                pub["processingStatus"] = status
+                pub["updatedAt"] = updated_at
+                self._save(data)
+                return True
+        return False
+
+    def iter_publications(self) -> Iterator[Dict]:
+        return iter(self._load()["publications"])
+
+    def iter_embeddings(self) -> Iterator[Dict]:
+        return iter(self._load()["embeddings"])
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    SQLite-backed storage with indexed, transactional single-row writes
+
+    Records are kept as JSON documents next to the indexed columns used for
+    lookups; embedding vectors go to a VectorStore in `<path stem>.vectors/`.
+    """
+
+    def __init__(
+        self,
+        path: str = "local_publications.sqlite",
+        vector_dir: str = "",
+        dimensions: int = DEFAULT_DIMENSIONS,
+    ):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self.vectors = VectorStore(
+            vector_dir or f"{os.path.splitext(path)[0]}.vectors", dimensions
+        )
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS publications (
+                    id TEXT PRIMARY KEY,
+                    processing_status TEXT NOT NULL,
+                    updated_at TEXT,
+                    record TEXT NOT NULL
+                )
+                """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    id TEXT PRIMARY KEY,
+                    publication_id TEXT NOT NULL,
+                    section TEXT NOT NULL,
+                    record TEXT NOT NULL
+                )
+                """)
+            # Natural key -> publication (the pre-check before processing a paper)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS publication_keys (
+                    key TEXT PRIMARY KEY,
+                    publication_id TEXT NOT NULL
+                )
+                """)
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_publications_status ON publications(processing_status)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_embeddings_publication ON embeddings(publication_id)"
+            )
+        self._index_existing_keys()
+
+    def _index_existing_keys(self) -> None:
+        """Index the DOIs of publications stored before natural keys existed"""
+        if self.conn.execute("SELECT 1 FROM publication_keys LIMIT 1").fetchone():
+            return
+        rows = []
+        for publication_id, record_json in self.conn.execute(
+            "SELECT id, record FROM publications ORDER BY rowid"
+        ):
+            record = json.loads(record_json)
+            keys = record.get("naturalKeys") or [doi_key(record.get("doi", ""))]
+            rows.extend((key, publication_id) for key in keys if key)
+        if not rows:
+            return
+        with self.conn:
+            # The first of several duplicate publications keeps the key
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO publication_keys (key, publication_id) VALUES (?, ?)",
+                rows,
+            )
+        self.logger.info(f"Indexed {len(rows)} natural keys of stored publications")
+
+    def insert_publication(self, record: Dict) -> None:
+        record = dict(record)
+        status = record.pop("processingStatus", "processing")
+        updated_at = record.pop("updatedAt", None)
+        with self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO publications (id, processing_status, updated_at, record)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    processing_status = excluded.processing_status,
+                    updated_at = excluded.updated_at, record = excluded.record
+                """,
+                (record["id"], status, updated_at, json.dumps(record)),
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO publication_keys (key, publication_id) VALUES (?, ?)",
+                [(key, record["id"]) for key in record.get("naturalKeys") or ()],
+            )
+
+    def find_by_keys(self, keys: Sequence[str]) -> Optional[Tuple[str, str]]:
+        for key in keys:
+            row = self.conn.execute(
+                """
+                SELECT p.id, p.processing_status FROM publication_keys k
+                JOIN publications p ON p.id = k.publication_id
+                WHERE k.key = ?
+                """,
+                (key,),
+            ).fetchone()
+            if row is not None:
+                return row[0], row[1]
+        return None
+
+    def insert_embeddings(self, records: List[Dict]) -> None:
+        if not records:
+            return
+        rows = []
+        vectors = []
+        for record in records:
+            record = dict(record)
+            vectors.append(record.pop("embedding"))
+            rows.append(
+                (
+                    record["id"],
+                    record["publicationId"],
+                    record["section"],
+                    json.dumps(record),
+                )
+            )
+
+        ids = [row[0] for row in rows]
+        self.vectors.append(
+            ids, [row[1] for row in rows], [row[2] for row in rows], vectors
+        )
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO embeddings (id, publication_id, section, record) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+        except Exception:
+            # Search reads the vector store directly, so the appended rows
+            # must not stay live without their records
+            self.vectors.tombstone(ids)
+            raise
+
+    def update_status(self, publication_id: str, status: str, updated_at: str) -> bool:
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE publications SET processing_status = ?, updated_at = ? WHERE id = ?",
+                (status, updated_at, publication_id),
+            )
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def _publication(status: str, updated_at: Optional[str], record_json: str) -> Dict:
+        record = json.loads(record_json)
+        record["processingStatus"] = status
+        if updated_at is not None:
+            record["updatedAt"] = updated_at
+        return record
+
+    def iter_publications(self) -> Iterator[Dict]:
+        rows = self.conn.execute(
+            "SELECT processing_status, updated_at, record FROM publications ORDER BY rowid"
+        )
+        for row in rows:
+            yield self._publication(*row)
+
+    def get_publication(self, publication_id: str) -> Optional[Dict]:
+        """Look up a publication record by id"""
+        row = self.conn.execute(
+            "SELECT processing_status, updated_at, record FROM publications WHERE id = ?",
+            (publication_id,),
+        ).fetchone()
+        return self._publication(*row) if row is not None else None
+
+    def iter_embeddings(self) -> Iterator[Dict]:
+        matrix = self.vectors.matrix()
+        row_of = {
+            embedding_id: row
+            for row, embedding_id in self.vectors.conn.execute(
+                "SELECT row, embedding_id FROM rows WHERE deleted = 0"
+            )
+        }
+        rows = self.conn.execute("SELECT id, record FROM embeddings ORDER BY rowid")
+        for embedding_id, record_json in rows:
+            row = row_of.get(embedding_id)
+            if row is None:
+                continue
+            record = json.loads(record_json)
+            record["embedding"] = matrix[row].tolist()
+            yield record
+
+    def delete_embeddings(self, publication_id: str) -> int:
+        removed = self.vectors.tombstone(publication_id=publication_id)
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM embeddings WHERE publication_id = ?", (publication_id,)
+            )
+        return removed
+
+    def import_json(self, path: str) -> None:
+        """Load records from a local_publications.json file"""
+        with open(path, "r") as f:
+            data = json.load(f)
+        for record in data.get("publications", []):
+            self.insert_publication(record)
+        self.insert_embeddings(data.get("embeddings", []))
+
+    def close(self) -> None:
+        self.conn.close()
+        self.vectors.close()
+
+
+def create_storage(backend: str, path: str = "") -> StorageBackend:
+    """Create a storage backend by name ("sqlite" or "json")"""
+    if backend == "sqlite":
+        return SQLiteStorage(path or "local_publications.sqlite")
+    if backend == "json":
+        return JsonFileStorage(path or "local_publications.json")
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local publication storage tools")
+    parser.add_argument("command", choices=["export", "import", "compact"])
+    parser.add_argument(
+        "json_path",
+        nargs="?",
+        default="local_publications.json",
+        help="local_publications.json file (export/import)",
+    )
+    parser.add_argument("--db", default="local_publications.sqlite")
+    args = parser.parse_args()
+
+    storage = SQLiteStorage(args.db)
+    try:
+        if args.command == "export":
+            storage.export_json(args.json_path)
+        elif args.command == "import":
+            storage.import_json(args.json_path)
+        else:
+            removed = storage.vectors.compact()
+            print(f"Removed {removed} deleted vectors, {storage.vectors.count} remain")
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
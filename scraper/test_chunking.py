@@ -0,0 +1,55 @@
+"""Tests for full-text passage chunking"""
+
+from chunking import chunk_sections, chunk_text
+
+
+def _text(words: int, prefix: str = "word") -> str:
+    return " ".join(f"{prefix}{i}" for i in range(words))
+
+
+def test_offsets_point_at_the_passage_text():
+    text = _text(2000)
+    chunks = chunk_text(text, max_tokens=128, overlap_tokens=16)
+    assert len(chunks) > 1
+    for index, chunk in enumerate(chunks):
+        assert chunk.index == index
+        assert text[chunk.start : chunk.end] == chunk.text
+        # Passages start and end on word boundaries
+        assert chunk.start == 0 or text[chunk.start - 1] == " "
+        assert chunk.end == len(text) or text[chunk.end] == " "
+
+
+def test_consecutive_passages_overlap_and_cover_the_text():
+    text = _text(2000)
+    chunks = chunk_text(text, max_tokens=128, overlap_tokens=16)
+    assert chunks[0].start == 0
+    assert chunks[-1].end == len(text)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert previous.start < chunk.start < previous.end
+
+
+def test_sections_are_not_crossed():
+    sections = [_text(600, "intro"), _text(600, "methods"), _text(600, "results")]
+    text = "\n".join(sections)
+    starts = [0, len(sections[0]) + 1, len(sections[0]) + len(sections[1]) + 2]
+
+    chunks = chunk_sections(text, starts, max_tokens=128, overlap_tokens=16)
+    assert [chunk.index for chunk in chunks] == list(range(len(chunks)))
+    for chunk in chunks:
+        assert text[chunk.start : chunk.end] == chunk.text
+        # Every passage lies within a single section
+        assert sum(chunk.start < start < chunk.end for start in starts) == 0
+
+
+def test_short_sections_merge_into_the_next():
+    heading = "Methods"
+    body = _text(600)
+    text = f"{heading}\n{body}"
+    chunks = chunk_sections(text, [0, len(heading) + 1], max_tokens=128)
+    assert chunks[0].start == 0
+    assert chunks[0].text.startswith("Methods\nword0")
+
+
+def test_empty_text():
+    assert chunk_text("") == []
+    assert chunk_sections("   ", [0]) == []
@@ -0,0 +1,158 @@
+"""Tests for page parsing and entity extraction (no network or API key needed)"""
+
+import asyncio
+import json
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from config import PaperData
+from extraction import (
+    EntityExtractionError,
+    PaperExtractor,
+    results_by_id,
+    validate_entities,
+)
+from paper_parser import parse_paper_html
+from rate_limiter import parse_rate_limits
+
+PAGE = """<html><head><title>Roots</title>
+<script>var tracking = 1;</script><style>.a { color: red }</style>
+<meta name="citation_doi" content="10.1000/roots.1"></head><body>
+<div class="usa-banner">An official website of the United States government</div>
+<nav class="breadcrumb"><a>Home</a> / <a>PMC</a></nav>
+<main><article>
+<h1 class="content-title">Microgravity and roots</h1>
+<section class="abstract"><h2>Abstract</h2><p>Roots grow oddly in space.</p></section>
+<section><h2>Methods</h2><p>We flew <i>Arabidopsis</i> to the ISS.</p></section>
+<section><h2>Results</h2><p>Growth changed under microgravity.</p></section>
+<section class="ref-list"><h2>References</h2><ul><li>Smith 2020</li></ul></section>
+</article></main>
+<footer>Footer links</footer></body></html>"""
+
+
+@pytest.fixture
+def extractor():
+    return PaperExtractor("test-key")
+
+
+def test_clean_text_drops_page_chrome_and_references():
+    parsed = parse_paper_html(PAGE, "https://example.org/PMC1/")
+    clean_text = parsed["clean_text"]
+
+    assert "We flew Arabidopsis to the ISS." in clean_text
+    for chrome in ("tracking", "official website", "Home", "Smith 2020", "Footer"):
+        assert chrome not in clean_text
+    headings = [
+        clean_text[section["start"] :].split("\n", 1)[0]
+        for section in parsed["text_sections"]
+    ]
+    assert "Methods" in headings and "Results" in headings
+
+
+def test_paper_data_stores_the_clean_text_not_the_page(extractor):
+    paper_data = extractor.build_paper_data(PAGE, "https://example.org/PMC1/", "Roots")
+
+    assert paper_data.full_text == paper_data.clean_text
+    assert "<" not in paper_data.full_text
+    assert paper_data.doi == "10.1000/roots.1"
+    assert extractor.clean_text_chars < extractor.raw_text_chars
+
+
+ENTITIES = {
+    "organisms": ["Mus musculus"],
+    "experimental_conditions": ["microgravity"],
+    "biological_processes": ["bone loss"],
+    "space_environments": ["ISS"],
+}
+
+
+class ScriptedModel:
+    """Generative model answering batched prompts with answer(paper_ids)"""
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.prompts = []
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        self.prompts.append(prompt)
+        paper_ids = re.findall(r"=== PAPER (P\d+) ===", prompt)
+        return SimpleNamespace(text=json.dumps(self.answer(paper_ids)))
+
+
+def _batch_extractor(answer):
+    extractor = PaperExtractor("test-entities")
+    extractor.rate_limiter.configure(
+        parse_rate_limits("gemini-2.0-flash=60000/100000000/0")
+    )
+    extractor.model = ScriptedModel(answer)
+    return extractor
+
+
+def _papers(count):
+    return [
+        PaperData(f"Paper {i}", [], "", "", "", "", [], clean_text=f"Text of paper {i}")
+        for i in range(count)
+    ]
+
+
+def test_validate_entities_normalizes_and_rejects_malformed_results():
+    entities = validate_entities(
+        {
+            "organisms": ["  Mus  musculus ", "mus musculus", "", "x" * 300, {"a": 1}],
+            "experimental_conditions": ["microgravity."],
+        }
+    )
+    assert entities["organisms"] == ["Mus musculus"]
+    assert entities["experimental_conditions"] == ["microgravity"]
+    assert entities["space_environments"] == []
+    assert validate_entities({"organisms": "Mus musculus"}) is None
+    assert validate_entities(["organisms"]) is None
+
+
+def test_results_by_id():
+    assert results_by_id([{"id": "P1", **ENTITIES}, {"no": "id"}]) == {
+        "P1": {"id": "P1", **ENTITIES}
+    }
+    assert results_by_id({"P2": ENTITIES}) == {"P2": ENTITIES}
+    assert results_by_id("not json") == {}
+
+
+def test_papers_share_a_request_and_only_bad_results_are_resent():
+    def answer(paper_ids):
+        results = []
+        for paper_id in paper_ids:
+            if len(paper_ids) == 3 and paper_id == "P1":
+                results.append({"id": paper_id, "organisms": "not a list"})
+            elif len(paper_ids) == 3 and paper_id == "P2":
+                continue
+            else:
+                results.append({"id": paper_id, **ENTITIES})
+        return results
+
+    extractor = _batch_extractor(answer)
+    papers = _papers(3)
+
+    errors = asyncio.run(extractor.apply_entities_batch(papers, [""] * 3))
+
+    assert errors == [None, None, None]
+    assert len(extractor.model.prompts) == 2
+    assert "Text of paper 0" not in extractor.model.prompts[1]
+    assert all(paper.organisms == ["Mus musculus"] for paper in papers)
+
+
+def test_papers_without_a_valid_result_are_reported_not_stored_empty():
+    extractor = _batch_extractor(
+        lambda paper_ids: [
+            {"id": paper_id, **ENTITIES} for paper_id in paper_ids if paper_id != "P1"
+        ]
+    )
+    papers = _papers(2)
+
+    errors = asyncio.run(extractor.apply_entities_batch(papers, ["", ""]))
+
+    assert errors[0] is None
+    assert isinstance(errors[1], EntityExtractionError)
+    assert papers[1].organisms is None
+    assert len(extractor.model.prompts) == extractor.ENTITY_BATCH_ATTEMPTS
@@ -0,0 +1,63 @@
+"""Tests for the on-disk response cache"""
+
+import os
+import time
+
+import pytest
+
+from http_cache import ResponseCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / "cache"), ttl_seconds=60, max_bytes=3000)
+
+
+def _age(cache, url, seconds):
+    """Make the entry of url look last used the given seconds ago"""
+    used = time.time() - seconds
+    os.utime(cache._entry_path(url), (used, used))
+
+
+def test_store_and_get(cache):
+    cache.store("https://example.org/a", "page a", etag='"1"')
+    entry = cache.get("https://example.org/a")
+    assert entry.body == "page a"
+    assert cache.is_fresh(entry)
+    assert cache.conditional_headers(entry) == {"If-None-Match": '"1"'}
+    assert cache.get("https://example.org/missing") is None
+
+
+def test_identical_bodies_are_stored_once(cache):
+    cache.store("https://example.org/a", "same page")
+    cache.store("https://example.org/b", "same page")
+    assert len(os.listdir(cache.bodies_dir)) == 1
+    assert cache.total_bytes == len("same page")
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    for name, age in (("a", 30), ("b", 20), ("c", 10)):
+        cache.store(f"https://example.org/{name}", name * 900)
+        _age(cache, f"https://example.org/{name}", age)
+    # A hit makes "a" the most recently used entry
+    cache.get("https://example.org/a")
+
+    cache.store("https://example.org/d", "d" * 900)
+
+    assert cache.get("https://example.org/b") is None
+    for name in ("a", "c", "d"):
+        assert cache.get(f"https://example.org/{name}") is not None
+    assert cache.total_bytes == 2700
+
+
+def test_bodies_of_changed_pages_are_evicted_first(cache):
+    for version in range(3):
+        cache.store("https://example.org/a", f"{version}" * 1000)
+    assert cache.total_bytes == 3000
+
+    # Over budget: the two unreferenced old bodies go, no entry is evicted
+    cache.store("https://example.org/b", "b" * 100)
+    assert cache.total_bytes == 1100
+    assert len(os.listdir(cache.bodies_dir)) == 2
+    assert cache.get("https://example.org/a").body == "2" * 1000
+    assert cache.get("https://example.org/b") is not None
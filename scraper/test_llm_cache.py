@@ -0,0 +1,98 @@
+"""Tests for the persistent LLM result cache"""
+
+import asyncio
+import json
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from extraction import PaperExtractor
+from llm_cache import LLMCache
+from rate_limiter import parse_rate_limits
+
+ENTITIES = {
+    "organisms": ["Arabidopsis thaliana"],
+    "experimental_conditions": [],
+    "biological_processes": ["root growth"],
+    "space_environments": ["ISS"],
+}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm_cache.sqlite"))
+    yield cache
+    cache.close()
+
+
+class CountingModel:
+    """Generative model answering every paper of a batched prompt with ENTITIES"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        self.calls += 1
+        paper_ids = re.findall(r"=== PAPER (P\d+) ===", prompt)
+        results = [{"id": paper_id, **ENTITIES} for paper_id in paper_ids]
+        return SimpleNamespace(text=json.dumps(results))
+
+
+def test_results_round_trip_per_model_and_version(cache):
+    cache.put("model-a", "v1", "some text", ENTITIES)
+
+    assert cache.get("model-a", "v1", "some text") == ENTITIES
+    assert cache.get("model-a", "v2", "some text") is None
+    assert cache.get("model-b", "v1", "some text") is None
+    assert cache.get("model-a", "v1", "other text") is None
+
+
+def test_get_many_keeps_the_order_and_counts_hits(cache):
+    cache.put_many("model", "v1", ["a", "b"], [{"n": 1}, {"n": 2}])
+
+    assert cache.get_many("model", "v1", ["b", "missing", "a", "b"]) == [
+        {"n": 2},
+        None,
+        {"n": 1},
+        {"n": 2},
+    ]
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (3, 1, 2)
+    assert stats["hit_rate"] == 0.75
+
+
+def test_prune_drops_old_prompt_versions_of_one_model(cache):
+    cache.put("model-a", "v1", "text", {"n": 1})
+    cache.put("model-a", "v2", "text", {"n": 2})
+    cache.put("model-b", "v1", "text", {"n": 3})
+
+    assert cache.prune("model-a", "v2") == 1
+
+    assert cache.get("model-a", "v2", "text") == {"n": 2}
+    assert cache.get("model-b", "v1", "text") == {"n": 3}
+    assert cache.invalidate("v1") == 1
+    assert cache.get_stats()["entries"] == 1
+
+
+def test_cached_papers_are_not_sent_to_the_model(cache):
+    def extractor():
+        extractor = PaperExtractor("test-llm-cache", llm_cache=cache)
+        extractor.rate_limiter.configure(
+            parse_rate_limits("gemini-2.0-flash=60000/100000000/0")
+        )
+        extractor.model = CountingModel()
+        return extractor
+
+    first = extractor()
+    asyncio.run(first._extract_entities_batch(["Roots on the ISS."]))
+    assert first.model.calls == 1
+    assert cache.get_stats()["entries"] == 1
+
+    second = extractor()
+    results, errors = asyncio.run(second._extract_entities_batch(["Roots on the ISS."]))
+
+    assert second.model.calls == 0
+    assert results == [ENTITIES]
+    assert errors == [None]
+    assert cache.get_stats()["entries"] == 1
@@ -0,0 +1,101 @@
+"""Tests for the metrics registry and its exporters"""
+
+import asyncio
+import json
+
+import pytest
+
+from metrics import Histogram, MetricsExporter, MetricsRegistry
+
+
+def test_prometheus_text_format():
+    registry = MetricsRegistry()
+    registry.counter("papers_total", "Papers processed", status="done").inc(3)
+    registry.gauge("jobs_in_flight").set(2.5)
+    histogram = registry.histogram("stage_seconds", buckets=(0.1, 1.0), stage="fetch")
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+
+    assert registry.render_prometheus() == (
+        "# TYPE umbra_jobs_in_flight gauge\n"
+        "umbra_jobs_in_flight 2.5\n"
+        "# HELP umbra_papers_total Papers processed\n"
+        "# TYPE umbra_papers_total counter\n"
+        'umbra_papers_total{status="done"} 3\n'
+        "# TYPE umbra_stage_seconds histogram\n"
+        'umbra_stage_seconds_bucket{stage="fetch",le="0.1"} 1\n'
+        'umbra_stage_seconds_bucket{stage="fetch",le="1"} 2\n'
+        'umbra_stage_seconds_bucket{stage="fetch",le="+Inf"} 2\n'
+        'umbra_stage_seconds_sum{stage="fetch"} 0.55\n'
+        'umbra_stage_seconds_count{stage="fetch"} 2\n'
+    )
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry(namespace="")
+    registry.counter("errors", error='say "hi"\n').inc()
+
+    assert 'errors{error="say \\"hi\\"\\n"} 1' in registry.render_prometheus()
+
+
+def test_metrics_are_keyed_by_name_and_labels():
+    registry = MetricsRegistry()
+
+    assert registry.counter("c", a=1, b=2) is registry.counter("c", b="2", a="1")
+    assert registry.counter("c", a=1) is not registry.counter("c", a=2)
+    with pytest.raises(ValueError):
+        registry.gauge("c")
+
+
+def test_histogram_quantiles_stay_within_the_observations():
+    histogram = Histogram(buckets=(1.0, 2.0, 4.0))
+    for value in (0.5, 1.5, 1.5, 3.0):
+        histogram.observe(value)
+
+    assert histogram.quantile(0.5) == pytest.approx(1.5)
+    assert 2.0 <= histogram.quantile(0.95) <= 3.0
+    assert histogram.quantile(1.0) == 3.0
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_snapshot_and_summary_table():
+    registry = MetricsRegistry()
+    registry.histogram("stage_seconds", stage="parse").observe(0.2)
+    registry.histogram("stage_seconds", stage="fetch")
+    registry.counter("papers_total").inc(4)
+    registry.counter("unused_total")
+
+    snapshot = registry.snapshot()
+    fetch, parse = snapshot["metrics"]["stage_seconds"]
+    assert parse["count"] == 1 and parse["max"] == pytest.approx(0.2)
+    assert fetch["count"] == 0
+    assert snapshot["metrics"]["papers_total"] == [{"labels": {}, "value": 4.0}]
+
+    table = registry.summary_table().splitlines()
+    assert table[0].split() == [
+        "histogram",
+        "count",
+        "mean",
+        "p50",
+        "p95",
+        "max",
+        "total",
+    ]
+    assert table[2].startswith('stage_seconds{stage="parse"}')
+    assert table[3:] == ["papers_total = 4"]
+
+
+def test_exporter_writes_a_final_snapshot(tmp_path):
+    registry = MetricsRegistry()
+    registry.counter("papers_total").inc()
+    path = tmp_path / "metrics.json"
+    exporter = MetricsExporter(registry, snapshot_path=str(path))
+
+    async def run():
+        await exporter.start()
+        await exporter.close()
+
+    asyncio.run(run())
+
+    assert json.loads(path.read_text())["metrics"]["papers_total"][0]["value"] == 1
+    assert not (tmp_path / "metrics.json.tmp").exists()
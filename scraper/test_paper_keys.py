@@ -0,0 +1,82 @@
+"""Tests for the natural keys of papers and upserts by key"""
+
+import asyncio
+
+from config import PaperData
+from database import ConvexDatabase
+from paper_keys import doi_key, link_keys, paper_keys, pmc_key, url_key
+
+
+def test_doi_key_normalizes_prefixes_urls_and_case():
+    expected = "doi:10.1038/npjmgrav.2015.12"
+    assert doi_key("10.1038/NPJMGRAV.2015.12") == expected
+    assert doi_key("doi: 10.1038/npjmgrav.2015.12") == expected
+    assert doi_key("DOI:10.1038/npjmgrav.2015.12") == expected
+    assert doi_key("https://doi.org/10.1038/npjmgrav.2015.12") == expected
+
+
+def test_doi_key_strips_sentence_punctuation():
+    assert doi_key("see 10.1371/journal.pone.0123456.") == (
+        "doi:10.1371/journal.pone.0123456"
+    )
+    assert doi_key("(10.1371/journal.pone.0123456)") == (
+        "doi:10.1371/journal.pone.0123456"
+    )
+
+
+def test_doi_key_without_doi():
+    assert doi_key("") is None
+    assert doi_key("not a doi") is None
+    assert doi_key("10.12/too-short-registrant") is None
+
+
+def test_pmc_and_link_keys():
+    link = "https://www.ncbi.nlm.nih.gov/pmc/articles/pmc4136787/"
+    assert pmc_key(link) == "pmc:PMC4136787"
+    assert link_keys(link) == ["pmc:PMC4136787"]
+    assert link_keys("https://example.org/paper") == [
+        url_key("https://example.org/paper")
+    ]
+    assert link_keys("") == []
+
+
+def test_url_key_ignores_host_case_fragment_and_trailing_slash():
+    key = url_key("https://example.org/papers/1")
+    assert key.startswith("url:")
+    assert url_key("HTTPS://Example.org/papers/1/#results") == key
+    assert url_key("https://example.org/papers/2") != key
+
+
+def test_paper_keys_adds_the_doi_once():
+    link = "https://doi.org/10.1038/npjmgrav.2015.12"
+    assert paper_keys(link, "10.1038/npjmgrav.2015.12") == [
+        "doi:10.1038/npjmgrav.2015.12"
+    ]
+    assert paper_keys(
+        "https://www.ncbi.nlm.nih.gov/pmc/articles/PMC1/", "10.1000/xyz"
+    ) == ["pmc:PMC1", "doi:10.1000/xyz"]
+
+
+def _paper(title):
+    return PaperData(title, [], "Abstract", "", "", "", [], clean_text=title)
+
+
+def test_publications_are_upserted_by_natural_key(tmp_path):
+    db = ConvexDatabase(
+        "", "", "test-key", storage_path=str(tmp_path / "publications.sqlite")
+    )
+    keys = link_keys("https://example.org/papers/1")
+
+    async def insert_twice():
+        first = await db.insert_publication(_paper("First attempt"), keys)
+        second = await db.insert_publication(_paper("Retry"), keys)
+        other = await db.insert_publication(_paper("Other"), ["pmc:PMC7"])
+        return first, second, other
+
+    first, second, other = asyncio.run(insert_twice())
+
+    assert first == second != other
+    titles = [pub["title"] for pub in db.storage.iter_publications()]
+    assert titles == ["Retry", "Other"]
+    assert asyncio.run(db.find_publication(keys)) == (first, "processing")
+    asyncio.run(db.close())
@@ -0,0 +1,206 @@
+"""Tests for failure handling and retries of the ingestion pipeline"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+from config import Configuration, PaperData
+from extraction import EntityExtractionError
+from pipeline import IngestionPipeline
+from progress_tracker import ProgressTracker
+from rate_limiter import QuotaExhaustedError
+
+
+class FakeExtractor:
+    """Extractor whose stages fail for the rows in `failing[stage]`"""
+
+    def __init__(self):
+        self.failing = {"fetch": set(), "parse": set(), "entities": set()}
+        self.calls = {"fetch": 0, "parse": 0, "entities": 0}
+
+    async def fetch_paper_content(self, link):
+        self.calls["fetch"] += 1
+        if _row(link) in self.failing["fetch"]:
+            raise httpx.ReadTimeout("slow server")
+        return f"<p>page {link}</p>"
+
+    async def build_paper_data_async(self, content, link, title):
+        self.calls["parse"] += 1
+        if _row(link) in self.failing["parse"]:
+            raise ValueError("bad html")
+        return PaperData(
+            title, [], f"Abstract of {title}", "", "", "", [], clean_text=title
+        )
+
+    async def apply_entities_batch(self, papers, contents):
+        errors = []
+        for paper in papers:
+            self.calls["entities"] += 1
+            if _row(paper.title) in self.failing["entities"]:
+                errors.append(EntityExtractionError("malformed result"))
+            else:
+                paper.organisms = ["mouse"]
+                errors.append(None)
+        return errors
+
+
+class FakeDatabase:
+    """Database whose embedding requests raise `embedding_error` if set"""
+
+    def __init__(self):
+        self.embedding_error = None
+        self.stored = {}
+
+    async def find_publication(self, keys):
+        return None
+
+    async def generate_embeddings_batch(self, papers):
+        if self.embedding_error is not None:
+            raise self.embedding_error
+        return [({"abstract": [0.5] * 4}, {}) for _ in papers]
+
+    async def insert_publication(self, paper_data, keys=()):
+        self.stored[paper_data.title] = paper_data
+        return paper_data.title
+
+    async def save_embeddings(self, publication_id, embeddings, offsets=None):
+        pass
+
+    async def update_processing_status(self, publication_id, status):
+        pass
+
+
+def _row(text):
+    return int(text.rsplit("/", 1)[-1].removeprefix("paper "))
+
+
+def _rows(count):
+    return [(i, f"paper {i}", f"https://example.org/{i}") for i in range(count)]
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    tracker = ProgressTracker(
+        str(tmp_path / "progress.sqlite"), str(tmp_path / "progress.json")
+    )
+    yield tracker
+    tracker.close()
+
+
+def _pipeline(tracker, max_attempts=5, **settings):
+    config = Configuration("", "", "", "")
+    config.retry_max_attempts = max_attempts
+    for name, value in settings.items():
+        setattr(config, name, value)
+    return IngestionPipeline(FakeExtractor(), FakeDatabase(), tracker, config, 4)
+
+
+def _failures(tracker):
+    return {
+        failure["row"]: (failure["stage"], failure["error_class"])
+        for failure in tracker.failed_papers()
+    }
+
+
+def test_failures_are_queued_with_their_stage_and_class(tracker):
+    pipeline = _pipeline(tracker)
+    pipeline.extractor.failing.update(fetch={0}, parse={1}, entities={2})
+
+    assert asyncio.run(pipeline.run(_rows(4))) == (1, 3)
+
+    assert _failures(tracker) == {
+        0: ("fetch", "timeout"),
+        1: ("parse", "parse"),
+        2: ("entities", "llm"),
+    }
+    assert list(pipeline.convex_db.stored) == ["paper 3"]
+    assert tracker.settled_rows() == {0, 1, 2, 3}
+
+
+def test_embedding_errors_keep_their_class(tracker):
+    pipeline = _pipeline(tracker)
+    pipeline.convex_db.embedding_error = Exception("429 Resource has been exhausted")
+
+    asyncio.run(pipeline.run(_rows(2)))
+
+    assert _failures(tracker) == {
+        0: ("embeddings", "rate_limited"),
+        1: ("embeddings", "rate_limited"),
+    }
+
+
+def test_retries_resume_at_the_failed_stage(tracker):
+    pipeline = _pipeline(tracker)
+    pipeline.extractor.failing.update(parse={1}, entities={2})
+    pipeline.convex_db.embedding_error = asyncio.TimeoutError()
+    asyncio.run(pipeline.run(_rows(3)))
+    assert tracker.due_retries() == []
+
+    pipeline.extractor.failing.update(parse=set(), entities=set())
+    pipeline.convex_db.embedding_error = None
+    pipeline.extractor.calls.update(fetch=0, parse=0, entities=0)
+    due = tracker.due_retries(now=time.time() + 10**6)
+    assert {retry["row"]: retry["stage"] for retry in due} == {
+        0: "embeddings",
+        1: "parse",
+        2: "entities",
+    }
+
+    processed, _ = asyncio.run(pipeline.retry(due))
+    assert processed == 3
+    # Nothing is fetched again; only the row that failed parsing is parsed
+    assert pipeline.extractor.calls == {"fetch": 0, "parse": 1, "entities": 2}
+    assert pipeline.convex_db.stored["paper 0"].organisms == ["mouse"]
+    assert tracker.status_counts() == {"done": 3}
+
+
+def test_rows_failing_too_often_become_dead_letters(tracker):
+    pipeline = _pipeline(tracker, max_attempts=2)
+    pipeline.extractor.failing["parse"] = {0}
+
+    asyncio.run(pipeline.run(_rows(1)))
+    asyncio.run(pipeline.retry(tracker.due_retries(now=time.time() + 10**6)))
+
+    assert tracker.failed_papers() == []
+    (dead,) = tracker.dead_letters()
+    assert (dead["row"], dead["attempts"], dead["stage"]) == (0, 2, "parse")
+    assert pipeline.dead_count == 1
+
+
+def test_used_up_daily_quota_parks_rows_until_the_reset(tracker):
+    pipeline = _pipeline(tracker, max_attempts=1)
+    reset_at = datetime.now().astimezone() + timedelta(hours=5)
+    pipeline.convex_db.embedding_error = QuotaExhaustedError(
+        "text-embedding-004", reset_at, reset_at.timestamp() + 5
+    )
+
+    asyncio.run(pipeline.run(_rows(1)))
+
+    # Not a dead letter despite max_attempts=1, and due right after the reset
+    assert tracker.dead_letters() == []
+    (parked,) = tracker.failed_papers()
+    assert parked["error_class"] == "rate_limited"
+    assert parked["retry_at"] == pytest.approx(reset_at.timestamp() + 5, abs=1)
+
+
+def test_bounded_queues_process_every_row(tracker):
+    pipeline = _pipeline(tracker, queue_size=1, fetch_workers=3, entity_paper_batch=4)
+
+    assert asyncio.run(pipeline.run(_rows(50))) == (50, 0)
+
+    assert len(pipeline.convex_db.stored) == 50
+    assert tracker.status_counts() == {"done": 50}
+
+
+def test_a_failing_source_stops_the_pipeline(tracker):
+    pipeline = _pipeline(tracker)
+
+    def rows():
+        yield from _rows(2)
+        raise OSError("source went away")
+
+    with pytest.raises(OSError, match="source went away"):
+        asyncio.run(pipeline.run(rows()))
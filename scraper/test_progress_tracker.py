@@ -0,0 +1,86 @@
+"""Tests for the progress ledger: resume offsets, retries and requeueing"""
+
+import time
+
+import pytest
+
+from progress_tracker import ProgressTracker
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    tracker = ProgressTracker(
+        str(tmp_path / "progress.sqlite"), str(tmp_path / "progress.json")
+    )
+    yield tracker
+    tracker.close()
+
+
+def _fail(tracker, row, retry_at, link="https://example.org/PMC1/"):
+    tracker.start_row(row, f"title {row}", link, "fetch")
+    tracker.mark_failed(
+        row,
+        f"title {row}",
+        "boom",
+        stage="fetch",
+        error_class="fetch",
+        retry_at=retry_at,
+        checkpoint='{"keys": []}',
+    )
+
+
+def test_resume_offset_skips_rows_done_in_any_order(tracker):
+    assert tracker.first_unfinished_row() == 0
+    for row in (2, 0, 1, 4):
+        tracker.mark_done(row, f"title {row}")
+    assert tracker.first_unfinished_row() == 3
+    assert tracker.load_progress()["last_processed_row"] == 2
+
+    tracker.mark_done(3)
+    assert tracker.first_unfinished_row() == 5
+
+
+def test_unfinished_rows_are_not_settled(tracker):
+    tracker.mark_done(0)
+    tracker.start_row(1, "in flight", "https://example.org/PMC2/", "parse")
+    _fail(tracker, 2, retry_at=time.time() + 60)
+    _fail(tracker, 3, retry_at=0, link="")  # imported failure, no link
+
+    assert [tracker.is_settled(row) for row in range(4)] == [
+        True,
+        False,
+        True,
+        False,
+    ]
+    assert tracker.settled_rows() == {0, 2}
+    assert tracker.first_unfinished_row(settled=True) == 1
+
+
+def test_due_retries_come_with_their_checkpoint(tracker):
+    now = time.time()
+    _fail(tracker, 0, retry_at=now + 600)
+    _fail(tracker, 1, retry_at=now - 1)
+
+    due = tracker.due_retries(now=now)
+    assert [retry["row"] for retry in due] == [1]
+    assert due[0]["stage"] == "fetch"
+    assert due[0]["checkpoint"] == '{"keys": []}'
+    assert tracker.next_retry_at() == pytest.approx(now - 1)
+
+    tracker.mark_done(1)
+    assert tracker.due_retries(now=now + 3600)[0]["row"] == 0
+
+
+def test_requeue_moves_dead_rows_back(tracker):
+    for row in (0, 1):
+        tracker.start_row(row, f"title {row}", "https://example.org/PMC1/", "fetch")
+        tracker.mark_dead(row, f"title {row}", "gave up", stage="fetch")
+    assert [paper["row"] for paper in tracker.dead_letters()] == [0, 1]
+
+    assert tracker.requeue([1]) == 1
+    assert [paper["row"] for paper in tracker.dead_letters()] == [0]
+    assert tracker.attempts(1) == 0
+    assert [retry["row"] for retry in tracker.due_retries()] == [1]
+
+    assert tracker.requeue() == 1
+    assert tracker.status_counts() == {"failed": 2}
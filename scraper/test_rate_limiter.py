@@ -0,0 +1,115 @@
+"""Tests for the Gemini rate limiter and its token buckets"""
+
+import asyncio
+
+import pytest
+
+from quota_store import QuotaStore
+from rate_limiter import (
+    QuotaExhaustedError,
+    RateLimiter,
+    TokenBucket,
+    get_rate_limiter,
+    parse_rate_limits,
+)
+
+
+def test_full_bucket_admits_up_to_capacity():
+    bucket = TokenBucket(capacity=60, period=60)
+    bucket.updated = 0.0
+    assert bucket.time_until(60, now=0.0) == 0
+    bucket.consume(60, now=0.0)
+    assert bucket.used(now=0.0) == 60
+    # Refills at capacity/period = 1 token per second
+    assert bucket.time_until(1, now=0.0) == pytest.approx(1.0)
+    assert bucket.time_until(10, now=4.0) == pytest.approx(6.0)
+
+
+def test_refill_is_capped_at_capacity():
+    bucket = TokenBucket(capacity=10, period=10)
+    bucket.updated = 0.0
+    bucket.consume(10, now=0.0)
+    assert bucket.used(now=1000.0) == 0
+
+
+def test_requests_larger_than_the_bucket_wait_for_a_full_bucket():
+    bucket = TokenBucket(capacity=100, period=10)
+    bucket.updated = 0.0
+    bucket.consume(50, now=0.0)
+    assert bucket.time_until(500, now=0.0) == pytest.approx(5.0)
+
+
+def test_adjust_refunds_overestimates():
+    bucket = TokenBucket(capacity=100, period=60)
+    bucket.updated = 0.0
+    bucket.consume(80, now=0.0)
+    bucket.adjust(-50, now=0.0)
+    assert bucket.used(now=0.0) == pytest.approx(30)
+    bucket.adjust(-500, now=0.0)
+    assert bucket.used(now=0.0) == 0
+
+
+def test_set_capacity_and_restored_usage():
+    bucket = TokenBucket(capacity=100, period=100)
+    bucket.updated = 0.0
+    bucket.set_used(70, now=0.0)
+    assert bucket.used(now=0.0) == 70
+    bucket.set_capacity(20, now=0.0)
+    # Tokens above the new capacity are dropped; the period stays the same
+    assert bucket.used(now=0.0) == 0
+    bucket.consume(20, now=0.0)
+    assert bucket.time_until(10, now=0.0) == pytest.approx(50.0)
+
+
+def test_parse_rate_limits():
+    limits = parse_rate_limits(
+        "gemini-2.0-flash=2000/4000000/0, text-embedding-004=5/100/7"
+    )
+    assert limits["gemini-2.0-flash"].requests_per_minute == 2000
+    assert limits["gemini-2.0-flash"].requests_per_day == 10**9
+    assert limits["text-embedding-004"].tokens_per_minute == 100
+    assert limits["text-embedding-004"].requests_per_day == 7
+
+
+def test_limiters_are_shared_per_api_key():
+    assert get_rate_limiter("key-a") is get_rate_limiter("key-a")
+    assert get_rate_limiter("key-a") is not get_rate_limiter("key-b")
+
+
+def test_rate_limit_errors_cut_the_rate_and_successes_raise_it():
+    limiter = RateLimiter()
+    limiter.configure(parse_rate_limits("model=100/10000/0"), adaptive=True)
+
+    limiter.record_request("model", estimated_tokens=10, error=Exception("429 Slow"))
+    assert limiter.effective_limits("model") == pytest.approx((70, 7000))
+    for _ in range(70):
+        limiter.record_request("model", estimated_tokens=10)
+    # After a 429 the rate grows by at most INCREASE_PER_MINUTE per minute
+    assert 0.9 < limiter.rate_factors["model"] < 0.95
+
+
+def test_daily_quota_survives_restarts_and_raises_until_the_reset(tmp_path):
+    store = QuotaStore(str(tmp_path / "quota.sqlite"))
+    limits = parse_rate_limits("model=6000/1000000/2")
+
+    async def reserve(limiter):
+        await limiter.wait_for_rate_limit("model", estimated_tokens=1)
+
+    first = RateLimiter()
+    first.configure(limits, usage_store=store)
+    asyncio.run(reserve(first))
+
+    restarted = RateLimiter()
+    restarted.configure(limits, usage_store=store)
+    asyncio.run(reserve(restarted))
+
+    async def over_quota():
+        with pytest.raises(QuotaExhaustedError) as raised:
+            await reserve(restarted)
+        # The error is raised without holding the model's lock
+        assert not restarted._get_lock("model").locked()
+        return raised.value
+
+    error = asyncio.run(over_quota())
+    assert error.retry_at == pytest.approx(restarted.next_reset().timestamp() + 5)
+    store.close()
@@ -0,0 +1,69 @@
+"""Tests for failure classification and the retry policy"""
+
+import asyncio
+from datetime import datetime, timezone
+
+import httpx
+from google.api_core import exceptions as google_exceptions
+
+from extraction import EntityExtractionError
+from rate_limiter import QuotaExhaustedError
+from retry_queue import MAX_BACKOFF, RetryPolicy, classify_failure, parse_backoff
+
+
+def _status_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("GET", "https://example.org/PMC1/")
+    response = httpx.Response(status, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+def test_classify_rate_limits_before_the_stage():
+    assert classify_failure("fetch", _status_error(429)) == "rate_limited"
+    assert (
+        classify_failure("entities", google_exceptions.TooManyRequests("quota"))
+        == "rate_limited"
+    )
+    reset_at = datetime(2024, 1, 2, tzinfo=timezone.utc)
+    error = QuotaExhaustedError("gemini-2.0-flash", reset_at, reset_at.timestamp())
+    assert classify_failure("embeddings", error) == "rate_limited"
+
+
+def test_classify_timeouts():
+    assert classify_failure("fetch", httpx.ReadTimeout("slow")) == "timeout"
+    assert classify_failure("entities", asyncio.TimeoutError()) == "timeout"
+
+
+def test_classify_other_errors_by_stage():
+    assert classify_failure("fetch", _status_error(503)) == "fetch"
+    assert classify_failure("parse", ValueError("bad html")) == "parse"
+    assert classify_failure("entities", EntityExtractionError("malformed")) == "llm"
+    assert classify_failure("embeddings", RuntimeError("zero vectors")) == "llm"
+    assert classify_failure("persist", OSError("disk full")) == "store"
+
+
+def test_delay_doubles_per_attempt_up_to_the_cap():
+    policy = RetryPolicy(max_attempts=5, backoff={"timeout": 30})
+    assert policy.delay("timeout", 1) == 30
+    assert policy.delay("timeout", 2) == 60
+    assert policy.delay("timeout", 4) == 240
+    assert policy.delay("parse", 50) == MAX_BACKOFF
+
+
+def test_exhausted_after_max_attempts():
+    policy = RetryPolicy(max_attempts=3)
+    assert not policy.is_exhausted(2)
+    assert policy.is_exhausted(3)
+    assert RetryPolicy(max_attempts=0).max_attempts == 1
+
+
+def test_parse_backoff():
+    assert parse_backoff("timeout=30, rate_limited=3600,") == {
+        "timeout": 30.0,
+        "rate_limited": 3600.0,
+    }
+    try:
+        parse_backoff("network=5")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("unknown failure class accepted")
@@ -0,0 +1,76 @@
+"""Tests for the vectorized similarity search"""
+
+import numpy as np
+import pytest
+
+from search import VectorSearch
+from vector_store import VectorStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = VectorStore(str(tmp_path / "vectors"), dimensions=8)
+    yield store
+    store.close()
+
+
+def _fill(store, count, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, 8))
+    store.append(
+        [f"e{i}" for i in range(count)],
+        [f"p{i // 4}" for i in range(count)],
+        ["abstract" if i % 2 else f"fullText#{i}" for i in range(count)],
+        vectors,
+    )
+    return vectors
+
+
+def _brute_force(vectors, query, rows):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normalized[rows] @ (query / np.linalg.norm(query))
+    return [f"e{rows[i]}" for i in np.argsort(-scores)]
+
+
+def test_exact_search_ranks_by_cosine_similarity(store):
+    vectors = _fill(store, 200)
+    query = vectors[17] + 0.01
+
+    results = VectorSearch(store).search(query, k=5)
+
+    assert [result["embeddingId"] for result in results] == _brute_force(
+        vectors, query, np.arange(200)
+    )[:5]
+    assert results[0]["publicationId"] == "p4"
+    assert results[0]["score"] == pytest.approx(1.0, abs=1e-3)
+
+
+def test_sections_tombstones_and_zero_vectors_are_filtered(store):
+    vectors = _fill(store, 40)
+    store.append(["zero"], ["p99"], ["abstract"], np.zeros((1, 8)))
+    store.tombstone(["e1"])
+    search = VectorSearch(store)
+
+    results = search.search(vectors[1], k=40, section="abstract")
+
+    found = {result["embeddingId"] for result in results}
+    assert found == {f"e{i}" for i in range(3, 40, 2)}
+    fulltext = search.search(vectors[0], k=3, section="fullText")
+    assert all(result["section"].startswith("fullText#") for result in fulltext)
+
+
+def test_ivf_search_finds_the_nearest_vectors(store):
+    vectors = _fill(store, 500)
+    search = VectorSearch(store)
+
+    hits = search.search_batch(vectors[:20], k=1, mode="ivf", n_probe=4)
+
+    recall = np.mean([hit[0]["embeddingId"] == f"e{i}" for i, hit in enumerate(hits)])
+    assert recall >= 0.9
+    assert not search.index_stale()
+
+
+def test_empty_store_and_zero_queries(store):
+    search = VectorSearch(store)
+    assert search.search(np.ones(8), mode="ivf") == []
+    with pytest.raises(ValueError):
+        search.search(np.zeros(8))
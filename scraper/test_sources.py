@@ -0,0 +1,77 @@
+"""Tests for the streaming paper-list readers"""
+
+import io
+import json
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from sources import SourceRecord, count_sources, iter_sources
+
+CSV = (
+    "Title,Link\n"
+    "First paper,https://example.org/1\n"
+    "\n"
+    '"Second, with a\nline break", https://example.org/2 \n'
+    "Third paper,https://example.org/3\n"
+)
+
+
+def _write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_csv_rows_are_numbered_like_the_original_reader(tmp_path):
+    path = _write(tmp_path, "papers.csv", CSV)
+
+    records = list(iter_sources(path))
+
+    assert records == [
+        SourceRecord(0, "First paper", "https://example.org/1"),
+        SourceRecord(1, "Second, with a\nline break", "https://example.org/2"),
+        SourceRecord(2, "Third paper", "https://example.org/3"),
+    ]
+    assert count_sources(path) == 3
+
+
+def test_resuming_skips_to_the_start_row(tmp_path):
+    path = _write(tmp_path, "papers.csv", CSV)
+
+    assert [record.row_index for record in iter_sources(path, start_row=1)] == [1, 2]
+    assert list(iter_sources(path, start_row=5)) == []
+
+
+def test_jsonl_accepts_key_variants(tmp_path):
+    lines = [
+        {"title": "First paper", "url": "https://example.org/1"},
+        {"Title": "Second paper", "Link": "https://example.org/2"},
+        {"other": "no title or link"},
+    ]
+    text = "\n".join(json.dumps(line) for line in lines) + "\n\n"
+    path = _write(tmp_path, "papers.jsonl", text)
+
+    assert list(iter_sources(path, start_row=1)) == [
+        SourceRecord(1, "Second paper", "https://example.org/2"),
+        SourceRecord(2, "", ""),
+    ]
+    assert count_sources(path) == 3
+
+
+def test_format_override_and_unknown_formats(tmp_path):
+    path = _write(tmp_path, "papers.txt", '{"title": "T", "link": "L"}\n')
+
+    assert list(iter_sources(path, fmt="jsonl")) == [SourceRecord(0, "T", "L")]
+    with pytest.raises(ValueError):
+        list(iter_sources(path, fmt="xml"))
+
+
+def test_stdin_format_is_detected_from_its_content(monkeypatch):
+    data = b'{"title": "T", "link": "L"}\n'
+    stdin = SimpleNamespace(buffer=io.BufferedReader(io.BytesIO(data)))
+    monkeypatch.setattr(sys, "stdin", stdin)
+
+    assert list(iter_sources("-")) == [SourceRecord(0, "T", "L")]
+    assert count_sources("-") is None
@@ -0,0 +1,113 @@
+"""Tests for the local storage backends"""
+
+import json
+import sqlite3
+
+import pytest
+
+from storage import JsonFileStorage, SQLiteStorage
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def storage(request, tmp_path):
+    if request.param == "json":
+        storage = JsonFileStorage(str(tmp_path / "publications.json"))
+    else:
+        storage = SQLiteStorage(str(tmp_path / "publications.sqlite"), dimensions=4)
+    yield storage
+    storage.close()
+
+
+def _publication(publication_id, title="A paper"):
+    return {"id": publication_id, "title": title, "processingStatus": "processing"}
+
+
+def _embedding(embedding_id, publication_id, value):
+    return {
+        "id": embedding_id,
+        "publicationId": publication_id,
+        "section": "abstract",
+        "embedding": [float(value)] * 4,
+    }
+
+
+def test_publications_are_upserted_by_id(storage):
+    storage.insert_publication(_publication("p1"))
+    storage.insert_publication(_publication("p2"))
+    storage.insert_publication(_publication("p1", title="Revised"))
+
+    titles = {pub["id"]: pub["title"] for pub in storage.iter_publications()}
+    assert titles == {"p1": "Revised", "p2": "A paper"}
+
+
+def test_update_status(storage):
+    storage.insert_publication(_publication("p1"))
+
+    assert storage.update_status("p1", "completed", "2024-01-01T00:00:00")
+    assert not storage.update_status("missing", "completed", "2024-01-01T00:00:00")
+    (pub,) = storage.iter_publications()
+    assert pub["processingStatus"] == "completed"
+    assert pub["updatedAt"] == "2024-01-01T00:00:00"
+
+
+def test_embeddings_round_trip_and_delete(storage):
+    storage.insert_embeddings([_embedding("e1", "p1", 1), _embedding("e2", "p2", 2)])
+
+    stored = {record["id"]: record for record in storage.iter_embeddings()}
+    assert stored["e2"]["embedding"] == [2.0] * 4
+    assert storage.delete_embeddings("p1") == 1
+    assert [record["id"] for record in storage.iter_embeddings()] == ["e2"]
+
+
+def test_export_json_matches_the_original_format(storage, tmp_path):
+    storage.insert_publication(_publication("p1"))
+    storage.insert_embeddings([_embedding("e1", "p1", 1)])
+    path = tmp_path / "export.json"
+
+    storage.export_json(str(path))
+
+    data = json.loads(path.read_text())
+    assert [pub["id"] for pub in data["publications"]] == ["p1"]
+    assert data["embeddings"][0]["embedding"] == [1.0] * 4
+
+
+def test_sqlite_imports_a_json_store(tmp_path):
+    source = JsonFileStorage(str(tmp_path / "publications.json"))
+    source.insert_publication(_publication("p1"))
+    source.insert_embeddings([_embedding("e1", "p1", 3)])
+    storage = SQLiteStorage(str(tmp_path / "publications.sqlite"), dimensions=4)
+
+    storage.import_json(source.path)
+
+    assert storage.get_publication("p1")["title"] == "A paper"
+    assert storage.vectors.get("e1").tolist() == [3.0] * 4
+    storage.close()
+
+
+def test_corrupt_json_store_is_moved_aside(tmp_path):
+    path = tmp_path / "publications.json"
+    path.write_text('{"publications": [{"id": "p1"')
+    storage = JsonFileStorage(str(path))
+
+    storage.insert_publication(_publication("p2"))
+
+    (corrupt,) = tmp_path.glob("publications.json.corrupt-*")
+    assert corrupt.read_text() == '{"publications": [{"id": "p1"'
+    assert [pub["id"] for pub in storage.iter_publications()] == ["p2"]
+
+
+def test_failed_embedding_rows_leave_no_live_vectors(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "publications.sqlite"), dimensions=4)
+    storage.insert_embeddings([_embedding("e1", "p1", 1)])
+    storage.conn.execute(
+        "CREATE TRIGGER fail_e2 BEFORE INSERT ON embeddings WHEN NEW.id = 'e2' "
+        "BEGIN SELECT RAISE(ABORT, 'disk full'); END"
+    )
+
+    with pytest.raises(sqlite3.IntegrityError):
+        storage.insert_embeddings([_embedding("e2", "p1", 2)])
+
+    # Search reads the vector store, so the orphaned vector must not be live
+    assert storage.vectors.get("e2") is None
+    assert list(storage.vectors.live_rows()) == [0]
+    storage.close()
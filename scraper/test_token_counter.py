@@ -0,0 +1,70 @@
+"""Tests for token counting and prompt truncation"""
+
+import asyncio
+from types import SimpleNamespace
+
+from rate_limiter import RateLimiter
+from token_counter import COUNT_TOKENS_MODEL, TokenCounter, usage_tokens
+
+
+class FakeModel:
+    """count_tokens_async that counts whitespace-separated words"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def count_tokens_async(self, text):
+        self.calls += 1
+        return SimpleNamespace(total_tokens=len(text.split()))
+
+
+def test_markup_is_not_undercounted():
+    counter = TokenCounter()
+    text = "word " * 100
+    markup = '<div class="a"><span>' * 25
+    assert counter.estimate(markup) > counter.estimate(text) / 2
+    assert counter.estimate("") == 0
+
+
+def test_remembered_counts_are_exact_and_calibrate_the_estimate():
+    counter = TokenCounter()
+    text = "word " * 100
+    other = "other " * 100
+    before = counter.estimate(other)
+
+    counter.remember(text, 200)
+
+    assert counter.estimate(text) == 200
+    assert counter.estimate(other) > before
+
+
+def test_count_is_memoized_and_goes_through_the_limiter():
+    limiter = RateLimiter()
+    model = FakeModel()
+    text = "word " * 100
+
+    async def count_twice():
+        return [await limiter.token_counter.count(text, model) for _ in range(2)]
+
+    assert asyncio.run(count_twice()) == [100, 100]
+    assert model.calls == 1
+    assert limiter.recorded_requests[COUNT_TOKENS_MODEL] == 1
+    assert limiter.token_counter.get_stats()["exact_counts"] == 1
+
+
+def test_truncate_fits_the_budget():
+    counter = TokenCounter()
+    model = FakeModel()
+    text = " ".join(f"word{i}" for i in range(1000))
+
+    cut = asyncio.run(counter.truncate(text, 300, model))
+
+    assert len(cut.split()) <= 300
+    assert text.startswith(cut)
+    assert asyncio.run(counter.truncate("short text", 300, model)) == "short text"
+
+
+def test_usage_tokens():
+    usage = SimpleNamespace(prompt_token_count=120, candidates_token_count=30)
+    assert usage_tokens(SimpleNamespace(usage_metadata=usage)) == (120, 30)
+    assert usage_tokens(SimpleNamespace()) is None
@@ -0,0 +1,82 @@
+"""Tests for the memory-mapped vector store"""
+
+import os
+
+import numpy as np
+import pytest
+
+from vector_store import VectorStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = VectorStore(str(tmp_path / "vectors"), dimensions=4)
+    yield store
+    store.close()
+
+
+def _vectors(values):
+    return np.array([[value] * 4 for value in values], dtype=np.float32)
+
+
+def test_tombstoned_rows_are_not_live(store):
+    store.append(
+        ["a", "b", "c"], ["p1", "p1", "p2"], ["abstract"] * 3, _vectors([1, 2, 3])
+    )
+
+    assert store.tombstone(["b"]) == 1
+    assert store.get("b") is None
+    assert list(store.live_rows()) == [0, 2]
+    assert store.tombstone(publication_id="p2") == 1
+    assert list(store.live_rows()) == [0]
+    assert store.tombstone_count() == 2
+
+
+def test_compaction_keeps_live_vectors_and_renumbers_rows(store):
+    store.append(
+        ["a", "b", "c", "d"],
+        ["p1", "p2", "p1", "p2"],
+        ["abstract", "abstract", "methods", "fullText#0"],
+        _vectors([1, 2, 3, 4]),
+    )
+    store.tombstone(publication_id="p1")
+    old_path = store.vector_path
+
+    assert store.compact() == 2
+    assert store.count == 2
+    assert store.tombstone_count() == 0
+    assert not os.path.exists(old_path)
+    assert os.path.getsize(store.vector_path) == 2 * 4 * 4
+    assert store.row_metadata([0, 1]) == [
+        {"embeddingId": "b", "publicationId": "p2", "section": "abstract"},
+        {"embeddingId": "d", "publicationId": "p2", "section": "fullText#0"},
+    ]
+    np.testing.assert_array_equal(store.get("d"), [4, 4, 4, 4])
+    assert list(store.live_rows("fullText")) == [1]
+    assert store.compact() == 0
+
+
+def test_reopened_store_after_compaction(store, tmp_path):
+    store.append(["a", "b"], ["p1", "p2"], ["abstract"] * 2, _vectors([1, 2]))
+    store.tombstone(["a"])
+    store.compact()
+    store.close()
+
+    reopened = VectorStore(str(tmp_path / "vectors"), dimensions=4)
+    try:
+        assert reopened.count == 1
+        np.testing.assert_array_equal(reopened.get("b"), [2, 2, 2, 2])
+    finally:
+        reopened.close()
+
+
+def test_failed_append_leaves_no_vector_bytes(store):
+    store.append(["a"], ["p1"], ["abstract"], _vectors([1]))
+    with pytest.raises(Exception):
+        # Duplicate embedding id: the rows are not committed
+        store.append(["b", "a"], ["p1", "p1"], ["methods"] * 2, _vectors([2, 3]))
+
+    assert store.count == 1
+    assert os.path.getsize(store.vector_path) == 4 * 4
+    store.append(["c"], ["p1"], ["results"], _vectors([5]))
+    np.testing.assert_array_equal(store.get("c"), [5, 5, 5, 5])
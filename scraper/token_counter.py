@@ -0,0 +1,189 @@
+"""
+Token counts for rate limiting and prompt budgets
+
+Exact counts come from the model's count_tokens endpoint (through the rate
+limiter, which keeps them under their own COUNT_TOKENS_MODEL quota, when the
+counter belongs to one). Everything else
+uses a local estimate that splits text into the pieces a subword tokenizer
+produces (words, digits, punctuation, whitespace runs), so markup-heavy text
+is not undercounted the way a plain characters/4 ratio is. The estimate is
+scaled by a factor calibrated against every exact count and every
+usage_metadata returned with a response. Counts are memoized by text hash.
+"""
+
+import hashlib
+import logging
+import re
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# Words, single digits, whitespace runs and runs of other symbols
+_PIECES = re.compile(r"[^\W\d_]+|\d|\s{2,}|[^\w\s]+|_+")
+
+# Weight of a new observation in the calibration factor
+_CALIBRATION_WEIGHT = 0.2
+_MIN_FACTOR, _MAX_FACTOR = 0.25, 4.0
+
+# Texts shorter than this are cheaper to estimate than to hash
+_MEMO_MIN_CHARS = 256
+
+# Rate limiter key of count_tokens requests
+COUNT_TOKENS_MODEL = "count_tokens"
+
+
+def _raw_estimate(text: str) -> int:
+    """Uncalibrated subword estimate of a text"""
+    tokens = 0
+    for piece in _PIECES.findall(text):
+        if piece[0].isalpha():
+            if piece.isascii():
+                # Common words are one token, long terms split every ~7 chars
+                tokens += 1 + len(piece) // 7
+            else:
+                tokens += 1 + len(piece) // 2
+        elif piece[0].isspace() or piece[0].isdigit():
+            tokens += 1
+        else:
+            # Markup such as '">' or '</' merges about two symbols per token
+            tokens += (len(piece) + 1) // 2
+    return max(1, tokens)
+
+
+def usage_tokens(response: Any) -> Optional[Tuple[int, int]]:
+    """(prompt tokens, output tokens) from a response's usage_metadata, if any"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+    prompt = getattr(usage, "prompt_token_count", 0) or 0
+    output = getattr(usage, "candidates_token_count", 0) or 0
+    if not prompt and not output:
+        return None
+    return prompt, output
+
+
+class TokenCounter:
+    """
+    Memoized token counter with a self-calibrating local estimator
+
+    Args:
+        max_entries: Texts whose counts are memoized (least recently used
+            ones are dropped first)
+        limiter: RateLimiter that count_tokens requests are sent through
+    """
+
+    def __init__(self, max_entries: int = 10000, limiter: Any = None):
+        self.max_entries = max_entries
+        self.limiter = limiter
+        self.logger = logging.getLogger(__name__)
+        self.factor = 1.0
+        self.exact_counts = 0
+        self.count_failures = 0
+        # digest -> [raw estimate, exact count or None]
+        self._memo: "OrderedDict[str, list]" = OrderedDict()
+
+    @staticmethod
+    def _digest(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _entry(self, text: str) -> list:
+        digest = self._digest(text)
+        entry = self._memo.get(digest)
+        if entry is None:
+            entry = [_raw_estimate(text), None]
+            self._memo[digest] = entry
+            if len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+        else:
+            self._memo.move_to_end(digest)
+        return entry
+
+    def estimate(self, text: str) -> int:
+        """Token count of text: exact if it was counted before, else estimated"""
+        if not text:
+            return 0
+        if len(text) < _MEMO_MIN_CHARS:
+            return max(1, round(_raw_estimate(text) * self.factor))
+        raw, exact = self._entry(text)
+        if exact is not None:
+            return exact
+        return max(1, round(raw * self.factor))
+
+    def calibrate(self, text: str, tokens: int) -> None:
+        """Adjust the estimator with a known token count of text"""
+        if not text or tokens <= 0:
+            return
+        ratio = tokens / _raw_estimate(text)
+        self.factor += _CALIBRATION_WEIGHT * (ratio - self.factor)
+        self.factor = min(_MAX_FACTOR, max(_MIN_FACTOR, self.factor))
+
+    def remember(self, text: str, tokens: int) -> None:
+        """Store the exact count of text and calibrate the estimator with it"""
+        if not text or tokens <= 0:
+            return
+        self._entry(text)[1] = tokens
+        self.calibrate(text, tokens)
+
+    async def count(self, text: str, model: Any = None) -> int:
+        """
+        Exact token count from model.count_tokens_async, or the estimate
+
+        Args:
+            text: Text to count
+            model: Generative model with count_tokens_async (optional)
+        """
+        if not text:
+            return 0
+        if len(text) >= _MEMO_MIN_CHARS:
+            exact = self._entry(text)[1]
+            if exact is not None:
+                return exact
+        if model is None or not hasattr(model, "count_tokens_async"):
+            return self.estimate(text)
+
+        try:
+            if self.limiter is not None:
+                response = await self.limiter.call(
+                    COUNT_TOKENS_MODEL,
+                    lambda: model.count_tokens_async(text),
+                    estimated_tokens=0,
+                )
+            else:
+                response = await model.count_tokens_async(text)
+            tokens = int(response.total_tokens)
+        except Exception as e:
+            self.count_failures += 1
+            self.logger.debug(f"count_tokens failed, using the estimate: {e}")
+            return self.estimate(text)
+
+        self.exact_counts += 1
+        self.remember(text, tokens)
+        return tokens
+
+    async def truncate(self, text: str, max_tokens: int, model: Any = None) -> str:
+        """
+        Cut text to at most max_tokens tokens (on whitespace where possible)
+
+        The cut position is derived from the text's own characters-per-token
+        ratio and refined until the counted length fits.
+        """
+        tokens = await self.count(text, model)
+        for _ in range(4):
+            if tokens <= max_tokens:
+                return text
+            # Aim slightly below the budget so one refinement usually suffices
+            keep = int(len(text) * max_tokens / tokens * 0.97)
+            cut = text.rfind(" ", keep // 2, keep)
+            text = text[: cut if cut > 0 else keep]
+            tokens = await self.count(text, model)
+        if tokens > max_tokens:
+            # Estimates disagree with the counts; fall back to a proportional cut
+            text = text[: int(len(text) * max_tokens / tokens)]
+        return text
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "calibration_factor": round(self.factor, 3),
+            "exact_counts": self.exact_counts,
+            "count_failures": self.count_failures,
+            "memoized": len(self._memo),
+        }
@@ -0,0 +1,304 @@
+"""
+Memory-mapped float32 store for section embeddings
+
+Vectors live in one contiguous row-major float32 file that is memory-mapped
+with NumPy, so opening a store with 100k+ vectors only maps the file instead
+of parsing it. A SQLite side table maps every row to its embedding id,
+publication id and section, and marks deleted rows as tombstones until the
+store is compacted.
+
+Layout of a store directory:
+    vectors.<generation>.f32  float32 matrix, one row per embedding
+    rows.sqlite               row -> (embedding id, publicationId, section)
+
+Compaction writes the live rows to the next generation's file and switches
+to it in a single SQLite transaction, so a crash leaves either the old or
+the new generation intact.
+"""
+
+import logging
+import os
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+DEFAULT_DIMENSIONS = 768
+
+# Rows copied per step while compacting
+_COMPACT_CHUNK = 8192
+
+
+class VectorStore:
+    """Append-only float32 vector matrix with tombstones and compaction"""
+
+    def __init__(self, directory: str, dimensions: int = DEFAULT_DIMENSIONS):
+        self.directory = directory
+        self.logger = logging.getLogger(__name__)
+        os.makedirs(directory, exist_ok=True)
+
+        self.conn = sqlite3.connect(os.path.join(directory, "rows.sqlite"))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS rows (
+                    row INTEGER PRIMARY KEY,
+                    embedding_id TEXT NOT NULL UNIQUE,
+                    publication_id TEXT NOT NULL,
+                    section TEXT NOT NULL,
+                    deleted INTEGER NOT NULL DEFAULT 0
+                )
+                """)
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_rows_publication ON rows(publication_id)"
+            )
+            self.conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('dimensions', ?)",
+                (dimensions,),
+            )
+            self.conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0)"
+            )
+
+        self.dimensions = self._meta("dimensions")
+        if self.dimensions != dimensions:
+            raise ValueError(
+                f"Vector store {directory} holds {self.dimensions}-dimensional vectors, not {dimensions}"
+            )
+        self.generation = self._meta("generation")
+        self.count = self.conn.execute(
+            "SELECT COALESCE(MAX(row) + 1, 0) FROM rows"
+        ).fetchone()[0]
+        self._matrix: Optional[np.ndarray] = None
+        # Bumped on every change so readers can invalidate derived data
+        self.version = 0
+        self._recover()
+
+    def _meta(self, key: str) -> int:
+        return self.conn.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()[0]
+
+    def _vector_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"vectors.{generation}.f32")
+
+    @property
+    def vector_path(self) -> str:
+        return self._vector_path(self.generation)
+
+    def _recover(self) -> None:
+        """Drop rows written after the last committed append and stale generations"""
+        row_bytes = self.dimensions * 4
+        path = self.vector_path
+        if not os.path.exists(path):
+            open(path, "wb").close()
+
+        size = os.path.getsize(path)
+        if size > self.count * row_bytes:
+            self.logger.warning(
+                f"Truncating {size - self.count * row_bytes} uncommitted bytes from {path}"
+            )
+            with open(path, "r+b") as f:
+                f.truncate(self.count * row_bytes)
+        elif size < self.count * row_bytes:
+            raise RuntimeError(
+                f"Vector file {path} is shorter than its row table ({self.count} rows)"
+            )
+
+        for name in os.listdir(self.directory):
+            if (
+                name.startswith("vectors.")
+                and name.endswith((".f32", ".f32.tmp"))
+                and name != os.path.basename(path)
+            ):
+                os.remove(os.path.join(self.directory, name))
+
+    def append(
+        self,
+        embedding_ids: Sequence[str],
+        publication_ids: Sequence[str],
+        sections: Sequence[str],
+        vectors,
+    ) -> List[int]:
+        """
+        Append vectors and their row metadata; returns the new row numbers
+
+        Args:
+            embedding_ids: Unique id of each embedding record
+            publication_ids: Publication each vector belongs to
+            sections: Section name of each vector
+            vectors: Array-like of shape (n, dimensions)
+        """
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimensions)
+        if not (
+            len(embedding_ids) == len(publication_ids) == len(sections) == len(matrix)
+        ):
+            raise ValueError("Vector and metadata lengths differ")
+        if not len(matrix):
+            return []
+
+        # Vectors go to disk before their rows are committed; on a crash the
+        # uncommitted tail is truncated by _recover(), on an error right here
+        rows = list(range(self.count, self.count + len(matrix)))
+        with open(self.vector_path, "ab") as f:
+            try:
+                f.write(np.ascontiguousarray(matrix).tobytes())
+                f.flush()
+                with self.conn:
+                    self.conn.executemany(
+                        "INSERT INTO rows (row, embedding_id, publication_id, section) VALUES (?, ?, ?, ?)",
+                        zip(rows, embedding_ids, publication_ids, sections),
+                    )
+            except BaseException:
+                # Later rows must start right after the committed ones
+                f.truncate(self.count * self.dimensions * 4)
+                raise
+        self.count += len(rows)
+        self._matrix = None
+        self.version += 1
+        return rows
+
+    def matrix(self) -> np.ndarray:
+        """Read-only memory map of all rows (including tombstoned ones)"""
+        if self._matrix is None:
+            if self.count == 0:
+                self._matrix = np.empty((0, self.dimensions), dtype=np.float32)
+            else:
+                self._matrix = np.memmap(
+                    self.vector_path,
+                    dtype=np.float32,
+                    mode="r",
+                    shape=(self.count, self.dimensions),
+                )
+        return self._matrix
+
+    def live_rows(self, section: Optional[str] = None) -> np.ndarray:
+        """
+        Row numbers that are not tombstoned, optionally for one section
+
+        A section also matches its numbered passages, e.g. "fullText" selects
+        "fullText#0", "fullText#1", ...
+        """
+        if section is None:
+            cursor = self.conn.execute(
+                "SELECT row FROM rows WHERE deleted = 0 ORDER BY row"
+            )
+        else:
+            cursor = self.conn.execute(
+                "SELECT row FROM rows WHERE deleted = 0 AND (section = ? OR section GLOB ?) ORDER BY row",
+                (section, f"{section}#*"),
+            )
+        return np.fromiter((row for (row,) in cursor), dtype=np.int64)
+
+    def row_metadata(self, rows: Iterable[int]) -> List[Dict]:
+        """embeddingId/publicationId/section of the given rows, in the same order"""
+        rows = [int(row) for row in rows]
+        found: Dict[int, Dict] = {}
+        for start in range(0, len(rows), 500):
+            chunk = rows[start : start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor = self.conn.execute(
+                f"SELECT row, embedding_id, publication_id, section FROM rows WHERE row IN ({placeholders})",
+                chunk,
+            )
+            for row, embedding_id, publication_id, section in cursor:
+                found[row] = {
+                    "embeddingId": embedding_id,
+                    "publicationId": publication_id,
+                    "section": section,
+                }
+        return [found[row] for row in rows]
+
+    def get(self, embedding_id: str) -> Optional[np.ndarray]:
+        """Vector of a live embedding record, or None"""
+        result = self.conn.execute(
+            "SELECT row FROM rows WHERE embedding_id = ? AND deleted = 0",
+            (embedding_id,),
+        ).fetchone()
+        if result is None:
+            return None
+        return np.array(self.matrix()[result[0]])
+
+    def tombstone(
+        self,
+        embedding_ids: Sequence[str] = (),
+        publication_id: Optional[str] = None,
+    ) -> int:
+        """Mark embeddings (by id and/or publication) deleted; returns rows affected"""
+        changed = 0
+        with self.conn:
+            if embedding_ids:
+                changed += self.conn.executemany(
+                    "UPDATE rows SET deleted = 1 WHERE embedding_id = ? AND deleted = 0",
+                    [(embedding_id,) for embedding_id in embedding_ids],
+                ).rowcount
+            if publication_id is not None:
+                changed += self.conn.execute(
+                    "UPDATE rows SET deleted = 1 WHERE publication_id = ? AND deleted = 0",
+                    (publication_id,),
+                ).rowcount
+        self.version += 1
+        return changed
+
+    def tombstone_count(self) -> int:
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM rows WHERE deleted = 1"
+        ).fetchone()[0]
+
+    def compact(self) -> int:
+        """Rewrite the store without tombstoned rows; returns rows removed"""
+        removed = self.tombstone_count()
+        if removed == 0:
+            return 0
+
+        live = self.live_rows()
+        source = self.matrix()
+        next_generation = self.generation + 1
+        target_path = self._vector_path(next_generation)
+        tmp_path = f"{target_path}.tmp"
+
+        with open(tmp_path, "wb") as f:
+            for start in range(0, len(live), _COMPACT_CHUNK):
+                f.write(
+                    np.ascontiguousarray(
+                        source[live[start : start + _COMPACT_CHUNK]]
+                    ).tobytes()
+                )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, target_path)
+
+        # Renumber rows and switch generations in one transaction
+        kept = self.conn.execute(
+            "SELECT embedding_id, publication_id, section FROM rows WHERE deleted = 0 ORDER BY row"
+        ).fetchall()
+        with self.conn:
+            self.conn.execute("DELETE FROM rows")
+            self.conn.executemany(
+                "INSERT INTO rows (row, embedding_id, publication_id, section) VALUES (?, ?, ?, ?)",
+                [(row, *record) for row, record in enumerate(kept)],
+            )
+            self.conn.execute(
+                "UPDATE meta SET value = ? WHERE key = 'generation'", (next_generation,)
+            )
+
+        old_path = self.vector_path
+        self._matrix = None
+        del source
+        self.generation = next_generation
+        self.count = len(kept)
+        self.version += 1
+        os.remove(old_path)
+
+        self.logger.info(
+            f"Compacted vector store: removed {removed}, {self.count} rows remain"
+        )
+        return removed
+
+    def close(self) -> None:
+        self._matrix = None
+        self.conn.close()